@@ -1,16 +1,22 @@
 # -*- coding: utf-8 -*-
 
-import io, base64, re, json, random, zipfile, uuid, tempfile, os
+import io, base64, re, json, random, zipfile, uuid, os, sys, hashlib, threading, sqlite3, mmap, time, math
+import subprocess, socket, multiprocessing.connection, bisect, asyncio, concurrent.futures
+from array import array
+from collections import deque, OrderedDict, Counter
 from pathlib import Path
 from datetime import datetime, date, timedelta
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 from PyPDF2 import PdfReader
 import streamlit.components.v1 as components 
 import unicodedata
 
+import extraction
+
 
 # ====== Paquetes de LLM para la sección de 'Evaluación de CVs' ======
 # Se importan de forma segura; si no están instalados, la app no se rompe.
@@ -23,8 +29,8 @@ except Exception:
 try:
     from langchain_core.output_parsers import JsonOutputParser
     from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
-    from langchain_community.document_loaders import PyPDFLoader
     from langchain_openai import ChatOpenAI, AzureChatOpenAI
+    import httpx, openai
     _LC_AVAILABLE = True
 except Exception:
     _LC_AVAILABLE = False
@@ -250,6 +256,7 @@ WORKFLOWS_FILE = DATA_DIR/"workflows.json"
 ROLES_FILE = DATA_DIR / "roles.json"
 TASKS_FILE = DATA_DIR / "tasks.json"
 POSITIONS_FILE = DATA_DIR / "positions.json" # (Req 3)
+CANDIDATES_FILE = DATA_DIR / "candidates.json"
 # === BEGIN NUEVO: transcripciones (constantes/paths) ===
 TRANSCRIPTS_FILE = DATA_DIR / "transcripts.json"
 TRANSCRIPTS_DIR  = DATA_DIR / "transcripts"
@@ -268,16 +275,13 @@ DEFAULT_TASKS = [
 # (Req 2/3) Datos por defecto para Puestos (con JD)
 DEFAULT_POSITIONS = [
     {"ID":"10,645,194","Puesto":"Desarrollador/a Backend (Python)", "JD": "Buscamos un Desarrollador Backend con experiencia en Python, Django y/o Flask. Responsable de diseñar, implementar y mantener APIs RESTful...",
-     "Días Abierto":3, "Leads":1800,"Nuevos":115,"Recruiter Screen":35,"HM Screen":7,
-     "Entrevista Telefónica":14,"Entrevista Presencial":15,"Ubicación":"Lima, Perú",
+     "Días Abierto":3, "Ubicación":"Lima, Perú",
      "Hiring Manager":"Rivers Brykson","Estado":"Abierto","Fecha Inicio": (date.today() - timedelta(days=3)).isoformat()},
     {"ID":"10,376,415","Puesto":"VP de Marketing", "JD": "Liderar la estrategia de marketing digital y branding. Definir KPIs, gestionar el presupuesto del área y liderar equipos multidisciplinarios...",
-     "Días Abierto":28, "Leads":8100,"Nuevos":1,"Recruiter Screen":15,"HM Screen":35,
-     "Entrevista Telefónica":5,"Entrevista Presencial":7,"Ubicación":"Santiago, Chile",
+     "Días Abierto":28, "Ubicación":"Santiago, Chile",
      "Hiring Manager":"Angela Cruz","Estado":"Abierto","Fecha Inicio": (date.today() - timedelta(days=28)).isoformat()},
     {"ID":"10,376,646","Puesto":"Planner de Demanda", "JD": "Analizar la demanda histórica y tendencias del mercado para generar el forecast de ventas. Colaboración con Ventas y Producción...",
-     "Días Abierto":28, "Leads":2300,"Nuevos":26,"Recruiter Screen":3,"HM Screen":8,
-     "Entrevista Telefónica":6,"Entrevista Presencial":3,"Ubicación":"Ciudad de México, MX",
+     "Días Abierto":28, "Ubicación":"Ciudad de México, MX",
      "Hiring Manager":"Rivers Brykson","Estado":"Abierto","Fecha Inicio": (date.today() - timedelta(days=28)).isoformat()}
 ]
 
@@ -296,13 +300,857 @@ def save_roles(roles: list):
     custom_only = [r for r in roles_clean if r not in DEFAULT_ROLES]
     ROLES_FILE.write_text(json.dumps(custom_only, ensure_ascii=False, indent=2), encoding="utf-8")
 
+# ===== Estado de proceso (compartido por todas las sesiones) =====
+# Streamlit re-ejecuta el script en cada rerun: lo que deba sobrevivir y ser
+# único por proceso (stores, conexión SQLite, colecciones cargadas) vive aquí.
+@st.cache_resource(show_spinner=False)
+def _process_state() -> dict:
+    return {
+        "stores": {}, "stores_lock": threading.Lock(),
+        "sql_conn": None, "sql_lock": threading.RLock(),
+        "collections": {}, "collections_lock": threading.RLock(),
+        "caches": {}, "caches_lock": threading.Lock(),
+        "jd_profiles": OrderedDict(), "jd_profiles_lock": threading.Lock(),
+        "skill_matchers": OrderedDict(), "skill_matchers_lock": threading.Lock(),
+        "search_index": None,
+        "analytics": None, "analytics_lock": threading.Lock(), "events_lock": threading.Lock(),
+        "llm_clients": {}, "llm_http": None, "llm_ahttp": None, "llm_loop": None,
+        "llm_lock": threading.Lock(), "llm_stats": Counter(), "llm_limiters": {},
+        "extract_pool": None, "extract_pool_lock": threading.Lock(),
+        "position_counts_lock": threading.RLock(),
+    }
+
+# ===== Blobs (CVs / transcripciones) direccionados por SHA-256 =====
+# Los registros guardan solo el hash; el binario vive una sola vez en disco.
+BLOBS_DIR = DATA_DIR / "blobs"
+BLOBS_DIR.mkdir(exist_ok=True)
+
+def _blob_path(sha: str) -> Path:
+    return BLOBS_DIR / sha[:2] / sha
+
+def put_blob(data: bytes) -> str:
+    """Guarda el binario (si no existe ya) y retorna su SHA-256."""
+    sha = hashlib.sha256(data).hexdigest()
+    path = _blob_path(sha)
+    if not path.exists():
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_name(f"{sha}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    return sha
+
+def read_blob(sha: str):
+    """Binario mapeado en memoria (solo lectura); b"" si no existe."""
+    try:
+        path = _blob_path(sha or "")
+        if not sha or not path.exists() or path.stat().st_size == 0:
+            return b""
+        with path.open("rb") as fh:
+            return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception as e:
+        print(f"Error reading blob {sha}: {e}")
+        return b""
+
+# Candidatos: el registro guarda solo metadatos y los hashes del CV y su texto
+def candidate_files(raw: bytes, text: str) -> dict:
+    return {"cv_sha256": put_blob(raw), "text_sha256": put_blob((text or "").encode("utf-8")), "cv_size": len(raw)}
+
+def _migrate_inline_blobs(call_results: list, tasks: list):
+    """Mueve el base64 embebido (formato anterior) al store de blobs."""
+    moved_tx = []
+    for it in call_results or []:
+        if isinstance(it, dict) and "bytes_b64" in it:
+            try:
+                raw = base64.b64decode(it.pop("bytes_b64") or "")
+                if raw:
+                    it["blob_sha256"] = put_blob(raw)
+                    it["file_size"] = len(raw)
+                moved_tx.append(it)
+            except Exception as e:
+                print(f"Error migrating transcript {it.get('id')}: {e}")
+    moved_tasks = []
+    for t in tasks or []:
+        ctx = t.get("context") if isinstance(t, dict) else None
+        if isinstance(ctx, dict) and "pdf_bytes_b64" in ctx:
+            try:
+                raw = base64.b64decode(ctx.pop("pdf_bytes_b64") or "")
+                if raw:
+                    ctx["pdf_sha256"] = put_blob(raw)
+                moved_tasks.append(t)
+            except Exception as e:
+                print(f"Error migrating task {t.get('id')}: {e}")
+    if moved_tx:
+        save_records(TRANSCRIPTS_FILE, moved_tx)
+    if moved_tasks:
+        save_records(TASKS_FILE, moved_tasks)
+
+# ===== Cache en disco (LRU por tamaño) =====
+class _DiskCache:
+    """
+    Cache clave -> texto en archivos bajo `root`. Cada hit actualiza el mtime,
+    y al superar `max_bytes` se borran los menos usados recientemente.
+    """
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.size = None
+        self.hits = 0
+        self.misses = 0
+        root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            value = path.read_text(encoding="utf-8")
+            os.utime(path)
+            self.hits += 1
+            return value
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            print(f"Error reading cache entry {path}: {e}")
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str):
+        path = self._path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+            tmp.write_text(value, encoding="utf-8")
+            os.replace(tmp, path)
+            with self.lock:
+                if self.size is None:
+                    self.size = sum(f.stat().st_size for f in self.root.glob("*/*") if f.is_file())
+                else:
+                    self.size += path.stat().st_size
+                if self.size > self.max_bytes:
+                    self._evict()
+        except Exception as e:
+            print(f"Error writing cache entry {path}: {e}")
+
+    def _evict(self):
+        entries = []
+        for f in self.root.glob("*/*"):
+            try:
+                st_ = f.stat()
+                entries.append((st_.st_mtime, st_.st_size, f))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, f in entries:
+            if total <= target:
+                break
+            f.unlink(missing_ok=True)
+            total -= size
+        self.size = total
+
+def _disk_cache(name: str, root: Path, max_bytes: int) -> _DiskCache:
+    state = _process_state()
+    with state["caches_lock"]:
+        if name not in state["caches"]:
+            state["caches"][name] = _DiskCache(root, max_bytes)
+        return state["caches"][name]
+
+# ===== Journal (append-only) para colecciones con id =====
+# Cada alta/edición/baja se agrega como una línea en <archivo>.journal.jsonl;
+# el snapshot JSON se compacta en segundo plano cuando el journal crece.
+JOURNAL_KEYS = {TASKS_FILE: "id", TRANSCRIPTS_FILE: "id", WORKFLOWS_FILE: "id", POSITIONS_FILE: "ID", CANDIDATES_FILE: "id"}
+JOURNAL_INSERT_AT = {TASKS_FILE: 0, WORKFLOWS_FILE: 0, POSITIONS_FILE: 0, TRANSCRIPTS_FILE: None, CANDIDATES_FILE: None}  # None = al final
+JOURNAL_COMPACT_MIN_BYTES = 4 * 1024 * 1024
+JOURNAL_COMPACT_RATIO = 0.5
+JOURNAL_COMPACT_MAX_OPS = 2000
+
+def _dumps_record(rec) -> str:
+    return json.dumps(rec, ensure_ascii=False, separators=(",", ":"))
+
+def _fingerprint(line: str) -> str:
+    return hashlib.sha1(line.encode("utf-8")).hexdigest()
+
+def _read_journal(journal: Path) -> list:
+    ops = []
+    try:
+        fh = journal.open("r", encoding="utf-8")
+    except FileNotFoundError:
+        return ops
+    with fh:
+        for ln in fh:
+            ln = ln.strip()
+            if not ln:
+                continue
+            try:
+                ops.append(json.loads(ln))
+            except Exception as e:
+                # Línea truncada (corte a mitad de escritura): se descarta
+                print(f"Error reading journal line from {journal}: {e}")
+    return ops
+
+def _replay_journal_ops(data: list, key: str, ops) -> list:
+    """
+    Aplica operaciones del journal sobre la lista (idempotentes por id).
+    Los registros se indexan por id en un dict, así reemplazos y bajas no
+    recorren la lista; el orden solo se toca en altas con posición.
+    """
+    def _load(items):
+        # Registros sin id conservan su lugar con una clave propia
+        recs, order = {}, []
+        for r in items:
+            rid = r.get(key) if isinstance(r, dict) and key in r else object()
+            if rid not in recs:
+                order.append(rid)
+            recs[rid] = r
+        return recs, order
+
+    recs, order = _load(data)
+    gone = set()  # ids dados de baja que siguen en `order`
+    for op in ops:
+        kind = op.get("op")
+        if kind == "all":
+            recs, order = _load(op.get("data") or [])
+            gone.clear()
+            continue
+        rid = op.get("id")
+        if kind == "put":
+            if rid not in recs:
+                at = op.get("at")
+                if gone and (at is not None or rid in gone):
+                    order = [r for r in order if r in recs]
+                    gone.clear()
+                if at is None:
+                    order.append(rid)
+                else:
+                    order.insert(min(int(at), len(order)), rid)
+            recs[rid] = op.get("rec")
+        elif kind == "del" and rid in recs:
+            del recs[rid]
+            gone.add(rid)
+    return [recs[r] for r in order if r in recs]
+
+class _JournalStore:
+    """
+    Snapshot + journal de una colección. En memoria solo se guarda el orden de ids
+    y una huella (sha1) por registro, para que cada escritura cueste lo que cambió.
+    """
+    def __init__(self, path: Path, key: str):
+        self.path = path
+        self.key = key
+        self.journal_path = path.with_suffix(".journal.jsonl")
+        self.rotated_path = path.with_suffix(".journal.old.jsonl")
+        self.lock = threading.RLock()
+        self.order = []
+        self.fps = {}
+        self.ops_since_compact = 0
+        self.compacting = False
+        self.loaded = False
+
+    def exists(self) -> bool:
+        return self.path.exists() or self.journal_path.exists() or self.rotated_path.exists()
+
+    def _read_ops(self, journal: Path) -> list:
+        return _read_journal(journal)
+
+    def _replay(self, journals: list) -> tuple[list, int]:
+        data = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else []
+        if not isinstance(data, list):
+            data = []
+        ops = [op for j in journals for op in self._read_ops(j)]
+        return _replay_journal_ops(data, self.key, ops), len(ops)
+
+    def _reindex(self, data: list):
+        self.order, self.fps = [], {}
+        for rec in data:
+            if isinstance(rec, dict) and self.key in rec:
+                rid = rec[self.key]
+                self.order.append(rid)
+                self.fps[rid] = _fingerprint(_dumps_record(rec))
+
+    def _snapshot_id(self):
+        try:
+            st_ = self.path.stat()
+            return (st_.st_ino, st_.st_mtime_ns, st_.st_size)
+        except FileNotFoundError:
+            return None
+
+    def load(self) -> list:
+        with self.lock:
+            # Otro proceso puede compactar entre la lectura del snapshot y la del
+            # journal rotado: si el snapshot cambió durante la lectura, se relee
+            for _ in range(5):
+                before = self._snapshot_id()
+                data, n_ops = self._replay([self.rotated_path, self.journal_path])
+                if self._snapshot_id() == before:
+                    break
+            self._reindex(data)
+            self.ops_since_compact = n_ops
+            self.loaded = True
+        self._maybe_compact()
+        return data
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def _append(self, ops: list):
+        if not ops:
+            return
+        payload = "".join(_dumps_record(op) + "\n" for op in ops)
+        with self.journal_path.open("a", encoding="utf-8") as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+        self.ops_since_compact += len(ops)
+
+    def _write_snapshot(self, lines: list):
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text("[\n" + ",\n".join(lines) + "\n]\n", encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    def put_many(self, recs: list, at=None):
+        """Alta o reemplazo de registros; solo se escribe lo que cambió."""
+        with self.lock:
+            self._ensure_loaded()
+            ops = []
+            for rec in recs:
+                rid = rec.get(self.key)
+                if rid is None:
+                    continue
+                line = _dumps_record(rec)
+                fp = _fingerprint(line)
+                if self.fps.get(rid) == fp:
+                    continue
+                op = {"op": "put", "id": rid, "rec": rec}
+                if rid not in self.fps:
+                    op["at"] = at
+                    self.order.insert(len(self.order) if at is None else min(at, len(self.order)), rid)
+                self.fps[rid] = fp
+                ops.append(op)
+            self._append(ops)
+        self._maybe_compact()
+
+    def delete(self, rid):
+        with self.lock:
+            self._ensure_loaded()
+            if rid not in self.fps:
+                return
+            self.fps.pop(rid, None)
+            self.order.remove(rid)
+            self._append([{"op": "del", "id": rid}])
+        self._maybe_compact()
+
+    def save_all(self, data: list):
+        """Guarda la lista completa escribiendo solo el diff contra lo ya persistido."""
+        with self.lock:
+            self._ensure_loaded()
+            new_ids = [r.get(self.key) if isinstance(r, dict) else None for r in data]
+            if None in new_ids or len(set(new_ids)) != len(new_ids) or not self.exists():
+                # Colección nueva o registros sin id: se escribe el snapshot completo
+                lines = [_dumps_record(r) for r in data]
+                self._write_snapshot(lines)
+                self.journal_path.unlink(missing_ok=True)
+                self.rotated_path.unlink(missing_ok=True)
+                self._reindex(data)
+                self.ops_since_compact = 0
+                return
+            new_set = set(new_ids)
+            ops = [{"op": "del", "id": rid} for rid in self.order if rid not in new_set]
+            sim_order = [rid for rid in self.order if rid in new_set]
+            new_fps = {}
+            for idx, rec in enumerate(data):
+                rid = new_ids[idx]
+                line = _dumps_record(rec)
+                fp = _fingerprint(line)
+                new_fps[rid] = fp
+                if rid not in self.fps:
+                    sim_order.insert(idx, rid)
+                    ops.append({"op": "put", "id": rid, "at": idx, "rec": rec})
+                elif self.fps[rid] != fp:
+                    ops.append({"op": "put", "id": rid, "rec": rec})
+            if sim_order != new_ids:
+                # Reordenamiento arbitrario: más simple (y barato) reescribir el snapshot
+                self._write_snapshot([_dumps_record(r) for r in data])
+                self.journal_path.unlink(missing_ok=True)
+                self.rotated_path.unlink(missing_ok=True)
+                self.ops_since_compact = 0
+            else:
+                self._append(ops)
+            self.order, self.fps = new_ids, new_fps
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        with self.lock:
+            if self.compacting or not self.journal_path.exists():
+                return
+            j_size = self.journal_path.stat().st_size
+            s_size = self.path.stat().st_size if self.path.exists() else 0
+            if self.ops_since_compact < JOURNAL_COMPACT_MAX_OPS and j_size < max(JOURNAL_COMPACT_MIN_BYTES, s_size * JOURNAL_COMPACT_RATIO):
+                return
+            self.compacting = True
+            if not self.rotated_path.exists():
+                # Las escrituras nuevas siguen en un journal vacío mientras se compacta
+                os.replace(self.journal_path, self.rotated_path)
+            self.ops_since_compact = 0
+        threading.Thread(target=self._compact, daemon=True).start()
+
+    def _compact(self):
+        try:
+            data, _ = self._replay([self.rotated_path])
+            lines = [_dumps_record(r) for r in data]
+            # El cambio de snapshot y la baja del journal rotado van bajo el lock:
+            # un load() nunca ve uno sin el otro. Si save_all reescribió el snapshot
+            # mientras tanto (y borró el rotado), este resultado ya está obsoleto.
+            with self.lock:
+                if self.rotated_path.exists():
+                    self._write_snapshot(lines)
+                    self.rotated_path.unlink(missing_ok=True)
+        except Exception as e:
+            print(f"Error compacting journal {self.journal_path}: {e}")
+        finally:
+            with self.lock:
+                self.compacting = False
+            _shared_refresh_stamp(self.path)
+
+# ===== Backend SQLite opcional (SELEKTIA_STORAGE=sqlite) =====
+# Mismas funciones load_*/save_*; las colecciones con id pasan a tablas con
+# índices sobre los campos por los que filtran las páginas.
+STORAGE_BACKEND = os.getenv("SELEKTIA_STORAGE", "json").strip().lower()
+SQLITE_FILE = DATA_DIR / "selektia.db"
+SQL_TABLES = {
+    TASKS_FILE: ("tasks", ("assigned_to", "status", "due")),
+    TRANSCRIPTS_FILE: ("transcripts", ("role", "created_at")),
+    WORKFLOWS_FILE: ("workflows", ("role", "status")),
+    POSITIONS_FILE: ("positions", ("Estado",)),
+    CANDIDATES_FILE: ("candidates", ("stage", "Role")),
+}
+
+_SQL_LOCK = _process_state()["sql_lock"]
+
+def _sql_conn():
+    state = _process_state()
+    with _SQL_LOCK:
+        if state["sql_conn"] is None:
+            conn = sqlite3.connect(str(SQLITE_FILE), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            state["sql_conn"] = conn
+        return state["sql_conn"]
+
+class _SqliteStore:
+    """Colección en una tabla SQLite: columnas indexadas + el registro completo en `data`."""
+    def __init__(self, path: Path, key: str, table: str, columns: tuple):
+        self.path = path
+        self.key = key
+        self.table = table
+        self.columns = columns
+        self.lock = _SQL_LOCK
+        self.order = []
+        self.fps = {}
+        self.loaded = False
+        conn = _sql_conn()
+        cols = "".join(f", {c} TEXT" for c in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY, seq INTEGER NOT NULL{cols}, data TEXT NOT NULL)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_seq ON {table}(seq)")
+        for c in columns:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{c.lower()} ON {table}({c})")
+        # Colecciones ya inicializadas en SQLite (migradas o creadas aquí): una
+        # tabla vacía con marca es una colección vacía, no una por migrar
+        conn.execute("CREATE TABLE IF NOT EXISTS _collections (name TEXT PRIMARY KEY, created_at TEXT NOT NULL)")
+        self.marked = conn.execute("SELECT 1 FROM _collections WHERE name = ?", (table,)).fetchone() is not None
+        self._migrate_from_json()
+
+    def _mark(self):
+        if not self.marked:
+            _sql_conn().execute("INSERT OR IGNORE INTO _collections (name, created_at) VALUES (?, ?)",
+                                (self.table, datetime.now().isoformat()))
+            self.marked = True
+
+    def _migrate_from_json(self):
+        """Primera vez en SQLite: importa lo que hubiera en el JSON/journal (una sola vez)."""
+        if self.marked:
+            return
+        conn = _sql_conn()
+        if conn.execute(f"SELECT 1 FROM {self.table} LIMIT 1").fetchone():
+            # Migrada antes de que existiera la marca
+            self._mark()
+            return
+        legacy = _JournalStore(self.path, self.key)
+        if legacy.exists():
+            try:
+                self.save_all(legacy.load())
+            except Exception as e:
+                print(f"Error migrating {self.path} to SQLite: {e}")
+
+    def _row(self, rec: dict, seq: int, line: str) -> tuple:
+        return (str(rec[self.key]), seq, *[None if rec.get(c) is None else str(rec.get(c)) for c in self.columns], line)
+
+    def _upsert_sql(self) -> str:
+        cols = ", ".join(("id", "seq", *self.columns, "data"))
+        marks = ", ".join("?" * (len(self.columns) + 3))
+        return f"INSERT OR REPLACE INTO {self.table} ({cols}) VALUES ({marks})"
+
+    def exists(self) -> bool:
+        return self.marked
+
+    def load(self) -> list:
+        with self.lock:
+            rows = _sql_conn().execute(f"SELECT data FROM {self.table} ORDER BY seq").fetchall()
+            data = [json.loads(r[0]) for r in rows]
+            self.order = [r.get(self.key) for r in data]
+            self.fps = {r.get(self.key): _fingerprint(line) for r, (line,) in zip(data, rows)}
+            self.loaded = True
+            return data
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def put_many(self, recs: list, at=None):
+        with self.lock:
+            self._ensure_loaded()
+            conn = _sql_conn()
+            lo, hi = conn.execute(f"SELECT COALESCE(MIN(seq), 0), COALESCE(MAX(seq), 0) FROM {self.table}").fetchone()
+            rows = []
+            for rec in recs:
+                rid = rec.get(self.key)
+                if rid is None:
+                    continue
+                line = _dumps_record(rec)
+                fp = _fingerprint(line)
+                if self.fps.get(rid) == fp:
+                    continue
+                if rid in self.fps:
+                    seq = conn.execute(f"SELECT seq FROM {self.table} WHERE id = ?", (str(rid),)).fetchone()[0]
+                elif at == 0:
+                    lo -= 1; seq = lo
+                    self.order.insert(0, rid)
+                else:
+                    hi += 1; seq = hi
+                    self.order.append(rid)
+                self.fps[rid] = fp
+                rows.append(self._row(rec, seq, line))
+            if rows:
+                conn.execute("BEGIN")
+                conn.executemany(self._upsert_sql(), rows)
+                conn.execute("COMMIT")
+                self._mark()
+
+    def delete(self, rid):
+        with self.lock:
+            self._ensure_loaded()
+            _sql_conn().execute(f"DELETE FROM {self.table} WHERE id = ?", (str(rid),))
+            if rid in self.fps:
+                self.fps.pop(rid)
+                self.order.remove(rid)
+
+    def save_all(self, data: list):
+        with self.lock:
+            self._ensure_loaded()
+            conn = _sql_conn()
+            new_ids = [r.get(self.key) if isinstance(r, dict) else None for r in data]
+            keep = [(i, r) for i, r in enumerate(data) if new_ids[i] is not None]
+            new_set = {new_ids[i] for i, _ in keep}
+            reordered = [rid for rid in new_ids if rid is not None] != self.order
+            conn.execute("BEGIN")
+            for rid in self.order:
+                if rid not in new_set:
+                    conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (str(rid),))
+            rows, fps = [], {}
+            for i, rec in keep:
+                line = _dumps_record(rec)
+                fp = _fingerprint(line)
+                fps[rec[self.key]] = fp
+                if reordered or self.fps.get(rec[self.key]) != fp:
+                    rows.append(self._row(rec, i, line))
+            conn.executemany(self._upsert_sql(), rows)
+            conn.execute("COMMIT")
+            self._mark()
+            self.order = [rid for rid in new_ids if rid is not None]
+            self.fps = fps
+
+    def _col(self, field):
+        if field == self.key:
+            return "id"
+        return field if field in self.columns else f"json_extract(data, '$.{field}')"
+
+    def _where(self, eq=None, isin=None, like=None, search=None):
+        """(cláusula WHERE, parámetros); None si el filtro no puede devolver nada."""
+        where, params = [], []
+        for f, v in (eq or {}).items():
+            where.append(f"{self._col(f)} = ?"); params.append(str(v) if f == self.key else v)
+        for f, vs in (isin or {}).items():
+            vs = [str(v) for v in vs] if f == self.key else list(vs)
+            if not vs:
+                return None
+            where.append(f"{self._col(f)} IN ({', '.join('?' * len(vs))})"); params.extend(vs)
+        for f, v in (like or {}).items():
+            where.append(f"LOWER({self._col(f)}) LIKE ?"); params.append(f"%{v.lower()}%")
+        if search and search[1]:
+            fields, q = search
+            where.append("(" + " OR ".join(f"LOWER({self._col(f)}) LIKE ?" for f in fields) + ")")
+            params.extend([f"%{q.lower()}%"] * len(fields))
+        return (" WHERE " + " AND ".join(where) if where else ""), params
+
+    def query(self, eq=None, isin=None, like=None, search=None, order_by=None, desc=False, limit=None, offset=0, only_ids=False) -> list:
+        """Filtros empujados a SQL; los campos indexados se usan como columna."""
+        w = self._where(eq, isin, like, search)
+        if w is None:
+            return []
+        where, params = w
+        sql = f"SELECT {'id' if only_ids else 'data'} FROM {self.table}{where}"
+        sql += f" ORDER BY {self._col(order_by) if order_by else 'seq'}{' DESC' if desc else ''}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"; params.extend([int(limit), int(offset)])
+        with self.lock:
+            rows = _sql_conn().execute(sql, params).fetchall()
+        return [r[0] for r in rows] if only_ids else [json.loads(r[0]) for r in rows]
+
+    def count(self, eq=None, isin=None, like=None, search=None) -> int:
+        w = self._where(eq, isin, like, search)
+        if w is None:
+            return 0
+        with self.lock:
+            return _sql_conn().execute(f"SELECT COUNT(*) FROM {self.table}{w[0]}", w[1]).fetchone()[0]
+
+    def distinct(self, field, default=None, eq=None, isin=None, like=None, search=None) -> list:
+        w = self._where(eq, isin, like, search)
+        if w is None:
+            return []
+        where, params = w
+        with self.lock:
+            rows = _sql_conn().execute(f"SELECT DISTINCT COALESCE({self._col(field)}, ?) FROM {self.table}{where}",
+                                       [default, *params]).fetchall()
+        return [r[0] for r in rows if r[0] is not None]
+
+_STORES = _process_state()["stores"]
+_STORES_LOCK = _process_state()["stores_lock"]
+
+def _store(path: Path):
+    """Store de la colección (journal o SQLite); None si el archivo se guarda completo."""
+    key = JOURNAL_KEYS.get(path)
+    if key is None:
+        return None
+    with _STORES_LOCK:
+        if path not in _STORES:
+            if STORAGE_BACKEND == "sqlite" and path in SQL_TABLES:
+                table, columns = SQL_TABLES[path]
+                _STORES[path] = _SqliteStore(path, key, table, columns)
+            else:
+                _STORES[path] = _JournalStore(path, key)
+        return _STORES[path]
+
+def _filter_records(records: list, eq=None, isin=None, like=None, search=None, order_by=None, desc=False, limit=None, offset=0) -> list:
+    out = [r for r in (records or []) if isinstance(r, dict)]
+    for f, v in (eq or {}).items():
+        out = [r for r in out if r.get(f) == v]
+    for f, vs in (isin or {}).items():
+        vs = set(vs)
+        out = [r for r in out if r.get(f) in vs]
+    for f, v in (like or {}).items():
+        vl = v.lower()
+        out = [r for r in out if vl in str(r.get(f) or "").lower()]
+    if search and search[1]:
+        fields, ql = search[0], search[1].lower()
+        out = [r for r in out if any(ql in str(r.get(f) or "").lower() for f in fields)]
+    if order_by:
+        out = sorted(out, key=lambda r: str(r.get(order_by) or ""), reverse=desc)
+    if limit is not None:
+        out = out[offset:offset + limit]
+    return out
+
+def query_records(path: Path, records: list, **filters) -> list:
+    """
+    Filtra una colección: en SQLite con una consulta indexada; en JSON sobre la
+    lista en memoria `records`. Filtros: eq / isin / like / search=(campos, texto) /
+    order_by / desc / limit / offset.
+    """
+    store = _store(path)
+    if isinstance(store, _SqliteStore):
+        try:
+            return store.query(**filters)
+        except Exception as e:
+            print(f"Error querying {store.table}: {e}")
+    if filters.get("order_by"):
+        # Orden cacheado por versión de la colección compartida: ordenar 100k
+        # registros en cada rerun cuesta más que filtrarlos
+        presorted = _shared_sorted(path, records, filters["order_by"], bool(filters.get("desc")))
+        if presorted is not None:
+            return _filter_records(presorted, **{**filters, "order_by": None})
+    return _filter_records(records, **filters)
+
+def count_records(path: Path, records: list, **filters) -> int:
+    """Cantidad de registros que devolvería query_records (sin limit/offset)."""
+    filters = {k: v for k, v in filters.items() if k in ("eq", "isin", "like", "search")}
+    store = _store(path)
+    if isinstance(store, _SqliteStore):
+        try:
+            return store.count(**filters)
+        except Exception as e:
+            print(f"Error querying {store.table}: {e}")
+    return len(_filter_records(records, **filters))
+
+def query_ids(path: Path, records: list, **filters) -> list:
+    """Como query_records, pero solo los ids (en SQLite no se decodifica `data`)."""
+    store = _store(path)
+    key = JOURNAL_KEYS.get(path, "id")
+    if isinstance(store, _SqliteStore):
+        try:
+            return store.query(only_ids=True, **filters)
+        except Exception as e:
+            print(f"Error querying {store.table}: {e}")
+    return [r.get(key) for r in query_records(path, records, **filters)]
+
+def distinct_values(path: Path, records: list, field: str, default=None, **filters) -> list:
+    """
+    Valores distintos de `field` entre los registros que pasan `filters`
+    (mismos filtros que query_records). Los registros sin valor cuentan como `default`.
+    """
+    store = _store(path)
+    if isinstance(store, _SqliteStore):
+        try:
+            return store.distinct(field, default, **filters)
+        except Exception as e:
+            print(f"Error querying {store.table}: {e}")
+    recs = query_records(path, records, **filters) if filters else (records or [])
+    vals = {r.get(field) if r.get(field) is not None else default for r in recs if isinstance(r, dict)}
+    vals.discard(None)
+    return list(vals)
+
+# ===== Colecciones compartidas entre sesiones =====
+# Una sola copia parseada por proceso; cada sesión apunta a ella y solo la
+# vuelve a tomar cuando cambia la versión. Los cambios hechos fuera de la app
+# se detectan por mtime/tamaño de los archivos (o data_version en SQLite).
+_SHARED = _process_state()["collections"]
+_SHARED_LOCK = _process_state()["collections_lock"]
+
+def _disk_stamp(path: Path):
+    try:
+        if STORAGE_BACKEND == "sqlite" and path in SQL_TABLES:
+            return ("sqlite", _sql_conn().execute("PRAGMA data_version").fetchone()[0])
+        files = (path, path.with_suffix(".journal.jsonl"), path.with_suffix(".journal.old.jsonl"))
+        return tuple((f.stat().st_mtime_ns, f.stat().st_size) if f.exists() else None for f in files)
+    except Exception:
+        return None
+
+def shared_collection(path: Path, loader) -> tuple[list, int]:
+    """Retorna (datos, versión) de la colección, cargándola una sola vez por proceso."""
+    with _SHARED_LOCK:
+        entry = _SHARED.get(path)
+        stamp = _disk_stamp(path)
+        if entry is None or entry["stamp"] != stamp:
+            data = loader()
+            _SHARED[path] = entry = {
+                "data": data,
+                "version": (entry["version"] + 1) if entry else 1,
+                "stamp": _disk_stamp(path),
+            }
+        return entry["data"], entry["version"]
+
+def _shared_derived(path: Path, records: list, key, build):
+    """
+    build(records) calculado una vez por versión de la colección compartida y
+    reutilizado por todas las sesiones. None si `records` no es la copia compartida.
+    """
+    with _SHARED_LOCK:
+        entry = _SHARED.get(path)
+        if entry is None or entry["data"] is not records:
+            return None
+        hit = entry.setdefault("derived", {}).get(key)
+        if hit is not None and hit[0] == entry["version"]:
+            return hit[1]
+        version = entry["version"]
+    out = build(records)
+    with _SHARED_LOCK:
+        entry = _SHARED.get(path)
+        if entry is not None and entry["version"] == version:
+            entry.setdefault("derived", {})[key] = (version, out)
+    return out
+
+def _shared_sorted(path: Path, records: list, field: str, desc: bool):
+    """Copia ordenada de la colección compartida, recalculada solo cuando cambia su versión."""
+    return _shared_derived(
+        path, records, ("sorted", field, desc),
+        lambda recs: sorted((r for r in recs if isinstance(r, dict)), key=lambda r: str(r.get(field) or ""), reverse=desc),
+    )
+
+def _shared_refresh_stamp(path: Path):
+    with _SHARED_LOCK:
+        if path in _SHARED:
+            _SHARED[path]["stamp"] = _disk_stamp(path)
+
+def _shared_after_write(path: Path, mutate):
+    """
+    Aplica a la copia compartida el mismo cambio que se acaba de persistir.
+    `mutate` retorna una lista nueva: la anterior no se toca, así las sesiones
+    que la estén recorriendo siguen viendo un estado consistente.
+    """
+    with _SHARED_LOCK:
+        entry = _SHARED.get(path)
+        if entry is None:
+            return
+        old = entry["data"]
+        entry["data"] = mutate(old)
+        entry["version"] += 1
+        entry["stamp"] = _disk_stamp(path)
+        new, version = entry["data"], entry["version"]
+    # La sesión que escribió ve su cambio en esta misma ejecución
+    for attr, p, _loader in SHARED_COLLECTIONS:
+        if p == path and ss.get(attr) is old:
+            ss[attr] = new
+            ss[f"_{attr}_version"] = version
+
+def _shared_upsert(key: str, recs: list, at):
+    def _mutate(old):
+        data = list(old)
+        if len(recs) == 1:
+            rec = recs[0]
+            pos = next((i for i, r in enumerate(data) if r is rec or (isinstance(r, dict) and r.get(key) == rec.get(key))), None)
+            if pos is not None:
+                data[pos] = rec
+            else:
+                data.insert(len(data) if at is None else at, rec)
+            return data
+        # Lote: una sola pasada para ubicar los existentes
+        pos_of = {r.get(key): i for i, r in enumerate(data) if isinstance(r, dict)}
+        new = []
+        for rec in recs:
+            pos = pos_of.get(rec.get(key))
+            if pos is not None:
+                data[pos] = rec
+            else:
+                pos_of[rec.get(key)] = -1
+                new.append(rec)
+        if at is None:
+            data.extend(new)
+        else:
+            data[at:at] = new[::-1]
+        return data
+    return _mutate
+
 def save_json(path: Path, data):
     try:
-        path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        store = _store(path)
+        if store is not None and isinstance(data, list):
+            store.save_all(data)
+        else:
+            path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+        _shared_after_write(path, lambda _old: list(data) if isinstance(data, list) else data)
     except Exception as e:
         print(f"Error saving JSON to {path}: {e}")
 
 def load_json(path: Path, default):
+    store = _store(path)
+    if store is not None and store.exists():
+        try:
+            return store.load()
+        except Exception as e:
+            print(f"Error reading JSON from {path}: {e}")
+            return default if isinstance(default, (list, dict)) else []
     if path.exists():
         try:
             return json.loads(path.read_text(encoding="utf-8"))
@@ -322,20 +1170,416 @@ def load_json(path: Path, default):
             print(f"Error creating default file {path}: {e}")
     return default if isinstance(default, (list, dict)) else []
 
+def save_record(path: Path, rec: dict):
+    """Persiste un solo registro (alta o edición) sin reescribir la colección."""
+    try:
+        _store(path).put_many([rec], at=JOURNAL_INSERT_AT.get(path))
+        _shared_after_write(path, _shared_upsert(JOURNAL_KEYS[path], [rec], JOURNAL_INSERT_AT.get(path)))
+    except Exception as e:
+        print(f"Error saving record to {path}: {e}")
+
+def save_records(path: Path, recs: list):
+    """Igual que save_record, pero para un lote en una sola escritura."""
+    try:
+        # Altas al inicio: se insertan en orden inverso para respetar el orden del lote
+        at = JOURNAL_INSERT_AT.get(path)
+        ordered = list(reversed(recs)) if at == 0 else list(recs)
+        _store(path).put_many(ordered, at=at)
+        _shared_after_write(path, _shared_upsert(JOURNAL_KEYS[path], ordered, at))
+    except Exception as e:
+        print(f"Error saving records to {path}: {e}")
+
+def delete_record(path: Path, rec_id):
+    try:
+        _store(path).delete(rec_id)
+        key = JOURNAL_KEYS[path]
+        _shared_after_write(path, lambda data: [r for r in data if not (isinstance(r, dict) and r.get(key) == rec_id)])
+    except Exception as e:
+        print(f"Error deleting record {rec_id} from {path}: {e}")
+
 def load_agents(): return load_json(AGENTS_FILE, [])
 def save_agents(agents): save_json(AGENTS_FILE, agents)
 def load_workflows(): return load_json(WORKFLOWS_FILE, [])
 def save_workflows(wfs): save_json(WORKFLOWS_FILE, wfs)
+def save_workflow(wf): save_record(WORKFLOWS_FILE, wf)
+def delete_workflow(wf_id): delete_record(WORKFLOWS_FILE, wf_id)
 def load_tasks(): return load_json(TASKS_FILE, DEFAULT_TASKS)
 def save_tasks(tasks): save_json(TASKS_FILE, tasks)
+def save_task(task): save_record(TASKS_FILE, task)
+def delete_task(task_id): delete_record(TASKS_FILE, task_id)
+def load_candidates(): return load_json(CANDIDATES_FILE, None)  # sin archivo: la app siembra los de ejemplo
+def save_candidate(c): save_record(CANDIDATES_FILE, c)
+def save_candidates_batch(cands): save_records(CANDIDATES_FILE, cands)
 def load_positions(): return load_json(POSITIONS_FILE, DEFAULT_POSITIONS)
 def save_positions(positions): save_json(POSITIONS_FILE, positions)
+def save_position(pos): save_record(POSITIONS_FILE, pos)
+def delete_position(pos_id): delete_record(POSITIONS_FILE, pos_id)
 def load_call_results():
     return load_json(TRANSCRIPTS_FILE, [])
 
 def save_call_results(items):
     save_json(TRANSCRIPTS_FILE, items)
-    
+    transcript_index().sync(items)
+
+def save_call_result(item):
+    save_record(TRANSCRIPTS_FILE, item)
+    transcript_index().put_many([item])
+
+def save_call_results_batch(items):
+    """Alta/edición de varias transcripciones en una sola escritura (colección + índice)."""
+    save_records(TRANSCRIPTS_FILE, items)
+    transcript_index().put_many(items)
+
+def delete_call_result(item_id):
+    delete_record(TRANSCRIPTS_FILE, item_id)
+    transcript_index().delete(item_id)
+    _transcript_eval_path(item_id).unlink(missing_ok=True)
+
+# ===== Índice de búsqueda de transcripciones =====
+# Índice invertido con ranking BM25 sobre título, candidato y texto (tokens de
+# _norm_txt, sin tildes). En disco: un segmento compacto (.npz, postings
+# ordenados por término) + un journal con las altas/bajas posteriores. En
+# memoria: el segmento + un delta con lo agregado desde entonces; las bajas
+# quedan como lápidas hasta la siguiente compactación (en segundo plano).
+SEARCH_INDEX_DIR = DATA_DIR / "search_index"
+SEARCH_INDEX_DIR.mkdir(exist_ok=True)
+SEARCH_FIELDS = ("title", "candidate", "text")
+SEARCH_BM25_K1 = 1.2
+SEARCH_BM25_B = 0.75
+SEARCH_PREFIX_MIN = 2          # la última palabra buscada se expande como prefijo
+SEARCH_COMPACT_MIN_OPS = 500
+SEARCH_COMPACT_RATIO = 0.2     # compacta cuando el journal supera el 20% de los documentos
+
+def _search_fp(rec: dict) -> str:
+    return _fingerprint("\x1f".join(str(rec.get(f) or "") for f in SEARCH_FIELDS))
+
+def _search_tf(rec: dict) -> dict:
+    return dict(Counter(_norm_txt(" ".join(str(rec.get(f) or "") for f in SEARCH_FIELDS)).split()))
+
+def _pack_strs(items) -> np.ndarray:
+    return np.frombuffer("\n".join(items).encode("utf-8"), dtype=np.uint8)
+
+def _unpack_strs(arr) -> list:
+    raw = arr.tobytes().decode("utf-8")
+    return raw.split("\n") if raw else []
+
+def _bm25_weights(tfs, doc_len, df, n_docs: int, avgdl: float):
+    """Peso BM25 de cada posting (idf × saturación de tf normalizada por largo)."""
+    k1, b = SEARCH_BM25_K1, SEARCH_BM25_B
+    tfs = tfs.astype(np.float32)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    return (idf * tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_len / max(avgdl, 1.0)))).astype(np.float32)
+
+def _build_search_segment(snap: dict) -> dict:
+    """
+    Funde segmento + delta en un segmento nuevo sin lápidas (vectorizado).
+    Los pesos BM25 quedan precalculados por posting con el df/avgdl de este
+    momento, así una búsqueda sobre el segmento es un bincount por término.
+    """
+    live = np.nonzero(snap["alive"])[0]
+    new_slot = np.full(len(snap["alive"]), -1, dtype=np.int64)
+    new_slot[live] = np.arange(len(live))
+    vocab = sorted(set(snap["terms"]).union(snap["delta"]))
+    pos = {t: i for i, t in enumerate(vocab)}
+    parts_t, parts_s, parts_f = [], [], []
+    if snap["terms"]:
+        base_map = np.fromiter((pos[t] for t in snap["terms"]), dtype=np.int64, count=len(snap["terms"]))
+        parts_t.append(np.repeat(base_map, np.diff(snap["offsets"])))
+        parts_s.append(snap["p_slots"])
+        parts_f.append(snap["p_tfs"])
+    for t, (sl, tf) in snap["delta"].items():
+        parts_t.append(np.full(len(sl), pos[t], dtype=np.int64))
+        parts_s.append(sl)
+        parts_f.append(tf)
+    if parts_t:
+        all_t = np.concatenate(parts_t)
+        all_s = new_slot[np.concatenate(parts_s)]
+        all_f = np.concatenate(parts_f).astype(np.uint16)
+        keep = all_s >= 0
+        all_t, all_s, all_f = all_t[keep], all_s[keep], all_f[keep]
+        order = np.lexsort((all_s, all_t))
+        all_t, all_s, all_f = all_t[order], all_s[order], all_f[order]
+        counts = np.bincount(all_t, minlength=len(vocab))
+    else:
+        all_s, all_f, counts = np.zeros(0, np.int64), np.zeros(0, np.uint16), np.zeros(len(vocab), np.int64)
+    used = np.nonzero(counts)[0]
+    doc_len = snap["doc_len"][live]
+    df = np.repeat(counts[used], counts[used]).astype(np.float32)
+    return {
+        "terms": [vocab[i] for i in used],
+        "offsets": np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64),
+        "p_slots": all_s.astype(np.int32),
+        "p_tfs": all_f,
+        "p_w": _bm25_weights(all_f, doc_len[all_s], df, len(live), float(doc_len.mean()) if len(live) else 1.0),
+        "ids": [snap["ids"][i] for i in live],
+        "fps": [snap["fps"][snap["ids"][i]] for i in live],
+        "doc_len": doc_len,
+    }
+
+class _TranscriptIndex:
+    """Índice invertido incremental de transcripciones (ver comentario de la sección)."""
+
+    def __init__(self, root: Path):
+        self.segment_path = root / "segment.npz"
+        self.journal_path = root / "journal.jsonl"
+        self.rotated_path = root / "journal.old.jsonl"
+        self.lock = threading.RLock()
+        self.ops_since_compact = 0
+        self.compacting = False
+        self.gen = 0
+        self.synced_version = None
+        self._install({"terms": [], "offsets": np.zeros(1, np.int64), "p_slots": np.zeros(0, np.int32),
+                       "p_tfs": np.zeros(0, np.uint16), "p_w": np.zeros(0, np.float32),
+                       "ids": [], "fps": [], "doc_len": np.zeros(0, np.float32)})
+
+    def _install(self, seg: dict):
+        self.terms = seg["terms"]
+        self.term_ix = {t: i for i, t in enumerate(self.terms)}
+        self.offsets, self.p_slots, self.p_tfs, self.p_w = seg["offsets"], seg["p_slots"], seg["p_tfs"], seg["p_w"]
+        self.delta = {}          # término -> (array slots, array tfs) de docs posteriores al segmento
+        self.delta_terms = []    # términos que solo están en el delta, ordenados (para prefijos)
+        self.ids = list(seg["ids"])
+        self.slot_of = {rid: i for i, rid in enumerate(self.ids)}
+        self.fps = dict(zip(self.ids, seg["fps"]))
+        n = len(self.ids)
+        cap = max(1024, 2 * n)
+        self.doc_len = np.zeros(cap, np.float32)
+        self.doc_len[:n] = seg["doc_len"]
+        self.alive = np.zeros(cap, bool)
+        self.alive[:n] = True
+        self.total_len = float(self.doc_len[:n].sum())
+
+    def load(self):
+        with self.lock:
+            if self.segment_path.exists():
+                try:
+                    with np.load(self.segment_path) as z:
+                        self._install({
+                            "terms": _unpack_strs(z["terms"]), "offsets": z["offsets"],
+                            "p_slots": z["p_slots"], "p_tfs": z["p_tfs"], "p_w": z["p_w"],
+                            "ids": _unpack_strs(z["ids"]), "fps": _unpack_strs(z["fps"]),
+                            "doc_len": z["doc_len"],
+                        })
+                except Exception as e:
+                    # El índice es derivable: sync() lo reconstruye desde la colección
+                    print(f"Error reading search index {self.segment_path}: {e}")
+            n_ops = 0
+            for journal in (self.rotated_path, self.journal_path):
+                for op in _read_journal(journal):
+                    self._apply(op)
+                    n_ops += 1
+            self.ops_since_compact = n_ops
+        self._maybe_compact()
+        return self
+
+    # ---- mutaciones (siempre con self.lock tomado) ----
+    def _add(self, rid, fp, tf: dict):
+        slot = len(self.ids)
+        if slot >= len(self.alive):
+            grow = len(self.alive)
+            self.alive = np.concatenate([self.alive, np.zeros(grow, bool)])
+            self.doc_len = np.concatenate([self.doc_len, np.zeros(grow, np.float32)])
+        self.ids.append(rid)
+        self.slot_of[rid] = slot
+        self.fps[rid] = fp
+        n = 0
+        for t, c in tf.items():
+            entry = self.delta.get(t)
+            if entry is None:
+                entry = self.delta[t] = (array("i"), array("H"))
+                if t not in self.term_ix:
+                    bisect.insort(self.delta_terms, t)
+            entry[0].append(slot)
+            entry[1].append(min(int(c), 65535))
+            n += c
+        self.doc_len[slot] = n
+        self.alive[slot] = True
+        self.total_len += n
+
+    def _remove(self, rid):
+        slot = self.slot_of.pop(rid, None)
+        if slot is None:
+            return
+        self.fps.pop(rid, None)
+        self.alive[slot] = False
+        self.total_len -= float(self.doc_len[slot])
+
+    def _apply(self, op: dict) -> bool:
+        """Aplica una operación del journal; idempotente (por huella del contenido)."""
+        rid = op.get("id")
+        if op.get("op") == "put":
+            if rid is None or self.fps.get(rid) == op.get("fp"):
+                return False
+            self._remove(rid)
+            self._add(rid, op.get("fp"), op.get("tf") or {})
+        elif op.get("op") == "del":
+            if rid not in self.slot_of:
+                return False
+            self._remove(rid)
+        else:
+            return False
+        self.gen += 1
+        return True
+
+    def _append(self, ops: list):
+        if not ops:
+            return
+        with self.journal_path.open("a", encoding="utf-8") as fh:
+            fh.write("".join(_dumps_record(op) + "\n" for op in ops))
+        self.ops_since_compact += len(ops)
+
+    def put_many(self, recs: list):
+        """Indexa altas/ediciones; lo que no cambió (misma huella) no se retokeniza."""
+        ops = []
+        for rec in recs:
+            rid = rec.get("id") if isinstance(rec, dict) else None
+            if rid is None:
+                continue
+            fp = _search_fp(rec)
+            if self.fps.get(rid) != fp:
+                ops.append({"op": "put", "id": rid, "fp": fp, "tf": _search_tf(rec)})
+        if not ops:
+            return
+        with self.lock:
+            applied = [op for op in ops if self._apply(op)]
+            self._append(applied)
+        self._maybe_compact(force=len(applied) >= SEARCH_COMPACT_MIN_OPS)
+
+    def delete_many(self, rids):
+        with self.lock:
+            applied = [op for op in ({"op": "del", "id": rid} for rid in rids) if self._apply(op)]
+            self._append(applied)
+        self._maybe_compact(force=len(applied) >= SEARCH_COMPACT_MIN_OPS)
+
+    def delete(self, rid):
+        self.delete_many([rid])
+
+    def sync(self, records: list, version=None) -> int:
+        """Alinea los ids del índice con la colección (p.ej. cambios hechos fuera de la app)."""
+        ids = {r.get("id") for r in records if isinstance(r, dict)}
+        with self.lock:
+            stale = [rid for rid in self.slot_of if rid not in ids]
+            missing = [r for r in records if isinstance(r, dict) and r.get("id") is not None and r["id"] not in self.slot_of]
+        if stale:
+            self.delete_many(stale)
+        if missing:
+            self.put_many(missing)
+        self.synced_version = version
+        return len(stale) + len(missing)
+
+    # ---- búsqueda ----
+    def _term_scores(self, w: str, prefix: bool, n: int, n_docs: int, avgdl: float):
+        """Score BM25 denso (por slot) de la palabra, o de los términos con ese prefijo (sumados)."""
+        if prefix:
+            lo = bisect.bisect_left(self.terms, w)
+            hi = bisect.bisect_left(self.terms, w + "\uffff")
+            extra = self.delta_terms[bisect.bisect_left(self.delta_terms, w):bisect.bisect_left(self.delta_terms, w + "\uffff")]
+        else:
+            i = self.term_ix.get(w)
+            lo, hi = (i, i + 1) if i is not None else (0, 0)
+            extra = [w] if i is None and w in self.delta else []
+        g = None
+        if hi > lo:
+            # Segmento: postings contiguos del rango de términos, pesos ya calculados
+            a, b = int(self.offsets[lo]), int(self.offsets[hi])
+            g = np.bincount(self.p_slots[a:b], weights=self.p_w[a:b], minlength=n)
+            extra = [t for t in self.terms[lo:hi] if t in self.delta] + extra
+        if extra:
+            # Delta: se pondera al vuelo (df aproximado = segmento + delta)
+            parts_s, parts_f, parts_df = [], [], []
+            for t in extra:
+                sl, tf = self.delta[t]
+                i = self.term_ix.get(t)
+                df = len(sl) + (int(self.offsets[i + 1] - self.offsets[i]) if i is not None else 0)
+                parts_s.append(np.array(sl, np.int64))
+                parts_f.append(np.array(tf, np.uint16))
+                parts_df.append(np.full(len(sl), df, np.float32))
+            slots = np.concatenate(parts_s)
+            w_delta = _bm25_weights(np.concatenate(parts_f), self.doc_len[slots], np.concatenate(parts_df), n_docs, avgdl)
+            gd = np.bincount(slots, weights=w_delta, minlength=n)
+            g = gd if g is None else g + gd
+        return g
+
+    def search(self, q: str, limit: int = None) -> list:
+        """
+        Ids de las transcripciones que contienen todas las palabras de la
+        búsqueda (la última como prefijo), de mayor a menor score BM25.
+        """
+        words = _norm_txt(q).split()
+        if not words:
+            return []
+        with self.lock:
+            n_docs = len(self.slot_of)
+            if not n_docs:
+                return []
+            n = len(self.ids)
+            avgdl = self.total_len / n_docs
+            mask = self.alive[:n].copy()
+            score = np.zeros(n)
+            for i, w in enumerate(words):
+                g = self._term_scores(w, i == len(words) - 1 and len(w) >= SEARCH_PREFIX_MIN, n, n_docs, avgdl)
+                if g is None:
+                    return []
+                mask &= g > 0
+                score += g
+            hits = np.nonzero(mask)[0]
+            if limit is not None and len(hits) > limit:
+                hits = hits[np.argpartition(-score[hits], limit)[:limit]]
+            hits = hits[np.argsort(-score[hits], kind="stable")]
+            ids = self.ids
+            return [ids[s] for s in hits.tolist()]
+
+    # ---- compactación ----
+    def _maybe_compact(self, force: bool = False):
+        """Compacta en segundo plano si el journal creció; `force` (carga masiva) ignora la proporción."""
+        with self.lock:
+            if self.compacting:
+                return
+            if not force and self.ops_since_compact < max(SEARCH_COMPACT_MIN_OPS, SEARCH_COMPACT_RATIO * len(self.slot_of)):
+                return
+            self.compacting = True
+            if not self.rotated_path.exists() and self.journal_path.exists():
+                # Las operaciones nuevas siguen en un journal vacío mientras se compacta
+                os.replace(self.journal_path, self.rotated_path)
+            self.ops_since_compact = 0
+            n = len(self.ids)
+            snap = {
+                "terms": self.terms, "offsets": self.offsets, "p_slots": self.p_slots, "p_tfs": self.p_tfs,
+                "delta": {t: (np.array(sl, np.int32), np.array(tf, np.uint16)) for t, (sl, tf) in self.delta.items()},
+                "alive": self.alive[:n].copy(), "doc_len": self.doc_len[:n].copy(),
+                "ids": list(self.ids), "fps": dict(self.fps), "gen": self.gen,
+            }
+        threading.Thread(target=self._compact, args=(snap,), daemon=True).start()
+
+    def _compact(self, snap: dict):
+        try:
+            seg = _build_search_segment(snap)
+            tmp = self.segment_path.with_name(f"segment.{uuid.uuid4().hex}.tmp")
+            with tmp.open("wb") as fh:
+                np.savez(fh, terms=_pack_strs(seg["terms"]), offsets=seg["offsets"],
+                         p_slots=seg["p_slots"], p_tfs=seg["p_tfs"], p_w=seg["p_w"], ids=_pack_strs(seg["ids"]),
+                         fps=_pack_strs(seg["fps"]), doc_len=seg["doc_len"])
+            with self.lock:
+                # Segmento nuevo y journal rotado se reemplazan juntos: load() nunca ve uno sin el otro
+                os.replace(tmp, self.segment_path)
+                self.rotated_path.unlink(missing_ok=True)
+                # Si hubo cambios mientras tanto, el estado en memoria (segmento viejo + delta) sigue siendo válido
+                if self.gen == snap["gen"]:
+                    self._install(seg)
+        except Exception as e:
+            print(f"Error compacting search index {self.segment_path}: {e}")
+        finally:
+            with self.lock:
+                self.compacting = False
+
+def transcript_index() -> _TranscriptIndex:
+    """Índice compartido por proceso; se carga de disco la primera vez."""
+    state = _process_state()
+    with state["stores_lock"]:
+        if state["search_index"] is None:
+            state["search_index"] = _TranscriptIndex(SEARCH_INDEX_DIR).load()
+        return state["search_index"]
+
 
 # =========================================================
 # ESTADO
@@ -344,41 +1588,64 @@ ss = st.session_state
 if "auth" not in ss: ss.auth = None
 if "section" not in ss:  ss.section = "publicacion_sourcing"
 
-if "tasks_loaded" not in ss:
-    ss.tasks = load_tasks()
-    if not isinstance(ss.tasks, list):
-        ss.tasks = DEFAULT_TASKS
-        save_tasks(ss.tasks)
-    ss.tasks_loaded = True
+def _load_tasks_checked():
+    tasks = load_tasks()
+    if not isinstance(tasks, list):
+        tasks = DEFAULT_TASKS
+        save_tasks(tasks)
+    _migrate_inline_blobs([], tasks)
+    return tasks
+
+def _load_positions_checked():
+    positions = load_positions()
+    if not isinstance(positions, list):
+        positions = DEFAULT_POSITIONS
+        save_positions(positions)
+    # asegurar JD (solo se escriben los puestos reparados)
+    repaired = []
+    for p in positions:
+        if "JD" not in p:
+            p["JD"] = "Por favor, define el Job Description."
+            repaired.append(p)
+    if repaired:
+        save_records(POSITIONS_FILE, repaired)
+    return positions
+
+def _load_call_results_checked():
+    items = load_call_results()
+    _migrate_inline_blobs(items, [])
+    return items
+
+SHARED_COLLECTIONS = (
+    ("tasks", TASKS_FILE, _load_tasks_checked),
+    ("agents", AGENTS_FILE, load_agents),
+    ("workflows", WORKFLOWS_FILE, load_workflows),
+    ("positions", POSITIONS_FILE, _load_positions_checked),
+    ("call_results", TRANSCRIPTS_FILE, _load_call_results_checked),
+    ("candidates", CANDIDATES_FILE, load_candidates),
+)
+
+def _sync_session_collections():
+    """
+    La sesión apunta a la copia compartida; solo se reasigna si cambió la versión.
+    Esa copia es de solo lectura para las páginas: para editar se copia el
+    registro (dict(rec)) y se guarda con save_*, que lo publica bajo el lock.
+    """
+    for attr, path, loader in SHARED_COLLECTIONS:
+        data, version = shared_collection(path, loader)
+        if ss.get(f"_{attr}_version") != version or attr not in ss:
+            ss[attr] = data
+            ss[f"_{attr}_version"] = version
+
+_sync_session_collections()
 
-if "candidates" not in ss: ss.candidates = []
 if "offers" not in ss:  ss.offers = {}
-if "agents_loaded" not in ss:
-    ss.agents = load_agents()
-    ss.agents_loaded = True
-if "workflows_loaded" not in ss:
-    ss.workflows = load_workflows()
-    ss.workflows_loaded = True
 if "agent_view_idx" not in ss: ss.agent_view_idx = None
 if "agent_edit_idx" not in ss: ss.agent_edit_idx = None
 if "new_role_mode" not in ss: ss.new_role_mode = False
 if "roles" not in ss: ss.roles = load_roles()
 
-# (Req 3) Reemplazo de inicialización de 'positions'
-if "positions_loaded" not in ss:
-    ss.positions = load_positions()
-    if not isinstance(ss.positions, list):
-        ss.positions = DEFAULT_POSITIONS
-    # asegurar JD
-    for p in ss.positions:
-        if "JD" not in p:
-            p["JD"] = "Por favor, define el Job Description."
-    save_positions(ss.positions)
-    ss.positions_loaded = True
 # === NUEVO: estado transcripciones ===
-if "call_results_loaded" not in ss:
-    ss.call_results = load_call_results()
-    ss.call_results_loaded = True
 if "selected_transcript_id" not in ss:
     ss.selected_transcript_id = None
 if "confirm_delete_transcript_id" not in ss:
@@ -412,7 +1679,7 @@ if "selected_flow_id_for_eval" not in ss: ss.selected_flow_id_for_eval = None
 # =========================================================
 SKILL_SYNONYMS = {
   "Excel":["excel","xlsx"], "Gestión documental":["gestión documental","document control"], "Redacción":["redacción","writing"],
-  "Facturación":["facturación","billing"], "Caja":["caja","cash"], "SQL":["sql","postgres","mysql"], "Power BI":["power bi"],
+  "Facturación":["facturación","billing"], "Caja":["caja","cash"], "SQL":["sql","postgres","postgresql","mysql"], "Power BI":["power bi"],
   "Tableau":["tableau"], "ETL":["etl"], "KPIs":["kpi","kpis"], "MS Project":["ms project"], "AutoCAD":["autocad"],
   "BIM":["bim","revit"], "Presupuestos":["presupuesto","presupuestos"], "Figma":["figma"], "UX Research":["ux research","investigación de usuarios"],
   "Prototipado":["prototipado","prototype"], "Python":["python"], "Agile":["agile", "scrum", "kanban"]
@@ -421,11 +1688,74 @@ SKILL_SYNONYMS = {
 def _normalize(t:str)->str:
     return re.sub(r"\s+"," ",(t or "")).strip().lower()
 
-def infer_skills(text:str)->set:
-    t=_normalize(text); out=set()
-    for k,syns in SKILL_SYNONYMS.items():
-        if any(s in t for s in syns):
-            out.add(k)
+_WORD_RX = re.compile(r"\w+")
+SKILL_MATCHER_CACHE_SIZE = 16
+
+def skill_matcher(taxonomy=None):
+    """
+    Matcher compilado para una taxonomía {skill: [sinónimos]} (LRU por proceso).
+    Los sinónimos de una palabra se resuelven intersectando con el set de
+    palabras del texto; los de varias palabras ("power bi") se confirman con
+    una regex con límites de palabra solo si todas sus palabras aparecen en el texto.
+    """
+    taxonomy = SKILL_SYNONYMS if taxonomy is None else taxonomy
+    key = tuple((k, tuple(v)) for k, v in taxonomy.items())
+    state = _process_state()
+    cache, lock = state["skill_matchers"], state["skill_matchers_lock"]
+    with lock:
+        m = cache.get(key)
+        if m is not None:
+            cache.move_to_end(key)
+            return m
+    single, multi = {}, []
+    for k, syns in taxonomy.items():
+        for s in syns:
+            words = _WORD_RX.findall(_normalize(s))
+            if not words:
+                continue
+            if len(words) == 1 and words[0] == _normalize(s):
+                single.setdefault(words[0], k)
+            else:
+                pat = r"\W+".join(re.escape(w) for w in words)
+                multi.append((frozenset(words), words[0], re.compile(r"(?<!\w)" + pat + r"(?!\w)"), k))
+    with lock:
+        m = cache.setdefault(key, (single, multi))
+        cache.move_to_end(key)
+        while len(cache) > SKILL_MATCHER_CACHE_SIZE:
+            cache.popitem(last=False)
+    return m
+
+def _word_set(t: str) -> set:
+    """Palabras (\\w+) de un texto ya en minúsculas; split() primero porque es mucho más barato que una regex."""
+    out = set()
+    for w in set(t.split()):
+        if w.isalnum():
+            out.add(w)
+        else:
+            out.update(_WORD_RX.findall(w))
+    return out
+
+def infer_skills(text:str, taxonomy=None)->set:
+    return _match_skills(text, skill_matcher(taxonomy))
+
+def _match_skills(text: str, matcher, only=None) -> set:
+    """Skills del matcher presentes en el texto; `only` limita a un subconjunto de skills."""
+    single, multi = matcher
+    t = (text or "").lower()
+    words = _word_set(t)
+    out = {single[w] for w in words.intersection(single)}
+    if only is not None:
+        out &= only
+    for need, first, rx, k in multi:
+        if k in out or (only is not None and k not in only) or not need <= words:
+            continue
+        # Solo se prueba la regex donde aparece la primera palabra (find es C puro)
+        i = t.find(first)
+        while i != -1:
+            if rx.match(t, i):
+                out.add(k)
+                break
+            i = t.find(first, i + 1)
     return out
 # === NUEVO: helpers de evaluación de transcripciones ===
 
@@ -505,24 +1835,20 @@ def _jd_to_checklist(jd_text: str, max_items: int = 10) -> list[str]:
     except Exception:
         return []
 
-def _find_evidence(haystack: str, needle_words: list[str], window: int = 70) -> str:
+def _find_evidence(haystack: str, needle_words: list[str], window: int = 70, pattern=None) -> str:
     """
     Busca evidencia textual simple en la transcripción.
     Retorna un snippet corto con contexto si coincide alguna palabra relevante.
+    `pattern` es la regex ya compilada de _evidence_pattern(needle_words) (p.ej. la del JDProfile).
     """
     try:
         h = (haystack or "").lower()
-        idxs = []
-        for w in needle_words:
-            w2 = w.lower().strip()
-            if not w2 or len(w2) < 3:
-                continue
-            i = h.find(w2)
-            if i != -1:
-                idxs.append(i)
-        if not idxs:
+        if pattern is None:
+            pattern = _evidence_pattern(needle_words)
+        m = pattern.search(h) if pattern is not None else None
+        if m is None:
             return ""
-        i = min(idxs)
+        i = m.start()
         start = max(0, i - window)
         end = min(len(h), i + len(needle_words[0]) + window)
         snippet = haystack[start:end].replace("\n"," ")
@@ -535,24 +1861,20 @@ def _evaluate_transcript_rule_based(jd_text: str, transcript_text: str) -> dict:
     Fallback sin LLM: genera un checklist desde el JD y marca si hay evidencia
     (match de palabras clave) en la transcripción.
     """
-    items = _jd_to_checklist(jd_text, max_items=10)
+    profile = get_jd_profile(jd_text)
+    items = profile.checklist
     h = (transcript_text or "").lower()
     out_rows = []
     hits = 0
 
-    # Palabras de acción y del JD para buscar evidencia
-    for it in items:
-        # Palabras relevantes (>=4 chars), excluyendo stopwords sencillas
-        words = [w for w in re.findall(r"[A-Za-zÁÉÍÓÚáéíóúñÑ]{3,}", it) if w.lower() not in {
-            "para","con","del","los","las","por","una","uno","unos","unas","que",
-            "de","la","el","en","y","o","u","al","lo","su","sus","se","es","ser"
-        }]
-        found = any(w.lower() in h for w in words[:5])  # primeras 5 palabras “fuertes”
+    # Palabras de acción y del JD para buscar evidencia (precompiladas en el perfil)
+    for chk in items:
+        found = chk["found_rx"] is not None and chk["found_rx"].search(h) is not None
         if found:
             hits += 1
-        evidence = _find_evidence(transcript_text, words[:3])
+        evidence = _find_evidence(transcript_text, chk["words"][:3], pattern=chk["evidence_rx"])
         out_rows.append({
-            "check": it,
+            "check": chk["check"],
             "cumple": bool(found),
             "evidencia": evidence
         })
@@ -579,14 +1901,7 @@ def _evaluate_transcript_with_llm(jd_text: str, transcript_text: str) -> dict:
     if not _LC_AVAILABLE:
         return {}
 
-    _llm_setup_credentials()
     try:
-        llm = AzureChatOpenAI(
-            azure_deployment=st.secrets["llm"]["azure_deployment"],
-            api_version=st.secrets["llm"]["azure_api_version"],
-            temperature=0,
-            model_kwargs={"response_format": {"type": "json_object"}},
-        )
         schema = {
             "score": "0-100 entero",
             "verdict": "PASA a siguiente etapa / NO pasa",
@@ -616,13 +1931,12 @@ def _evaluate_transcript_with_llm(jd_text: str, transcript_text: str) -> dict:
                       "- Genera una checklist de 6 a 10 ítems a partir del JD (no inventes fuera del JD).\n"
                       "- Marca cada ítem como cumple/no, con evidencia literal (frase breve) si existe.\n"
                       "- Calcula score = porcentaje de ítems con evidencia (0-100) y verdict con umbral 70%.\n\n"
-                      f"JD:\n{jd_text}\n\n"
+                      f"JD:\n{get_jd_profile(jd_text).prompt_text}\n\n"
                       f"Transcripción:\n{transcript_text}"
                 ),
             },
         ]
-        resp = llm.invoke(prompt)
-        data = _safe_json_loads(getattr(resp, "content", "") if resp else "")
+        data = _safe_json_loads(llm_invoke(prompt, response_format="json_object"))
         # Validación mínima
         if not isinstance(data, dict) or "rows" not in data:
             return {}
@@ -634,7 +1948,9 @@ def _evaluate_transcript_with_llm(jd_text: str, transcript_text: str) -> dict:
         if data["score"] < 0 or data["score"] > 100:
             data["score"] = max(0, min(100, data["score"]))
         return {"mode":"llm", **data}
-    except Exception:
+    except Exception as e:
+        if _llm_config() is not None:
+            print(f"Error evaluating transcript with LLM (se usa evaluación por reglas): {e}")
         return {}
 
 def _evaluate_transcript(jd_text: str, transcript_text: str) -> dict:
@@ -681,17 +1997,54 @@ def _render_transcript_eval_panel(result: dict, jd_source_label: str):
             )
 
 def score_fit_by_skills(jd_text, must_list, nice_list, cv_text):
-    jd_skills = infer_skills(jd_text)
+    """jd_text puede ser el texto del JD o su JDProfile."""
+    return score_fit_batch(jd_text, must_list, nice_list, [cv_text])[0]
+
+def score_fit_batch(jd_text, must_list, nice_list, cv_texts):
+    """
+    Scoring de N CVs contra un mismo JD. El JD se analiza una vez y las skills
+    de los CVs se cruzan en una matriz booleana skills × candidatos (NumPy);
+    coberturas must/nice y extras salen de sumas por columna.
+    Devuelve [(score, explicación)] en el orden de cv_texts, igual que score_fit_by_skills.
+    jd_text puede ser el texto del JD o su JDProfile.
+    """
+    jd_skills = set(get_jd_profile(jd_text).skills)
     must=set([m.strip() for m in must_list if m.strip()]) or jd_skills
     nice=set([n.strip() for n in nice_list if n.strip()])-must
-    cv=infer_skills(cv_text)
-    mm=sorted(list(must&cv)); mn=sorted(list(nice&cv))
-    gm=sorted(list(must-cv)); gn=sorted(list(nice-cv))
-    extras=sorted(list((cv&(jd_skills|must|nice))-set(mm)-set(mn)))
-    cov_m=len(mm)/len(must) if must else 0
-    cov_n=len(mn)/len(nice) if nice else 0
-    sc=int(round(100*(0.65*cov_m+0.20*cov_n+0.15*min(len(extras),5)/5)))
-    return sc, {"matched_must":mm,"matched_nice":mn,"gaps_must":gm,"gaps_nice":gn,"extras":extras,"must_total":len(must),"nice_total":len(nice)}
+    extra_pool = jd_skills-must-nice
+    skills = sorted(must|nice|extra_pool)
+    if not cv_texts:
+        return []
+
+    # Un solo matcher (taxonomía completa) para todos los JD; solo cuentan las skills de este
+    matcher = skill_matcher()
+    only = frozenset(skills)
+    hits = np.zeros((len(skills), len(cv_texts)), dtype=bool)
+    row = {k: i for i, k in enumerate(skills)}
+    for j, txt in enumerate(cv_texts):
+        for k in _match_skills(txt, matcher, only):
+            hits[row[k], j] = True
+
+    in_must = np.array([k in must for k in skills], dtype=bool)
+    in_nice = np.array([k in nice for k in skills], dtype=bool)
+    in_extra = np.array([k in extra_pool for k in skills], dtype=bool)
+    n_mm = hits[in_must].sum(axis=0)
+    n_mn = hits[in_nice].sum(axis=0)
+    n_ex = hits[in_extra].sum(axis=0)
+    cov_m = n_mm/len(must) if must else np.zeros(len(cv_texts))
+    cov_n = n_mn/len(nice) if nice else np.zeros(len(cv_texts))
+    scores = np.rint(100*(0.65*cov_m+0.20*cov_n+0.15*np.minimum(n_ex,5)/5)).astype(int)
+
+    out = []
+    for j in range(len(cv_texts)):
+        col = hits[:, j]
+        mm = [k for k, h, m in zip(skills, col, in_must) if h and m]
+        mn = [k for k, h, n in zip(skills, col, in_nice) if h and n]
+        gm = [k for k, h, m in zip(skills, col, in_must) if m and not h]
+        gn = [k for k, h, n in zip(skills, col, in_nice) if n and not h]
+        extras = [k for k, h, e in zip(skills, col, in_extra) if h and e]
+        out.append((int(scores[j]), {"matched_must":mm,"matched_nice":mn,"gaps_must":gm,"gaps_nice":gn,"extras":extras,"must_total":len(must),"nice_total":len(nice)}))
+    return out
 
 def _safe_json_loads(raw: str) -> dict:
     try:
@@ -735,14 +2088,201 @@ def extract_jd_items(jd_text: str):
     # límite razonable
     return out[:30]
 
-def soft_match(item: str, transcript: str):
-    """Match suave por superposición de tokens; devuelve (ok, hits_tokens)."""
-    ni = _norm_txt(item)
-    nt = _norm_txt(transcript)
-    toks = [t for t in ni.split() if len(t) > 3]
-    hits = [t for t in toks if t in nt]
-    ok = (len(hits) >= 2) or (len(hits) / max(1, len(toks)) >= 0.4)
-    return ok, hits
+def _item_tokens(item: str) -> list:
+    """Tokens normalizados (>3 letras) con los que soft_match busca un ítem."""
+    return [t for t in _norm_txt(item).split() if len(t) > 3]
+
+def soft_match(item: str, transcript: str, toks=None):
+    """Match suave por superposición de tokens; devuelve (ok, hits_tokens).
+    `toks` permite pasar los tokens ya calculados del ítem (JDProfile.item_tokens)."""
+    return soft_match_batch([item], transcript, [toks] if toks is not None else None)[0]
+
+def soft_match_batch(items: list, transcript: str, item_tokens=None) -> list:
+    """
+    soft_match para todos los criterios contra una transcripción: se normaliza
+    una sola vez. Un token del ítem "aparece" si es substring del texto
+    normalizado; como no tiene espacios, basta buscarlo en el vocabulario
+    (palabras únicas unidas por saltos de línea), mucho más corto que el texto.
+    """
+    vocab = "\n".join(set(_norm_txt(transcript).split()))
+    seen = {}
+    out = []
+    for i, item in enumerate(items):
+        toks = item_tokens[i] if item_tokens is not None and item_tokens[i] is not None else _item_tokens(item)
+        hits = []
+        for t in toks:
+            found = seen.get(t)
+            if found is None:
+                found = seen[t] = t in vocab
+            if found:
+                hits.append(t)
+        ok = (len(hits) >= 2) or (len(hits) / max(1, len(toks)) >= 0.4)
+        out.append((ok, hits))
+    return out
+
+# ----------------- Perfil de JD (se analiza una sola vez) -----------------
+JD_PROFILE_CACHE_SIZE = 128
+_CHECK_STOPWORDS = frozenset({
+    "para","con","del","los","las","por","una","uno","unos","unas","que",
+    "de","la","el","en","y","o","u","al","lo","su","sus","se","es","ser"
+})
+
+def _evidence_pattern(words):
+    """Regex que ubica la primera aparición (en texto en minúsculas) de cualquiera de las palabras de >=3 letras."""
+    ws = [w.lower().strip() for w in words]
+    ws = [w for w in ws if len(w) >= 3]
+    if not ws:
+        return None
+    return re.compile("|".join(re.escape(w) for w in ws))
+
+class JDProfile:
+    """
+    Todo lo que los evaluadores derivan de un JD, calculado una vez:
+    texto normalizado y para prompts, skills, checklist con sus patrones de evidencia,
+    ítems de bullets y tokens por ítem. Se obtiene con get_jd_profile().
+    """
+
+    def __init__(self, jd_text: str, sha256: str = None):
+        self.text = jd_text or ""
+        self.sha256 = sha256 or hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+        self.norm_text = _norm_txt(self.text)
+        # Para prompts: sin espacios colgantes ni bloques de líneas en blanco
+        self.prompt_text = re.sub(r"\n{3,}", "\n\n", "\n".join(l.rstrip() for l in self.text.strip().splitlines()))
+        self.skills = frozenset(infer_skills(self.text))
+        self.items = extract_jd_items(self.text)
+        self.checklist = []
+        for it in _jd_to_checklist(self.text, max_items=10):
+            # Palabras relevantes (>=3 letras), excluyendo stopwords sencillas
+            words = [w for w in re.findall(r"[A-Za-zÁÉÍÓÚáéíóúñÑ]{3,}", it) if w.lower() not in _CHECK_STOPWORDS]
+            self.checklist.append({
+                "check": it,
+                "words": words,
+                "found_rx": _evidence_pattern(words[:5]),  # primeras 5 palabras “fuertes”
+                "evidence_rx": _evidence_pattern(words[:3]),
+            })
+        # El perfil es compartido entre sesiones: los memos se tocan bajo el lock
+        self._lock = threading.Lock()
+        self._item_tokens = {it: _item_tokens(it) for it in self.items}
+        self._keywords = None   # (texto, keywords, cuántas aparecen en el JD)
+
+    def item_tokens(self, item: str) -> list:
+        with self._lock:
+            toks = self._item_tokens.get(item)
+        if toks is None:
+            toks = _item_tokens(item)
+            with self._lock:
+                toks = self._item_tokens.setdefault(item, toks)
+        return toks
+
+    def keywords(self, kw_text: str) -> tuple:
+        """(keywords en minúsculas, cuántas aparecen en el JD) de un texto separado por comas."""
+        with self._lock:
+            memo = self._keywords
+        if memo is not None and memo[0] == kw_text:
+            return memo[1], memo[2]
+        kws = [k.strip().lower() for k in (kw_text or "").split(",") if k.strip()]
+        in_jd = sum(1 for k in kws if _norm_txt(k) and f" {_norm_txt(k)} " in f" {self.norm_text} ")
+        with self._lock:
+            self._keywords = (kw_text, kws, in_jd)
+        return kws, in_jd
+
+def get_jd_profile(jd_text) -> JDProfile:
+    """JDProfile por hash del contenido, compartido por proceso (LRU de JD_PROFILE_CACHE_SIZE)."""
+    if isinstance(jd_text, JDProfile):
+        return jd_text
+    sha = hashlib.sha256((jd_text or "").encode("utf-8")).hexdigest()
+    state = _process_state()
+    cache, lock = state["jd_profiles"], state["jd_profiles_lock"]
+    with lock:
+        profile = cache.get(sha)
+        if profile is not None:
+            cache.move_to_end(sha)
+            return profile
+    profile = JDProfile(jd_text, sha)
+    with lock:
+        cache[sha] = profile
+        cache.move_to_end(sha)
+        while len(cache) > JD_PROFILE_CACHE_SIZE:
+            cache.popitem(last=False)
+    return profile
+
+# ----------------- Evaluación de transcripciones persistida -----------------
+# Se guarda junto a la transcripción (transcripts/<id>.eval.json) con la clave
+# que la invalida: JD, texto, criterios y versión del evaluador.
+EVALUATOR_VERSION = "1"
+
+def _transcript_eval_path(tid: str) -> Path:
+    safe_id = re.sub(r"[^\w.-]", "_", str(tid))
+    return TRANSCRIPTS_DIR / f"{safe_id}.eval.json"
+
+def evaluate_transcript_fit(tx_text: str, jd_profile, must_list: list, nice_list: list) -> dict:
+    """Fit vs JD y checklist (obligatorios/deseables) de una transcripción."""
+    score, detail = score_fit_by_skills(jd_profile, must_list, nice_list, tx_text)
+
+    # 1) Lista de criterios (obligatorios/deseables)
+    items_must = [s for s in (must_list or []) if s.strip()]
+    items_nice = [s for s in (nice_list or []) if s.strip()]
+
+    # Fallback: si no hay presets, parsear bullets del JD como obligatorios
+    if not items_must and not items_nice:
+        items_must = list(jd_profile.items)
+
+    criteria = [("Obligatorio", it) for it in items_must] + [("Deseable", it) for it in items_nice]
+    matches = soft_match_batch(
+        [it for _, it in criteria],
+        tx_text,
+        [jd_profile.item_tokens(it) for _, it in criteria],
+    )
+    rows = []
+    ok_must = ok_nice = 0
+    for (tipo, it), (ok, hits) in zip(criteria, matches):
+        if tipo == "Obligatorio":
+            ok_must += int(ok)
+        else:
+            ok_nice += int(ok)
+        rows.append({
+            "Tipo": tipo,
+            "Criterio": it,
+            "Cumple": "✅" if ok else "❌",
+            "Evidencia (palabras clave)": ", ".join(hits) if hits else "—"
+        })
+    return {
+        "score": score, "detail": detail, "rows": rows,
+        "ok_must": ok_must, "ok_nice": ok_nice,
+        "tot_must": len(items_must), "tot_nice": len(items_nice),
+    }
+
+def load_transcript_eval(tid: str, tx_text: str, jd_profile, must_list: list, nice_list: list) -> dict:
+    """
+    evaluate_transcript_fit con persistencia: si la clave guardada coincide
+    es solo una lectura; si cambió el JD, el texto o el evaluador se recalcula
+    y se sobrescribe.
+    """
+    key = {
+        "transcript_id": tid,
+        "jd_sha256": jd_profile.sha256,
+        "text_sha256": hashlib.sha256((tx_text or "").encode("utf-8")).hexdigest(),
+        "criteria_sha256": hashlib.sha256(json.dumps([must_list, nice_list], ensure_ascii=False).encode("utf-8")).hexdigest(),
+        "evaluator_version": EVALUATOR_VERSION,
+    }
+    path = _transcript_eval_path(tid)
+    try:
+        cached = json.loads(path.read_text(encoding="utf-8"))
+        if cached.get("key") == key:
+            return cached["result"]
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error reading transcript evaluation {path}: {e}")
+
+    result = evaluate_transcript_fit(tx_text, jd_profile, must_list, nice_list)
+    try:
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps({"key": key, "result": result}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"Error saving transcript evaluation {path}: {e}")
+    return result
 # -------------------------------------------------------------------
 
 
@@ -849,37 +2389,242 @@ def render_pdf_viewer(file_bytes: bytes, height: int = 650, max_css_width: int =
         st.error(f"Error al preparar el visor PDF: {e}")
 
 
-def _extract_docx_bytes(b: bytes) -> str:
+# ===== Cache de extracción de texto (por SHA-256 del archivo) =====
+# Subir la versión invalida el cache cuando cambian los extractores.
+EXTRACTOR_VERSION = "3"
+EXTRACT_CACHE_DIR = DATA_DIR / "extract_cache"
+EXTRACT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+def _extract_cache() -> _DiskCache:
+    return _disk_cache("extract", EXTRACT_CACHE_DIR, EXTRACT_CACHE_MAX_BYTES)
+
+def _extract_cache_key(file_bytes: bytes, suffix: str) -> str:
+    content_sha = hashlib.sha256(file_bytes).hexdigest()
+    return hashlib.sha256(f"{EXTRACTOR_VERSION}:{suffix}:{content_sha}".encode("utf-8")).hexdigest()
+
+def extract_text_from_bytes(file_bytes, file_name: str) -> str:
+    """
+    Extrae texto de PDF/DOCX/TXT desde un buffer en memoria (bytes, memoryview
+    o el mmap de read_blob). Un archivo ya visto se sirve desde el cache.
+    """
+    suffix = Path(file_name).suffix.lower()
+    key = _extract_cache_key(file_bytes, suffix)
+    cached = _extract_cache().get(key)
+    if cached is not None:
+        return cached
     try:
-        with zipfile.ZipFile(io.BytesIO(b)) as z:
-            xml = z.read("word/document.xml").decode("utf-8", "ignore")
-            text = re.sub(r"<.*?>", " ", xml)
-            return re.sub(r"\s+", " ", text).strip()
-    except Exception:
+        text = extraction.extract_text(file_bytes, suffix)
+    except Exception as e:
+        print(f"Error extracting text from file {file_name}: {e}")
         return ""
+    _extract_cache().put(key, text)
+    return text
+
+# ===== Extracción en lote (pool de procesos) =====
+# Un pool por proceso (en _process_state) con workers "spawn": arrancan un
+# intérprete limpio, sin heredar los hilos, locks ni la conexión SQLite del
+# servidor. Cada worker toma un archivo a la vez; el plazo de ese archivo corre
+# desde que el worker lo recibe y, si se vence, el worker se termina y se
+# reemplaza sin afectar al resto.
+EXTRACT_WORKERS = max(1, os.cpu_count() or 1)
+EXTRACT_TIMEOUT_S = 60   # por archivo, desde que un worker lo toma
+
+class _ExtractPool:
+    """Workers persistentes (proceso + socket) que cada lote toma prestados."""
+    def __init__(self, size: int):
+        self.size = size
+        self.idle = []
+        self.alive = 0
+        self.cond = threading.Condition()
+
+    def _start(self) -> tuple:
+        # Proceso aparte con su propio punto de entrada (python -m extraction):
+        # no hereda ni re-ejecuta app.py. Si la app termina, el socket se
+        # cierra y el worker sale solo.
+        parent, child = socket.socketpair()
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "extraction", str(child.fileno())],
+                pass_fds=(child.fileno(),), stdin=subprocess.DEVNULL,
+                cwd=os.path.dirname(os.path.abspath(extraction.__file__)),
+            )
+        except Exception:
+            parent.close()
+            raise
+        finally:
+            child.close()
+        return proc, multiprocessing.connection.Connection(parent.detach())
+
+    def acquire(self, n: int, wait: bool = True) -> list:
+        """Hasta n workers libres; si wait, espera a tener al menos uno."""
+        with self.cond:
+            while True:
+                got = self.idle[:n]
+                del self.idle[:n]
+                while len(got) < n and self.alive < self.size:
+                    got.append(self._start())
+                    self.alive += 1
+                if got or not wait:
+                    return got
+                self.cond.wait()
+
+    def release(self, workers: list):
+        with self.cond:
+            for w in workers:
+                if w[0].poll() is None:
+                    self.idle.append(w)
+                else:
+                    w[1].close()
+                    self.alive -= 1
+            self.cond.notify_all()
+
+    def discard(self, worker: tuple):
+        """Termina un worker (plazo vencido o pipe roto) y libera su cupo."""
+        proc, conn = worker
+        proc.terminate()
+        try:
+            proc.wait(1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        conn.close()
+        with self.cond:
+            self.alive -= 1
+            self.cond.notify_all()
+
+def _extract_pool() -> _ExtractPool:
+    state = _process_state()
+    with state["extract_pool_lock"]:
+        if state["extract_pool"] is None:
+            state["extract_pool"] = _ExtractPool(EXTRACT_WORKERS)
+        return state["extract_pool"]
+
+def extract_texts_parallel(files: list, on_progress=None) -> list:
+    """
+    Extrae el texto de [(bytes, nombre), ...] repartiendo los archivos entre
+    los workers del pool. Retorna los textos en el mismo orden de entrada; None
+    si el archivo no se pudo leer o venció su plazo. Los archivos ya cacheados
+    no pasan por el pool. `on_progress(hechos, total)` se llama cada vez que
+    termina un archivo.
+    """
+    total = len(files)
+    results = [None] * total
+    pending = []
+    done = 0
+    for i, (file_bytes, file_name) in enumerate(files):
+        suffix = Path(file_name).suffix.lower()
+        key = _extract_cache_key(file_bytes, suffix)
+        cached = _extract_cache().get(key)
+        if cached is not None:
+            results[i] = cached
+            done += 1
+        else:
+            pending.append((i, file_bytes, suffix, key, file_name))
+    if on_progress:
+        on_progress(done, total)
+
+    def _finish(i, key, text):
+        nonlocal done
+        results[i] = text
+        if text is not None:
+            _extract_cache().put(key, text)
+        done += 1
+        if on_progress:
+            on_progress(done, total)
+
+    def _run_inline(i, file_bytes, suffix, key, file_name):
+        try:
+            _finish(i, key, extraction.extract_text(file_bytes, suffix))
+        except Exception as e:
+            print(f"Error extracting text from file {file_name}: {e}")
+            _finish(i, key, None)
+
+    n_workers = min(EXTRACT_WORKERS, len(pending))
+    if n_workers <= 1:
+        for job in pending:
+            _run_inline(*job)
+        return results
+
+    try:
+        pool = _extract_pool()
+        workers = pool.acquire(n_workers)
+    except Exception as e:
+        print(f"Error starting extraction pool, falling back to sequential: {e}")
+        for job in pending:
+            _run_inline(*job)
+        return results
+
+    jobs = deque(pending)
+    busy = {}   # conexión -> (worker, job, plazo)
+
+    def _drop(w):
+        workers.remove(w)
+        pool.discard(w)
+        # Reemplazo inmediato si el pool tiene cupo; si no, se sigue con los demás
+        workers.extend(pool.acquire(1, wait=False))
+
+    try:
+        while jobs or busy:
+            if jobs and not workers:
+                workers.extend(pool.acquire(1))
+            for w in workers:
+                if not jobs:
+                    break
+                if w[1] in busy:
+                    continue
+                job = jobs.popleft()
+                try:
+                    w[1].send((bytes(job[1]), job[2]))
+                    busy[w[1]] = (w, job, time.monotonic() + EXTRACT_TIMEOUT_S)
+                except Exception as e:
+                    print(f"Extraction worker failed for {job[4]}, retrying inline: {e}")
+                    _drop(w)
+                    _run_inline(*job)
+                    break
+            if not busy:
+                continue
+            wait_s = max(0.0, min(d for _, _, d in busy.values()) - time.monotonic())
+            for conn in multiprocessing.connection.wait(list(busy), timeout=wait_s):
+                w, job, _ = busy.pop(conn)
+                try:
+                    ok, value = conn.recv()
+                except Exception as e:
+                    # Fallo del worker (no del archivo): se reintenta en este proceso
+                    print(f"Extraction worker failed for {job[4]}, retrying inline: {e}")
+                    _drop(w)
+                    _run_inline(*job)
+                    continue
+                if not ok:
+                    print(f"Error extracting text from file {job[4]}: {value}")
+                _finish(job[0], job[3], value if ok else None)
+            now = time.monotonic()
+            for conn, (w, job, deadline) in list(busy.items()):
+                if deadline <= now:
+                    print(f"Timeout extracting text from file {job[4]}")
+                    del busy[conn]
+                    _drop(w)
+                    _finish(job[0], job[3], None)
+    finally:
+        # Un worker con respuesta pendiente (p. ej. el rerun cortó el lote) no vuelve al pool
+        for w, _, _ in busy.values():
+            workers.remove(w)
+            pool.discard(w)
+        pool.release(workers)
+    return results
+
+def _extract_progress_bar(label: str):
+    """Callback on_progress que actualiza un st.progress en vivo."""
+    bar = st.progress(0.0, text=label)
+    def _update(done, total):
+        bar.progress(done / max(1, total), text=f"{label} ({done}/{total})")
+    return _update
 
 def extract_text_from_file(uploaded_file) -> str:
     try:
-        suffix = Path(uploaded_file.name).suffix.lower()
         file_bytes = uploaded_file.read(); uploaded_file.seek(0)
-        if suffix == ".pdf":
-            pdf_reader = PdfReader(io.BytesIO(file_bytes))
-            text = ""
-            for page in pdf_reader.pages:
-                try:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                except Exception as page_e:
-                    print(f"Error extracting text from PDF page: {page_e}")
-            return text
-        elif suffix == ".docx":
-            return _extract_docx_bytes(file_bytes)
-        else:
-            return file_bytes.decode("utf-8", errors="ignore")
     except Exception as e:
         print(f"Error extracting text from file {uploaded_file.name}: {e}")
         return ""
+    return extract_text_from_bytes(file_bytes, uploaded_file.name)
 
 def _max_years(t):
     t=t.lower(); years=0
@@ -893,50 +2638,19 @@ def extract_meta(text):
     t=text.lower(); years=_max_years(t)
     return {"universidad":"—","anios_exp":years,"titulo":"—","ubicacion":"—","ultima_actualizacion":date.today().isoformat()}
 
-def simple_score(cv_text: str, jd: str, keywords: str) -> tuple[int, str]:
+def simple_score(cv_text: str, jd, keywords: str) -> tuple[int, str]:
+    """jd puede ser el texto del JD o su JDProfile; las keywords se parsean una vez por perfil."""
     base = 0; reasons = []
     text_low = (cv_text or "").lower()
-    kws = [k.strip().lower() for k in (keywords or "").split(",") if k.strip()]
+    kws, in_jd = get_jd_profile(jd).keywords(keywords)
     hits = sum(1 for k in kws if k in text_low)
     if kws:
         base += int((hits/len(kws))*70)
         reasons.append(f"{hits}/{len(kws)} keywords encontradas")
+        reasons.append(f"{in_jd} presentes en el JD")
     base = max(0, min(100, base))
     return base, " — ".join(reasons)
 
-def calculate_analytics(candidates):
-    if not candidates:
-        return {"avg_fit": 0, "time_to_hire": "—", "source_counts": {}, "funnel_data": pd.DataFrame()}
-    jd = ss.get("last_jd_text", "")
-    preset = ROLE_PRESETS.get(ss.get("last_role", ""), {})
-    must, nice = preset.get("must", []), preset.get("nice", [])
-    fits = []; source_counts = {}; stage_counts = {stage: 0 for stage in PIPELINE_STAGES}; tths = []
-    for c in candidates:
-        txt = c.get("_text") or (c.get("_bytes") or b"").decode("utf-8", "ignore")
-        f, _ = score_fit_by_skills(jd, must, nice, txt or "")
-        fits.append(f)
-        source = c.get("source", "Carga Manual"); source_counts[source] = source_counts.get(source, 0) + 1
-        stage_counts[c.get("stage", PIPELINE_STAGES[0])] += 1
-        if c.get("stage") == "Contratado" and c.get("load_date"):
-            try:
-                load_date = datetime.fromisoformat(c["load_date"])
-                hire_date = datetime.now()
-                tths.append((hire_date - load_date).days)
-            except ValueError:
-                print(f"Invalid date format for candidate {c.get('id')}: {c.get('load_date')}")
-    avg_fit = round(sum(fits) / len(fits), 1) if fits else 0
-    time_to_hire = f"{round(sum(tths) / len(tths), 1)} días" if tths else "—"
-    funnel_data = pd.DataFrame({
-        "Fase": PIPELINE_STAGES,
-        "Candidatos": [stage_counts.get(stage, 0) for stage in PIPELINE_STAGES]
-    })
-    return {
-        "avg_fit": avg_fit,
-        "time_to_hire": time_to_hire,
-        "funnel_data": funnel_data,
-        "source_counts": source_counts
-    }
-
 # ====== Helpers de TAREAS ======
 def _status_pill(s: str)->str:
     colors = {
@@ -967,8 +2681,8 @@ def _position_status_pill(s: str) -> str:
     s_safe = s if s in POSITION_STATUSES else "Abierto"
     return f'<span class="pos-badge pos-badge-{s_safe}">{s_safe}</span>'
 
-def create_task_from_flow(name:str, due_date:date, desc:str, assigned:str="Coordinador RR.HH.", status:str="Pendiente", priority:str="Media", context:dict=None):
-    t = {
+def _flow_task(name:str, due_date:date, desc:str, assigned:str="Coordinador RR.HH.", status:str="Pendiente", priority:str="Media", context:dict=None) -> dict:
+    return {
         "id": str(uuid.uuid4()),
         "titulo": f"Ejecutar flujo: {name}",
         "desc": desc or "Tarea generada desde Flujos.",
@@ -979,12 +2693,21 @@ def create_task_from_flow(name:str, due_date:date, desc:str, assigned:str="Coord
         "created_at": date.today().isoformat(),
         "context": context or {}
     }
-    if not isinstance(ss.tasks, list): ss.tasks = []
-    ss.tasks.insert(0, t)
-    save_tasks(ss.tasks)
 
-def create_manual_task(title, desc, due_date, assigned_to, priority, context:dict=None):
-    t = {
+def create_task_from_flow(name:str, due_date:date, desc:str, assigned:str="Coordinador RR.HH.", status:str="Pendiente", priority:str="Media", context:dict=None):
+    t = _flow_task(name, due_date, desc, assigned, status, priority, context)
+    save_task(t)
+    log_task_status(t)
+
+def create_tasks_batch(tasks: list):
+    """Alta de varias tareas con una sola escritura (mismo orden que create_task_from_flow una a una)."""
+    if not tasks:
+        return
+    save_records(TASKS_FILE, tasks[::-1])
+    log_events([{"type": "task", "task": t["id"], "to": t["status"]} for t in tasks])
+
+def _manual_task(title, desc, due_date, assigned_to, priority, context:dict=None) -> dict:
+    return {
         "id": str(uuid.uuid4()),
         "titulo": title,
         "desc": desc,
@@ -995,9 +2718,11 @@ def create_manual_task(title, desc, due_date, assigned_to, priority, context:dic
         "created_at": date.today().isoformat(),
         "context": context or {"source": "Manual"}
     }
-    if not isinstance(ss.tasks, list): ss.tasks = []
-    ss.tasks.insert(0, t)
-    save_tasks(ss.tasks)
+
+def create_manual_task(title, desc, due_date, assigned_to, priority, context:dict=None):
+    t = _manual_task(title, desc, due_date, assigned_to, priority, context)
+    save_task(t)
+    log_task_status(t)
 
 # Helper callback de acciones de flujo
 def _handle_flow_action_change(wf_id):
@@ -1041,10 +2766,311 @@ def _handle_position_action_change(pos_id):
 
     ss[action_key] = "Selecciona..."
 
+# ===== Eventos y analytics =====
+# Log append-only (una línea JSON por evento) de cambios de etapa de candidatos,
+# cambios de estado de tareas y evaluaciones. Los agregados del dashboard se
+# mantienen por delta: cada lectura solo procesa los eventos nuevos desde el
+# último offset, y un snapshot en disco evita re-leer la historia al reiniciar.
+EVENTS_FILE = DATA_DIR / "events.jsonl"
+ANALYTICS_FILE = DATA_DIR / "analytics.json"
+ANALYTICS_SNAPSHOT_EVERY = 500
+ANALYTICS_BIN_BASE = 1.1  # histogramas log: ~10% de error en los percentiles
+INTERVIEW_STAGES = ("Entrevista Telefónica", "Entrevista Gerencia")
+# Los puntajes por reglas ("cv", al dar de alta candidatos) y los del LLM
+# ("llm") no son comparables: el fit del dashboard usa solo uno de los dos
+ANALYTICS_FIT_KIND = "cv"
+
+def _actor() -> str:
+    auth = ss.get("auth") or {}
+    return auth.get("name") or auth.get("username") or "Sistema"
+
+def _backfill_events(skip: list) -> list:
+    """
+    Datos previos al log de eventos: el estado actual queda como punto de
+    partida. Se omiten los candidatos/tareas que ya vienen en `skip`.
+    """
+    cands = {e.get("cand") for e in skip if e.get("type") == "stage"}
+    tasks = {e.get("task") for e in skip if e.get("type") == "task"}
+    prev = [c for c in ss.get("candidates") or [] if c.get("id") not in cands]
+    return ([{**_stage_event(c, c.get("stage")), **({"ts": c["load_date"]} if c.get("load_date") else {})} for c in prev]
+            + [{"type": "eval", "kind": "cv", "role": c.get("Role"), "score": c.get("Score")} for c in prev]
+            + [{"type": "task", "task": t.get("id"), "to": t.get("status"), **({"ts": t["created_at"]} if t.get("created_at") else {})}
+               for t in ss.get("tasks") or [] if isinstance(t, dict) and t.get("id") not in tasks])
+
+def log_events(events: list):
+    """
+    Agrega eventos al log en una sola escritura. Cada evento: {"type": "stage"|"task"|"eval"|"prefilter", ...}.
+    Si el log aún no existe, se crea primero con el estado actual (una sola vez
+    por instalación: el chequeo se repite dentro del lock).
+    """
+    base = {"ts": datetime.now().isoformat(timespec="seconds"), "actor": _actor()}
+    try:
+        with _process_state()["events_lock"]:
+            if not EVENTS_FILE.exists():
+                events = _backfill_events(events) + list(events)
+            if not events:
+                return
+            lines = "".join(json.dumps({**base, **e}, ensure_ascii=False) + "\n" for e in events)
+            with EVENTS_FILE.open("a", encoding="utf-8") as fh:
+                fh.write(lines)
+    except Exception as e:
+        print(f"Error writing events: {e}")
+
+def _dur_bin(seconds: float) -> int:
+    return int(math.log1p(max(0.0, seconds) / 60) / math.log(ANALYTICS_BIN_BASE))
+
+def _bin_days(b: int) -> float:
+    return 60 * (ANALYTICS_BIN_BASE ** (b + 0.5) - 1) / 86400
+
+def _hist_percentile(hist: Counter, q: float):
+    """Percentil (en días) a partir de un histograma de bins log; None si está vacío."""
+    total = sum(hist.values())
+    if not total:
+        return None
+    acc, target = 0, q * total
+    for b in sorted(hist):
+        acc += hist[b]
+        if acc >= target:
+            return round(_bin_days(b), 1)
+
+class _Analytics:
+    """Agregados incrementales sobre el log de eventos."""
+    def __init__(self, data: dict = None):
+        d = data or {}
+        self.offset = d.get("offset", 0)
+        self.reached = Counter(d.get("reached", {}))    # etapa -> candidatos que llegaron alguna vez
+        self.current = Counter(d.get("current", {}))    # etapa -> candidatos hoy
+        self.cands = d.get("cands", {})                 # id -> [etapa, desde, alta, etapas alcanzadas]
+        self.in_stage = {k: Counter({int(b): n for b, n in h.items()}) for k, h in d.get("in_stage", {}).items()}
+        self.milestones = {k: Counter({int(b): n for b, n in d.get("milestones", {}).get(k, {}).items()})
+                           for k in ("interview", "offer", "hire")}
+        self.tasks = Counter(d.get("tasks", {}))        # estado -> tareas
+        self.task_state = d.get("task_state", {})       # id -> estado
+        self.fit = d.get("fit_by_kind", {})             # tipo ("cv"/"llm") -> puesto -> [suma, n]
+        self.actors = d.get("actors", {})               # actor -> {"moves", "hires", "tasks_done"}
+        self.pending = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "offset": self.offset, "reached": self.reached, "current": self.current, "cands": self.cands,
+            "in_stage": self.in_stage, "milestones": self.milestones, "tasks": self.tasks,
+            "task_state": self.task_state, "fit_by_kind": self.fit, "actors": self.actors,
+        }
+
+    def _actor_stats(self, actor: str) -> dict:
+        return self.actors.setdefault(actor or "Sistema", {"moves": 0, "hires": 0, "tasks_done": 0})
+
+    def apply(self, ev: dict):
+        kind = ev.get("type")
+        try:
+            ts = datetime.fromisoformat(ev["ts"]).timestamp()
+        except Exception:
+            return
+        if kind == "stage":
+            cid, to = ev.get("cand"), ev.get("to")
+            state = self.cands.get(cid)
+            if state:
+                self.current[state[0]] -= 1
+                self.in_stage.setdefault(state[0], Counter())[_dur_bin(ts - state[1])] += 1
+            if to is None:
+                self.cands.pop(cid, None)
+                return
+            if not state:
+                state = self.cands[cid] = [to, ts, ts, []]
+            else:
+                self._actor_stats(ev.get("actor"))["moves"] += 1
+            state[0], state[1] = to, ts
+            self.current[to] += 1
+            if to not in state[3]:
+                state[3].append(to)
+                self.reached[to] += 1
+                since_created = ts - state[2]
+                if to in INTERVIEW_STAGES and not any(s in state[3][:-1] for s in INTERVIEW_STAGES):
+                    self.milestones["interview"][_dur_bin(since_created)] += 1
+                elif to == "Oferta":
+                    self.milestones["offer"][_dur_bin(since_created)] += 1
+                elif to == "Contratado":
+                    self.milestones["hire"][_dur_bin(since_created)] += 1
+                    self._actor_stats(ev.get("actor"))["hires"] += 1
+        elif kind == "task":
+            tid, to = ev.get("task"), ev.get("to")
+            old = self.task_state.pop(tid, None)
+            if old:
+                self.tasks[old] -= 1
+            if to:
+                self.task_state[tid] = to
+                self.tasks[to] += 1
+                if to == "Completada" and old != "Completada":
+                    self._actor_stats(ev.get("actor"))["tasks_done"] += 1
+        elif kind == "eval":
+            try:
+                score = float(ev.get("score"))
+            except (TypeError, ValueError):
+                return
+            by_role = self.fit.setdefault(ev.get("kind") or "cv", {})
+            acc = by_role.setdefault(ev.get("role") or "—", [0.0, 0])
+            acc[0] += score; acc[1] += 1
+
+    def catch_up(self) -> int:
+        """Aplica los eventos agregados al log desde el último offset."""
+        try:
+            size = EVENTS_FILE.stat().st_size if EVENTS_FILE.exists() else 0
+        except OSError:
+            return 0
+        if size < self.offset:  # el log fue reemplazado: se reconstruye
+            self.__init__()
+        if size == self.offset:
+            return 0
+        with EVENTS_FILE.open("rb") as fh:
+            fh.seek(self.offset)
+            chunk = fh.read(size - self.offset)
+        end = chunk.rfind(b"\n") + 1  # una línea a medio escribir se lee en la próxima vuelta
+        n = 0
+        for line in chunk[:end].splitlines():
+            try:
+                self.apply(json.loads(line))
+                n += 1
+            except ValueError:
+                continue
+        self.offset += end
+        self.pending += n
+        return n
+
+    def summary(self) -> dict:
+        funnel_stages = [s for s in PIPELINE_STAGES if s != "Descartado"]
+        fit = self.fit.get(ANALYTICS_FIT_KIND, {})
+        fit_n = sum(n for _, n in fit.values())
+        return {
+            "funnel": [(s, self.reached.get(s, 0)) for s in funnel_stages],
+            "current": {s: self.current.get(s, 0) for s in PIPELINE_STAGES},
+            "offer_to_hire": (self.reached["Contratado"] / self.reached["Oferta"]) if self.reached.get("Oferta") else None,
+            "milestones": {k: (_hist_percentile(h, .5), _hist_percentile(h, .9)) for k, h in self.milestones.items()},
+            "in_stage": {s: (_hist_percentile(self.in_stage.get(s, Counter()), .5),
+                             _hist_percentile(self.in_stage.get(s, Counter()), .9)) for s in PIPELINE_STAGES},
+            "avg_fit": round(sum(v for v, _ in fit.values()) / fit_n, 1) if fit_n else None,
+            "fit_by_role": {r: (n, round(v / n, 1)) for r, (v, n) in fit.items() if n},
+            "tasks": dict(self.tasks),
+            "actors": self.actors,
+        }
+
+def _write_analytics_snapshot(agg: _Analytics):
+    try:
+        tmp = ANALYTICS_FILE.with_name(f"{ANALYTICS_FILE.name}.{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps(agg.to_dict(), ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, ANALYTICS_FILE)
+        agg.pending = 0
+    except Exception as e:
+        print(f"Error saving analytics snapshot: {e}")
+
+def analytics() -> _Analytics:
+    """Agregados al día: snapshot + eventos nuevos del log (los de otros procesos incluidos)."""
+    state = _process_state()
+    with state["analytics_lock"]:
+        agg = state["analytics"]
+        if agg is None:
+            data = None
+            if ANALYTICS_FILE.exists():
+                try:
+                    data = json.loads(ANALYTICS_FILE.read_text(encoding="utf-8"))
+                except Exception as e:
+                    print(f"Error reading analytics snapshot: {e}")
+            if data and "fit_by_kind" not in data:
+                data = None  # snapshot anterior (fit sin separar por tipo): se rearma desde el log
+            agg = state["analytics"] = _Analytics(data)
+        log_events([])  # crea el log con el estado actual si aún no existe
+        agg.catch_up()
+        if agg.pending >= ANALYTICS_SNAPSHOT_EVERY:
+            _write_analytics_snapshot(agg)
+        return agg
+
+def _stage_event(c: dict, to, frm=None) -> dict:
+    return {"type": "stage", "cand": c.get("id"), "role": c.get("Role"), "from": frm, "to": to}
+
+def log_task_status(task: dict):
+    log_events([{"type": "task", "task": task.get("id"), "to": task.get("status")}])
+
+# ===== Conteos por puesto =====
+# Cada puesto guarda cuántos candidatos tiene por etapa (stage_counts) y los
+# derivados de la tabla (Leads / Nuevos). Se actualizan por delta al crear
+# o mover candidatos; la tabla de Puestos solo los lee. Escribir candidatos y
+# aplicar su delta es una sola sección crítica (position_counts_lock) que lee
+# la copia compartida más reciente, no la de la sesión: dos sesiones que
+# mueven a la vez no parten de los mismos conteos.
+NEW_LEAD_STAGES = ("Recibido", "Screening RRHH")
+
+def _counts_lock():
+    return _process_state()["position_counts_lock"]
+
+def _latest_positions() -> list:
+    return shared_collection(POSITIONS_FILE, _load_positions_checked)[0]
+
+def _latest_candidates() -> list:
+    return shared_collection(CANDIDATES_FILE, load_candidates)[0] or []
+
+def _set_position_totals(pos: dict, counts: dict):
+    pos["stage_counts"] = {k: v for k, v in counts.items() if v}
+    pos["counts_role"] = pos.get("Puesto")
+    pos["Leads"] = sum(pos["stage_counts"].values())
+    pos["Nuevos"] = sum(pos["stage_counts"].get(s, 0) for s in NEW_LEAD_STAGES)
+
+def _position_counts_stale(pos: dict) -> bool:
+    # Sin conteos (puesto nuevo o datos anteriores) o renombrado desde el último conteo
+    return "stage_counts" not in pos or pos.get("counts_role") != pos.get("Puesto")
+
+def apply_position_deltas(deltas: Counter):
+    """deltas: (puesto, etapa) -> +n/-n. Persiste solo los puestos afectados, en una escritura."""
+    with _counts_lock():
+        by_role = {}
+        for pos in _latest_positions():
+            if not _position_counts_stale(pos):
+                by_role.setdefault(pos.get("Puesto"), []).append(pos)
+        touched = {}
+        for (role, stage), n in deltas.items():
+            for pos in (by_role.get(role, []) if n else []):
+                upd = touched.setdefault(pos["ID"], dict(pos))
+                counts = dict(upd["stage_counts"])
+                counts[stage] = max(0, counts.get(stage, 0) + n)
+                _set_position_totals(upd, counts)
+        if touched:
+            save_records(POSITIONS_FILE, list(touched.values()))
+
+def refresh_position_counts():
+    """Recuenta desde cero solo los puestos sin conteos vigentes (una pasada por los candidatos)."""
+    if not any(_position_counts_stale(p) for p in ss.positions):
+        return
+    with _counts_lock():
+        stale = [dict(p) for p in _latest_positions() if _position_counts_stale(p)]
+        if not stale:
+            return
+        by_role = {}
+        for c in _latest_candidates():
+            role_counts = by_role.setdefault(c.get("Role"), Counter())
+            role_counts[c.get("stage", PIPELINE_STAGES[0])] += 1
+        for pos in stale:
+            _set_position_totals(pos, by_role.get(pos.get("Puesto"), {}))
+        save_records(POSITIONS_FILE, stale)
+
+def save_position_fields(pos_id, fields: dict):
+    """Edita campos de un puesto sobre su versión más reciente, sin pisar los conteos."""
+    with _counts_lock():
+        cur = next((p for p in _latest_positions() if p.get("ID") == pos_id), None)
+        if cur is not None:
+            save_position({**cur, **fields})
+
+def add_candidates(cands: list):
+    """Alta de candidatos: una escritura y conteos de puesto por delta."""
+    if not cands:
+        return
+    with _counts_lock():
+        save_candidates_batch(cands)
+        apply_position_deltas(Counter((c.get("Role"), c.get("stage")) for c in cands))
+    log_events([_stage_event(c, c.get("stage")) for c in cands]
+               + [{"type": "eval", "kind": "cv", "role": c.get("Role"), "score": c.get("Score")} for c in cands])
+
 # =========================================================
 # INICIALIZACIÓN DE CANDIDATOS
 # =========================================================
-if "candidate_init" not in ss:
+if "candidate_init" not in ss and not _store(CANDIDATES_FILE).exists():
     initial_candidates = [
         {"Name": "CV_AnaLopez.pdf",   "Score": 85, "Role": "Business Analytics",                "source": "LinkedIn Jobs"},
         {"Name": "CV_LuisGomez.pdf",  "Score": 42, "Role": "Business Analytics",                "source": "Computrabajo"},
@@ -1056,16 +3082,16 @@ if "candidate_init" not in ss:
         c["id"] = f"C{i+1}-{random.randint(1000, 9999)}"
         c["stage"] = PIPELINE_STAGES[random.choice([0, 1, 1, 2, 6])]
         c["load_date"] = (date.today() - timedelta(days=random.randint(5, 30))).isoformat()
-        c["_bytes"] = DUMMY_PDF_BYTES
+        text = f"CV de {c['Name']}. Experiencia 5 años. Skills: SQL, Power BI, Python, Excel. Candidato {c['Name']}."
+        c.update(candidate_files(DUMMY_PDF_BYTES, text))
         c["_is_pdf"] = True
-        c["_text"] = f"CV de {c['Name']}. Experiencia 5 años. Skills: SQL, Power BI, Python, Excel. Candidato {c['Name']}."
-        c["meta"] = extract_meta(c["_text"])
+        c["meta"] = extract_meta(text)
         if c["stage"] == "Descartado":
             c["Score"] = random.randint(20, 34)
         if c["stage"] == "Contratado":
             c["Score"] = 95
         candidates_list.append(c)
-    ss.candidates = candidates_list
+    add_candidates(candidates_list)
     ss.candidate_init = True
 
 # =========================================================
@@ -1209,21 +3235,23 @@ def page_def_carga():
 
     if files and st.button("Procesar CVs y Enviar a Pipeline (Carga Manual)"):
         new_candidates = []
+        payload = []
         for f in files:
             b = f.read(); f.seek(0)
-            text = extract_text_from_file(f)
-            must_list = [s.strip() for s in (preset.get("must",[]) or []) if s.strip()]
-            nice_list = [s.strip() for s in (preset.get("nice",[]) or []) if s.strip()]
-            score, exp = score_fit_by_skills(jd_text, must_list, nice_list, text)
+            payload.append((b, f.name))
+        texts = [t or "" for t in extract_texts_parallel(payload, _extract_progress_bar("Extrayendo texto de los CVs"))]
+        must_list = [s.strip() for s in (preset.get("must",[]) or []) if s.strip()]
+        nice_list = [s.strip() for s in (preset.get("nice",[]) or []) if s.strip()]
+        scored = score_fit_batch(jd_text, must_list, nice_list, texts)
+        for f, (b, _), text, (score, exp) in zip(files, payload, texts, scored):
             c = {
                 "id": f"C{len(ss.candidates)+len(new_candidates)+1}-{int(datetime.now().timestamp())}",
                 "Name": f.name,
                 "Score": score,
                 "Role": puesto,
                 "Role_ID": id_puesto,
-                "_bytes": b,
+                **candidate_files(b, text),
                 "_is_pdf": Path(f.name).suffix.lower()==".pdf",
-                "_text": text,
                 "meta": extract_meta(text),
                 "stage": PIPELINE_STAGES[0],
                 "load_date": date.today().isoformat(),
@@ -1232,9 +3260,9 @@ def page_def_carga():
             }
             new_candidates.append(c)
         for c in new_candidates:
-            if c["Score"] < 35:
+            if c["Score"] < PREFILTER_MIN_SCORE:
                 c["stage"] = "Descartado"
-            ss.candidates.append(c)
+        add_candidates(new_candidates)
         st.success(f"CVs cargados, analizados y {len(new_candidates)} enviados al Pipeline.")
         st.rerun()
 
@@ -1247,36 +3275,37 @@ def page_def_carga():
 
         if st.button("Traer CVs (con Scoring)"):
             new_candidates = []
-            for board in srcs:
-                for i in range(1, int(qty)+1):
-                    txt = (
-                        f"CV extraído de {board} para {puesto}. "
-                        f"Skills: SQL, Python, Excel. Años de experiencia: {random.randint(2, 10)}."
-                    )
-                    must_list = [s.strip() for s in (preset.get("must",[]) or []) if s.strip()]
-                    nice_list = [s.strip() for s in (preset.get("nice",[]) or []) if s.strip()]
-                    score, exp = score_fit_by_skills(jd_text, must_list, nice_list, txt)
-                    c = {
-                        "id": f"C{len(ss.candidates)+len(new_candidates)+1}-{int(datetime.now().timestamp())}",
-                        "Name":f"{board}_Candidato_{i:02d}.pdf",
-                        "Score": score,
-                        "Role": puesto,
-                        "Role_ID": id_puesto,
-                        "_bytes": DUMMY_PDF_BYTES,
-                        "_is_pdf": True,
-                        "_text": txt,
-                        "meta": extract_meta(txt),
-                        "stage": PIPELINE_STAGES[0],
-                        "load_date": date.today().isoformat(),
-                        "_exp": exp,
-                        "source": board
-                    }
-                    new_candidates.append(c)
+            sourced = [
+                (board, i, (
+                    f"CV extraído de {board} para {puesto}. "
+                    f"Skills: SQL, Python, Excel. Años de experiencia: {random.randint(2, 10)}."
+                ))
+                for board in srcs for i in range(1, int(qty)+1)
+            ]
+            must_list = [s.strip() for s in (preset.get("must",[]) or []) if s.strip()]
+            nice_list = [s.strip() for s in (preset.get("nice",[]) or []) if s.strip()]
+            scored = score_fit_batch(jd_text, must_list, nice_list, [txt for _, _, txt in sourced])
+            for (board, i, txt), (score, exp) in zip(sourced, scored):
+                c = {
+                    "id": f"C{len(ss.candidates)+len(new_candidates)+1}-{int(datetime.now().timestamp())}",
+                    "Name":f"{board}_Candidato_{i:02d}.pdf",
+                    "Score": score,
+                    "Role": puesto,
+                    "Role_ID": id_puesto,
+                    **candidate_files(DUMMY_PDF_BYTES, txt),
+                    "_is_pdf": True,
+                    "meta": extract_meta(txt),
+                    "stage": PIPELINE_STAGES[0],
+                    "load_date": date.today().isoformat(),
+                    "_exp": exp,
+                    "source": board
+                }
+                new_candidates.append(c)
 
             for c in new_candidates:
-                if c["Score"] < 35:
+                if c["Score"] < PREFILTER_MIN_SCORE:
                     c["stage"] = "Descartado"
-                ss.candidates.append(c)
+            add_candidates(new_candidates)
             st.success(f"Importados {len(new_candidates)} CVs de portales. Enviados al Pipeline.")
             st.rerun()
 
@@ -1290,6 +3319,332 @@ def _llm_setup_credentials():
     except Exception:
         pass
 
+# ===== Clientes LLM compartidos =====
+# Un cliente por (deployment, api_version, response_format) y proceso, todos
+# sobre el mismo pool httpx keep-alive: evaluar un documento no crea clientes,
+# ni vuelve a leer credenciales, ni abre conexiones/TLS nuevas. Las llamadas
+# asíncronas corren en un único event loop de fondo, así el pool async también
+# se reutiliza entre lotes.
+LLM_HTTP_LIMITS = {"max_connections": 32, "max_keepalive_connections": 16, "keepalive_expiry": 120}
+LLM_HTTP_TIMEOUT = 60
+LLM_DEFAULT_CONCURRENCY = 8
+
+def _llm_loop() -> asyncio.AbstractEventLoop:
+    state = _process_state()
+    with state["llm_lock"]:
+        if state["llm_loop"] is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-loop", daemon=True).start()
+            state["llm_loop"] = loop
+        return state["llm_loop"]
+
+def llm_concurrency_default() -> int:
+    try:
+        return max(1, int(st.secrets["llm"].get("max_concurrency", LLM_DEFAULT_CONCURRENCY)))
+    except Exception:
+        return LLM_DEFAULT_CONCURRENCY
+
+def _llm_config():
+    """(deployment, api_version) de st.secrets; None si no hay configuración."""
+    try:
+        return st.secrets["llm"]["azure_deployment"], st.secrets["llm"]["azure_api_version"]
+    except Exception:
+        return None
+
+def llm_client(response_format: str = None, temperature: float = 0):
+    """Cliente AzureChatOpenAI compartido; None si faltan paquetes o configuración."""
+    cfg = _llm_config() if _LC_AVAILABLE else None
+    if cfg is None:
+        return None
+    key = (*cfg, response_format, temperature)
+    state = _process_state()
+    with state["llm_lock"]:
+        stats = state["llm_stats"]
+        client = state["llm_clients"].get(key)
+        if client is not None:
+            stats["clients_reused"] += 1
+            return client
+        t0 = time.perf_counter()
+        _llm_setup_credentials()
+        if state["llm_http"] is None:
+            state["llm_http"] = httpx.Client(limits=httpx.Limits(**LLM_HTTP_LIMITS), timeout=LLM_HTTP_TIMEOUT)
+            state["llm_ahttp"] = httpx.AsyncClient(limits=httpx.Limits(**LLM_HTTP_LIMITS), timeout=LLM_HTTP_TIMEOUT)
+        extra = {"model_kwargs": {"response_format": {"type": response_format}}} if response_format else {}
+        client = AzureChatOpenAI(
+            azure_deployment=cfg[0],
+            api_version=cfg[1],
+            temperature=temperature,
+            http_client=state["llm_http"],
+            http_async_client=state["llm_ahttp"],
+            max_retries=0,  # los reintentos los maneja _llm_retry_delay, con el limitador
+            **extra,
+        )
+        state["llm_clients"][key] = client
+        stats["clients_built"] += 1
+        stats["build_ms"] += (time.perf_counter() - t0) * 1000
+        return client
+
+# Cache de respuestas en disco: solo llamadas deterministas (temperature=0).
+# Clave = hash de (mensajes normalizados, deployment, api_version, temperature,
+# response_format); cada entrada guarda su fecha para el TTL.
+LLM_CACHE_DIR = DATA_DIR / "llm_cache"
+LLM_CACHE_MAX_BYTES = 64 * 1024 * 1024
+LLM_CACHE_TTL = timedelta(days=7)
+
+def _llm_cache() -> _DiskCache:
+    return _disk_cache("llm", LLM_CACHE_DIR, LLM_CACHE_MAX_BYTES)
+
+def _norm_message(m) -> dict:
+    if isinstance(m, dict):
+        role, content = m.get("role", ""), m.get("content", "")
+    else:  # BaseMessage de LangChain
+        role, content = getattr(m, "type", ""), getattr(m, "content", "")
+    if isinstance(content, str):
+        content = content.replace("\r\n", "\n").strip()
+    return {"role": role, "content": content}
+
+def _llm_cache_key(messages, response_format, temperature):
+    if temperature != 0:
+        return None
+    cfg = _llm_config()
+    payload = json.dumps(
+        [[_norm_message(m) for m in messages], cfg, temperature, response_format],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _llm_cache_get(key):
+    if key is None:
+        return None
+    stats = _process_state()["llm_stats"]
+    raw = _llm_cache().get(key)
+    try:
+        entry = json.loads(raw) if raw else None
+        if entry and datetime.now() - datetime.fromisoformat(entry["at"]) <= LLM_CACHE_TTL:
+            stats["cache_hits"] += 1
+            return entry["content"]
+    except Exception:
+        pass
+    stats["cache_misses"] += 1
+    return None
+
+def _llm_cache_put(key, content: str):
+    if key is not None and content:
+        _llm_cache().put(key, json.dumps({"at": datetime.now().isoformat(), "content": content}, ensure_ascii=False))
+
+# ===== Límite de uso del LLM (por deployment) =====
+# Token buckets de requests/min y tokens/min delante de cada llamada. Un 429
+# pausa el bucket para todas las llamadas en curso (respetando Retry-After) y
+# se reintenta con backoff exponencial + jitter; nunca se dispara otra llamada
+# "a ciegas". Cuotas en st.secrets: [llm] rpm / tpm, o por deployment en
+# [llm.rate_limits.<deployment>].
+LLM_DEFAULT_RPM = 120
+LLM_DEFAULT_TPM = 120_000
+LLM_OUTPUT_TOKENS_EST = 600
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_BASE = 1.0
+LLM_BACKOFF_MAX = 60.0
+
+class _TokenBucket:
+    """Bucket por minuto con reservas: reserve(n) descuenta ya y retorna cuánto esperar."""
+    def __init__(self, per_minute: int):
+        self.capacity = float(max(1, per_minute))
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.t = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+
+    def reserve(self, n: float) -> float:
+        with self.lock:
+            self._refill()
+            self.tokens -= min(float(n), self.capacity)
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, n: float):
+        """Corrige una reserva estimada con el consumo real (n > 0 consume más, n < 0 devuelve)."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - n)
+
+    def pause(self, seconds: float):
+        """Nada sale de este bucket durante `seconds`."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+class _LLMLimiter:
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests = _TokenBucket(rpm)
+        self.tokens = _TokenBucket(tpm)
+
+    def reserve(self, est_tokens: int) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(est_tokens))
+
+    def pause(self, seconds: float):
+        self.requests.pause(seconds)
+        self.tokens.pause(seconds)
+
+def _llm_quota(deployment: str) -> tuple:
+    try:
+        cfg = st.secrets["llm"]
+        per = (cfg.get("rate_limits") or {}).get(deployment) or {}
+        return (int(per.get("rpm", cfg.get("rpm", LLM_DEFAULT_RPM))),
+                int(per.get("tpm", cfg.get("tpm", LLM_DEFAULT_TPM))))
+    except Exception:
+        return LLM_DEFAULT_RPM, LLM_DEFAULT_TPM
+
+def _llm_limiter() -> _LLMLimiter:
+    deployment = (_llm_config() or ("default",))[0]
+    state = _process_state()
+    with state["llm_lock"]:
+        limiter = state["llm_limiters"].get(deployment)
+        if limiter is None:
+            limiter = state["llm_limiters"][deployment] = _LLMLimiter(*_llm_quota(deployment))
+        return limiter
+
+def _llm_estimate_tokens(messages) -> int:
+    chars = sum(len(str(_norm_message(m)["content"])) for m in messages)
+    return chars // 4 + LLM_OUTPUT_TOKENS_EST
+
+def _retry_after_seconds(exc):
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+def _llm_retry_delay(exc, attempt: int, limiter: _LLMLimiter):
+    """Segundos a esperar antes de reintentar; None si el error no es transitorio o se agotaron los intentos."""
+    stats = _process_state()["llm_stats"]
+    status = getattr(exc, "status_code", None)
+    transient = (
+        isinstance(exc, (openai.APIConnectionError, httpx.TransportError))
+        or status == 429 or (status is not None and status >= 500)
+    )
+    if not transient or attempt >= LLM_MAX_RETRIES:
+        return None
+    retry_after = _retry_after_seconds(exc)
+    if retry_after is not None:
+        delay = min(LLM_BACKOFF_MAX, retry_after) + random.uniform(0, LLM_BACKOFF_BASE / 2)
+    else:
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))  # full jitter
+    if status == 429:
+        stats["rate_limited"] += 1
+        limiter.pause(delay)
+    stats["retries"] += 1
+    return delay
+
+def _llm_usage_tokens(resp):
+    usage = getattr(resp, "usage_metadata", None) or {}
+    return usage.get("total_tokens")
+
+def _llm_prepare(messages, response_format, temperature) -> tuple:
+    """
+    (clave de cache, respuesta cacheada, cliente, limitador). Lee disco y
+    st.secrets y puede construir el cliente: en llm_ainvoke corre en el
+    executor, nunca en el event loop.
+    """
+    key = _llm_cache_key(messages, response_format, temperature)
+    cached = _llm_cache_get(key)
+    if cached is not None:
+        return key, cached, None, None
+    client = llm_client(response_format, temperature)
+    if client is None:
+        raise RuntimeError("LLM no configurado")
+    return key, None, client, _llm_limiter()
+
+def llm_invoke(messages, response_format: str = None, temperature: float = 0) -> str:
+    """Llamada al LLM por el cliente compartido; retorna el contenido (str). Propaga errores."""
+    key, cached, client, limiter = _llm_prepare(messages, response_format, temperature)
+    if cached is not None:
+        return cached
+    stats = _process_state()["llm_stats"]
+    est = _llm_estimate_tokens(messages)
+    attempt = 0
+    while True:
+        wait = limiter.reserve(est)
+        if wait:
+            stats["throttled_ms"] += wait * 1000
+            time.sleep(wait)
+        t0 = time.perf_counter()
+        try:
+            resp = client.invoke(messages)
+            delay = None
+        except Exception as e:
+            stats["errors"] += 1
+            delay = _llm_retry_delay(e, attempt, limiter)
+            if delay is None:
+                raise
+        finally:
+            stats["calls"] += 1
+            stats["call_ms"] += (time.perf_counter() - t0) * 1000
+        if delay is None:
+            break
+        time.sleep(delay)
+        attempt += 1
+    used = _llm_usage_tokens(resp)
+    if used:
+        limiter.tokens.adjust(used - est)
+    content = getattr(resp, "content", "") if resp else ""
+    _llm_cache_put(key, content)
+    return content
+
+async def llm_ainvoke(messages, response_format: str = None, temperature: float = 0) -> str:
+    """Versión asíncrona de llm_invoke; debe correr en _llm_loop()."""
+    # Cache en disco, st.secrets y construcción del cliente van al executor:
+    # en el loop bloquearían todos los ainvoke en curso
+    loop = asyncio.get_running_loop()
+    key, cached, client, limiter = await loop.run_in_executor(None, _llm_prepare, messages, response_format, temperature)
+    if cached is not None:
+        return cached
+    stats = _process_state()["llm_stats"]
+    est = _llm_estimate_tokens(messages)
+    attempt = 0
+    while True:
+        wait = limiter.reserve(est)
+        if wait:
+            stats["throttled_ms"] += wait * 1000
+            await asyncio.sleep(wait)
+        t0 = time.perf_counter()
+        try:
+            resp = await client.ainvoke(messages)
+            delay = None
+        except Exception as e:
+            stats["errors"] += 1
+            delay = _llm_retry_delay(e, attempt, limiter)
+            if delay is None:
+                raise
+        finally:
+            stats["calls"] += 1
+            stats["call_ms"] += (time.perf_counter() - t0) * 1000
+        if delay is None:
+            break
+        await asyncio.sleep(delay)
+        attempt += 1
+    used = _llm_usage_tokens(resp)
+    if used:
+        limiter.tokens.adjust(used - est)
+    content = getattr(resp, "content", "") if resp else ""
+    await loop.run_in_executor(None, _llm_cache_put, key, content)
+    return content
+
+def llm_stats() -> dict:
+    out = dict(_process_state()["llm_stats"])
+    calls, built = out.get("calls", 0), out.get("clients_built", 0)
+    out["avg_call_ms"] = round(out.get("call_ms", 0) / calls, 1) if calls else None
+    out["avg_build_ms"] = round(out.get("build_ms", 0) / built, 1) if built else None
+    return out
+
 def _llm_prompt_for_resume(resume_content: str, flow_desc: str, flow_expected: str):
     """Construye un prompt estructurado para extracción JSON, usando el contexto del flujo."""
     if not _LC_AVAILABLE:
@@ -1326,72 +3681,168 @@ def _llm_prompt_for_resume(resume_content: str, flow_desc: str, flow_expected: s
         HumanMessagePromptTemplate.from_template("Job description:\n{job_description}")
     ])
 
+_RESUME_SCHEMA_TEXT = """{
+    "Name": "Full Name",
+    "Last_position": "The most recent position in which the candidate worked",
+    "Years_of_Experience": "Number (in years)",
+    "English_Level": "Beginner/Intermediate/Advanced/Fluent/Native",
+    "Key_Skills": ["Skill 1", "Skill 2", "Skill 3"],
+    "Certifications": ["Certification 1", "Certification 2"],
+    "Additional_Notes": "Optional details inferred or contextually relevant information.",
+    "Score": "0-100"
+}"""
+
+def _resume_messages(job_description: str, resume_content: str, flow_desc: str, flow_expected: str):
+    """(mensajes con response_format JSON, mensajes del reintento “duro”) para un CV."""
+    job_description = get_jd_profile(job_description).prompt_text
+    prompt = _llm_prompt_for_resume(resume_content, flow_desc, flow_expected)
+    primary = prompt.format_messages(job_description=job_description) if prompt is not None else None
+    # Reintento: instrucción de SOLO JSON (sin fences)
+    retry = [
+        {
+            "role": "system",
+            "content": (
+                "Return ONLY a valid JSON object (no markdown code fences, no extra text). "
+                "The object must match exactly the provided schema."
+            ),
+        },
+        {
+            "role": "user",
+            "content": (
+                f"Schema:\n{_RESUME_SCHEMA_TEXT}\n\n"
+                f"Task Description: {flow_desc}\nExpected Output: {flow_expected}\n\n"
+                f"Job description:\n{job_description}\n\n"
+                f"CV Content:\n{resume_content}"
+            ),
+        },
+    ]
+    return primary, retry
+
 def _extract_with_azure(job_description: str, resume_content: str, flow_desc: str, flow_expected: str) -> dict:
     """AzureChatOpenAI sin JsonOutputParser; forzamos JSON y parseamos a mano."""
     if not _LC_AVAILABLE:
         return {}
+    primary, retry = _resume_messages(job_description, resume_content, flow_desc, flow_expected)
+    if primary is None:
+        return {}
 
-    _llm_setup_credentials()
+    # 1) Intento con response_format JSON nativo (429/errores transitorios ya se reintentan en llm_invoke)
+    try:
+        data = _safe_json_loads(llm_invoke(primary, response_format="json_object"))
+        if data:
+            return data
+    except Exception as e:
+        print(f"Error evaluating CV with LLM: {e}")
+        return {}
 
-    # 1) Intento con response_format JSON nativo
+    # 2) Reintento “duro”: solo si la respuesta no fue un JSON válido
     try:
-        llm = AzureChatOpenAI(
-            azure_deployment=st.secrets["llm"]["azure_deployment"],
-            api_version=st.secrets["llm"]["azure_api_version"],
-            temperature=0,
-            model_kwargs={"response_format": {"type": "json_object"}},
-        )
-        prompt = _llm_prompt_for_resume(resume_content, flow_desc, flow_expected)
-        if prompt is None:
-            return {}
+        return _safe_json_loads(llm_invoke(retry))
+    except Exception as e:
+        print(f"Error evaluating CV with LLM: {e}")
+        return {}
 
-        msgs = prompt.format_messages(job_description=job_description)
-        resp = llm.invoke(msgs)
-        data = _safe_json_loads(getattr(resp, "content", "") if resp else "")
+async def _aextract_with_azure(job_description: str, resume_content: str, flow_desc: str, flow_expected: str) -> dict:
+    """Igual que _extract_with_azure, con ainvoke."""
+    if not _LC_AVAILABLE:
+        return {}
+    primary, retry = _resume_messages(job_description, resume_content, flow_desc, flow_expected)
+    if primary is None:
+        return {}
+    try:
+        data = _safe_json_loads(await llm_ainvoke(primary, response_format="json_object"))
         if data:
             return data
-    except Exception:
-        pass  # seguimos al reintento
-
-    # 2) Reintento “duro”: instrucción de SOLO JSON (sin fences)
+    except Exception as e:
+        print(f"Error evaluating CV with LLM: {e}")
+        return {}
     try:
-        llm2 = AzureChatOpenAI(
-            azure_deployment=st.secrets["llm"]["azure_deployment"],
-            api_version=st.secrets["llm"]["azure_api_version"],
-            temperature=0,
-        )
-        schema_text = """{
-            "Name": "Full Name",
-            "Last_position": "The most recent position in which the candidate worked",
-            "Years_of_Experience": "Number (in years)",
-            "English_Level": "Beginner/Intermediate/Advanced/Fluent/Native",
-            "Key_Skills": ["Skill 1", "Skill 2", "Skill 3"],
-            "Certifications": ["Certification 1", "Certification 2"],
-            "Additional_Notes": "Optional details inferred or contextually relevant information.",
-            "Score": "0-100"
-        }"""
-        resp2 = llm2.invoke([
-            {
-                "role": "system",
-                "content": (
-                    "Return ONLY a valid JSON object (no markdown code fences, no extra text). "
-                    "The object must match exactly the provided schema."
-                ),
-            },
-            {
-                "role": "user",
-                "content": (
-                    f"Schema:\n{schema_text}\n\n"
-                    f"Task Description: {flow_desc}\nExpected Output: {flow_expected}\n\n"
-                    f"Job description:\n{job_description}\n\n"
-                    f"CV Content:\n{resume_content}"
-                ),
-            },
-        ])
-        return _safe_json_loads(getattr(resp2, "content", "") if resp2 else "")
-    except Exception:
+        return _safe_json_loads(await llm_ainvoke(retry))
+    except Exception as e:
+        print(f"Error evaluating CV with LLM: {e}")
         return {}
 
+def evaluate_resumes_batch(texts: list, job_description: str, flow_desc: str, flow_expected: str,
+                           concurrency: int = LLM_DEFAULT_CONCURRENCY, on_result=None) -> list:
+    """
+    Evalúa varios CVs con hasta `concurrency` llamadas al LLM en paralelo.
+    Retorna los resultados en el orden de `texts` ({} si falló; None si el texto
+    era None). `on_result(i, meta, done)` se llama en este hilo a medida que
+    cada CV termina, para reportar progreso.
+    """
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def _one(text):
+        async with sem:
+            return await _aextract_with_azure(job_description, text, flow_desc, flow_expected)
+
+    # Los clientes que usa _aextract_with_azure se construyen aquí, no en el loop
+    llm_client("json_object"); llm_client()
+    loop = _llm_loop()
+    results = [None] * len(texts)
+    futures = {
+        asyncio.run_coroutine_threadsafe(_one(text), loop): i
+        for i, text in enumerate(texts) if text is not None
+    }
+    try:
+        for done, fut in enumerate(concurrent.futures.as_completed(futures), start=1):
+            i = futures[fut]
+            try:
+                results[i] = fut.result() or {}
+            except Exception as e:
+                print(f"Error evaluating CV {i}: {e}")
+                results[i] = {}
+            if on_result is not None:
+                on_result(i, results[i], done)
+    finally:
+        # Rerun/stop de Streamlit a mitad del lote: lo pendiente no sigue gastando cuota
+        for fut in futures:
+            fut.cancel()
+    return results
+
+# ===== Cascada de evaluación =====
+# Primera etapa con el scorer por reglas (score_fit_batch, sin LLM); solo los
+# mejores K que superan el umbral pasan al LLM. El umbral por defecto es el
+# mismo con el que 'Definición & Carga' descarta candidatos.
+PREFILTER_MIN_SCORE = 35
+PREFILTER_TOP_K = 20
+
+def prefilter_resumes(texts: list, job_description: str, role: str,
+                      top_k: int = PREFILTER_TOP_K, min_score: int = PREFILTER_MIN_SCORE) -> tuple:
+    """
+    Puntúa los CVs con reglas y elige cuáles pasan al LLM.
+    Retorna (scored, keep): scored[i] es (score, explicación) o None si el texto
+    era None; keep es el conjunto de índices con score >= min_score, limitado a
+    los top_k mejores (top_k <= 0 = sin límite).
+    """
+    preset = ROLE_PRESETS.get(role, {})
+    must_list = [s.strip() for s in (preset.get("must", []) or []) if s.strip()]
+    nice_list = [s.strip() for s in (preset.get("nice", []) or []) if s.strip()]
+    idx = [i for i, t in enumerate(texts) if t is not None]
+    scored = [None] * len(texts)
+    for i, res in zip(idx, score_fit_batch(job_description, must_list, nice_list, [texts[i] for i in idx])):
+        scored[i] = res
+    ranked = sorted((i for i in idx if scored[i][0] >= min_score), key=lambda i: scored[i][0], reverse=True)
+    if top_k and top_k > 0:
+        ranked = ranked[:int(top_k)]
+    return scored, set(ranked)
+
+def _prefilter_meta(score: int, exp: dict, min_score: int, top_k: int) -> dict:
+    """Resultado registrado para un CV que no pasó el prefiltro."""
+    if score < min_score:
+        reason = f"score por reglas {score} < umbral {min_score}"
+    else:
+        reason = f"fuera del top-{top_k} por reglas (score {score})"
+    gaps = ", ".join(exp.get("gaps_must", [])[:5])
+    return {
+        "Name": "Filtrado por prefiltro",
+        "Years_of_Experience": "—",
+        "English_Level": "—",
+        "Key_Skills": exp.get("matched_must", []) + exp.get("matched_nice", []),
+        "Certifications": [],
+        "Additional_Notes": f"Filtrado por prefiltro: {reason}." + (f" Faltan: {gaps}." if gaps else ""),
+        "Score": score
+    }
 
 def _create_llm_bar(df: pd.DataFrame):
     fig = px.bar(
@@ -1503,17 +3954,14 @@ def render_position_form():
                 st.error("Por favor, completa todos los campos obligatorios (*), incluyendo el Job Description.")
             else:
                 if is_edit_mode:
-                    pos_to_update = next(
-                        (p for p in ss.positions if p["ID"] == ss.editing_position_id),
-                        None
-                    )
-                    if pos_to_update:
-                        pos_to_update["Puesto"] = puesto
-                        pos_to_update["Ubicación"] = ubicacion
-                        pos_to_update["Hiring Manager"] = hm
-                        pos_to_update["Estado"] = estado
-                        pos_to_update["Fecha Inicio"] = fecha_inicio.isoformat()
-                        pos_to_update["JD"] = jd
+                    save_position_fields(ss.editing_position_id, {
+                        "Puesto": puesto,
+                        "Ubicación": ubicacion,
+                        "Hiring Manager": hm,
+                        "Estado": estado,
+                        "Fecha Inicio": fecha_inicio.isoformat(),
+                        "JD": jd,
+                    })
                     st.success("Puesto actualizado.")
                 else:
                     new_pos = {
@@ -1525,13 +3973,11 @@ def render_position_form():
                         "Fecha Inicio": fecha_inicio.isoformat(),
                         "JD": jd,
                         "Días Abierto": 0,
-                        "Leads": 0, "Nuevos": 0, "Recruiter Screen": 0, "HM Screen": 0,
-                        "Entrevista Telefónica": 0, "Entrevista Presencial": 0
+                        # stage_counts / Leads / Nuevos los calcula refresh_position_counts
                     }
-                    ss.positions.insert(0, new_pos)
+                    save_position(new_pos)
                     st.success("Puesto creado.")
                 
-                save_positions(ss.positions)
                 ss.editing_position_id = None
                 ss.show_position_form = False
                 st.rerun()
@@ -1561,7 +4007,8 @@ def page_puestos():
             st.info("No hay puestos definidos. Crea uno con **➕ Nuevo Puesto**.")
             return
 
-        all_candidates_df = pd.DataFrame(ss.candidates) if ss.candidates else pd.DataFrame(columns=["Role", "stage"])
+        # Leads/Nuevos vienen precalculados en cada puesto; solo se recuentan los que no los tienen
+        refresh_position_counts()
 
         col_w = [2.5, 2.0, 1.0, 1.0, 1.0, 1.5]
         h_puesto, h_hm, h_dias, h_leads, h_estado, h_acc = st.columns(col_w)
@@ -1596,19 +4043,7 @@ def page_puestos():
                 except Exception:
                     st.markdown("—")
             with c_leads:
-                pos_puesto_name = pos.get("Puesto")
-                cands_for_pos = (
-                    all_candidates_df[all_candidates_df["Role"] == pos_puesto_name]
-                    if pos_puesto_name else pd.DataFrame()
-                )
-                
-                leads_count = len(cands_for_pos)
-                nuevos_count = 0
-                if not cands_for_pos.empty:
-                    nuevos_count = len(
-                        cands_for_pos[cands_for_pos["stage"].isin(["Recibido", "Screening RRHH"])]
-                    )
-                st.markdown(f"**{leads_count}** ({nuevos_count})")
+                st.markdown(f"**{pos.get('Leads', 0)}** ({pos.get('Nuevos', 0)})")
             with c_estado:
                 st.markdown(_position_status_pill(pos.get('Estado', 'Abierto')), unsafe_allow_html=True)
             with c_acc:
@@ -1634,7 +4069,7 @@ def page_puestos():
                         help="Esto eliminará el puesto permanentemente"
                     ):
                         ss.positions = [p for p in ss.positions if p.get("ID") != pos_id]
-                        save_positions(ss.positions)
+                        delete_position(pos_id)
                         ss.confirm_delete_position_id = None
                         st.warning(f"Puesto '{pos.get('Puesto')}' eliminado.")
                         st.rerun()
@@ -1663,10 +4098,7 @@ def page_puestos():
         )
         
         if selected_pos:
-            candidates_for_pos = [
-                c for c in ss.candidates
-                if c.get("Role") == selected_pos
-            ]
+            candidates_for_pos = query_records(CANDIDATES_FILE, ss.candidates, eq={"Role": selected_pos})
             if candidates_for_pos:
                 df_cand = pd.DataFrame(candidates_for_pos)
                 st.dataframe(
@@ -1726,11 +4158,24 @@ def page_eval():
             ss.eval_flow_desc     = selected_flow_data.get("description", "")
             ss.eval_flow_expected = selected_flow_data.get("expected_output", "")
             ss.eval_jd_llm        = selected_flow_data.get("jd_text", "JD no encontrado.")
+            ss.eval_flow_cascade  = {
+                "top_k": int(selected_flow_data.get("cascade_top_k", PREFILTER_TOP_K)),
+                "min_score": int(selected_flow_data.get("cascade_min_score", PREFILTER_MIN_SCORE))
+            } if selected_flow_data.get("cascade_enabled") else None
         else:
             ss.eval_flow_puesto   = "N/A"
             ss.eval_flow_desc     = "N/A"
             ss.eval_flow_expected = "N/A"
             ss.eval_jd_llm        = "Selecciona un flujo válido"
+            ss.eval_flow_cascade  = None
+
+        cascade = ss.get("eval_flow_cascade")
+        if cascade:
+            top_k_txt = f"top-{cascade['top_k']}" if cascade["top_k"] > 0 else "todos"
+            st.caption(
+                f"Cascada activa: los CVs se puntúan primero por reglas y solo pasan al LLM "
+                f"{top_k_txt} con score ≥ {cascade['min_score']}."
+            )
 
         up = st.file_uploader(
             "Sube CVs en PDF para evaluarlos con el LLM",
@@ -1738,7 +4183,20 @@ def page_eval():
             accept_multiple_files=True,
             key="pdf_llm"
         )
+        if "llm_concurrency" not in ss:
+            ss.llm_concurrency = llm_concurrency_default()
+        st.slider("Evaluaciones LLM en paralelo", 1, 32, key="llm_concurrency")
         run_llm = st.button("Ejecutar evaluación LLM", key="btn_llm_eval")
+        stats = llm_stats()
+        if stats.get("calls") or stats.get("cache_hits"):
+            st.caption(
+                f"LLM: {stats.get('calls', 0)} llamada(s) · {stats['avg_call_ms'] or 0} ms promedio · "
+                f"{stats.get('clients_built', 0)} cliente(s) creados ({stats['avg_build_ms'] or 0} ms c/u), "
+                f"{stats.get('clients_reused', 0)} reutilizados · "
+                f"cache {stats.get('cache_hits', 0)} hit(s) / {stats.get('cache_misses', 0)} miss(es) · "
+                f"{stats.get('rate_limited', 0)} respuesta(s) 429, {stats.get('retries', 0)} reintento(s), "
+                f"{round(stats.get('throttled_ms', 0) / 1000, 1)} s en espera del límite"
+            )
 
         if run_llm and up:
             flow_desc_val     = ss.get("eval_flow_desc", "")
@@ -1757,92 +4215,115 @@ def page_eval():
                 current_user = ss.auth.get("name", "Admin")
                 puesto_name  = ss.get("eval_flow_puesto", "N/A")
                 
-                with st.spinner(f"Analizando {len(up)} CVs con IA..."):
-                    for f in up:
-                        f_bytes = f.read(); f.seek(0)
-                        text = ""
-                        try:
-                            if _LC_AVAILABLE:
-                                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-                                    tmp.write(f_bytes)
-                                    tmp.flush()
-                                    loader = PyPDFLoader(tmp.name)
-                                    pages = loader.load()
-                                    text = "\n".join([p.page_content for p in pages])
-                            else:
-                                reader = PdfReader(io.BytesIO(f_bytes))
-                                for p in reader.pages:
-                                    text += (p.extract_text() or "") + "\n"
-                        except Exception:
-                            try:
-                                reader = PdfReader(io.BytesIO(f_bytes))
-                                for p in reader.pages:
-                                    text += (p.extract_text() or "") + "\n"
-                            except Exception as e:
-                                st.error(f"No se pudo leer {f.name}: {e}")
-                                continue
-
-                        meta = (
-                            _extract_with_azure(
-                                jd_llm_val, text, flow_desc_val, flow_expected_val
-                            )
-                            or _extract_with_openai(
-                                jd_llm_val, text, flow_desc_val, flow_expected_val
-                            )
-                        )
-                                
-                        if not meta:
-                            meta = {
-                                "Name":"Error de Análisis",
-                                "Years_of_Experience":"—",
-                                "English_Level":"—",
-                                "Key_Skills":[],
-                                "Certifications":[],
-                                "Additional_Notes":"La IA no pudo procesar este CV.",
-                                "Score":0
-                            }
-                        
+                payload = []
+                for f in up:
+                    f_bytes = f.read(); f.seek(0)
+                    payload.append((f_bytes, f.name))
+                texts = extract_texts_parallel(payload, _extract_progress_bar("Extrayendo texto de los CVs"))
+
+                for f, text in zip(up, texts):
+                    if text is None:
+                        st.error(f"No se pudo leer {f.name}.")
+
+                # Cascada: el scoring por reglas decide qué CVs llegan al LLM
+                scored, keep = None, None
+                llm_texts = texts
+                if cascade:
+                    scored, keep = prefilter_resumes(
+                        texts, jd_llm_val, puesto_name,
+                        top_k=cascade["top_k"], min_score=cascade["min_score"]
+                    )
+                    llm_texts = [t if i in keep else None for i, t in enumerate(texts)]
+
+                # Llamadas concurrentes (hasta `llm_concurrency`); el progreso avanza a
+                # medida que termina cada CV y los resultados conservan el orden de carga
+                n_ok = sum(1 for t in llm_texts if t is not None)
+                prog = st.progress(0.0, text=f"Analizando {n_ok} CVs con IA...")
+                def _on_result(i, meta, done):
+                    prog.progress(done / max(1, n_ok), text=f"Analizados {done}/{n_ok} · {up[i].name}")
+                metas = evaluate_resumes_batch(
+                    llm_texts, jd_llm_val, flow_desc_val, flow_expected_val,
+                    concurrency=ss.llm_concurrency,
+                    on_result=_on_result
+                )
+                prog.empty()
+
+                new_tasks = []
+                events = []
+                n_filtered = 0
+                for i, (f, (f_bytes, _), text, meta) in enumerate(zip(up, payload, texts, metas)):
+                    if text is None:
+                        continue
+
+                    if keep is not None and i not in keep:
+                        # Descartado por el prefiltro: queda registrado, sin tarea de revisión
+                        meta = _prefilter_meta(*scored[i], cascade["min_score"], cascade["top_k"])
                         meta["file_name"] = f.name
-                        results_with_bytes.append({"meta": meta, "_bytes": f_bytes})
-                        
-                        # Crear Tarea individual por CV
-                        full_name = meta.get('Name', 'Candidato')
-                        task_title = f"CV {f.name}"
-                        if full_name not in ['Candidato', 'Error de Análisis', '—']:
-                            name_parts = full_name.split()
-                            if len(name_parts) >= 2:
-                                task_title = f"CV {name_parts[0]} {name_parts[1]}"
-                            elif len(name_parts) == 1:
-                                task_title = f"CV {name_parts[0]}"
-                        
-                        task_desc = (
-                            f"Revisión para '{puesto_name}'. | PDF: {f.name} | "
-                            f"Score IA: {meta.get('Score', 'N/A')}%"
-                        )
-
-                        task_context = {
-                            "source": "Evaluación LLM",
-                            "llm_analysis": meta,
-                            "pdf_bytes_b64": base64.b64encode(f_bytes).decode('utf-8'),
-                            "jd_text": jd_llm_val
+                        results_with_bytes.append({"meta": meta, "blob_sha256": put_blob(f_bytes), "prefilter": True})
+                        # Tipo propio: el puntaje por reglas no entra al fit (IA) del dashboard
+                        events.append({"type": "prefilter", "role": puesto_name, "score": meta["Score"]})
+                        n_filtered += 1
+                        continue
+
+                    if not meta:
+                        meta = {
+                            "Name":"Error de Análisis",
+                            "Years_of_Experience":"—",
+                            "English_Level":"—",
+                            "Key_Skills":[],
+                            "Certifications":[],
+                            "Additional_Notes":"La IA no pudo procesar este CV.",
+                            "Score":0
                         }
+                    
+                    meta["file_name"] = f.name
+                    pdf_sha = put_blob(f_bytes)
+                    results_with_bytes.append({"meta": meta, "blob_sha256": pdf_sha})
+                    events.append({"type": "eval", "kind": "llm", "role": puesto_name, "score": meta.get("Score")})
+                    
+                    # Crear Tarea individual por CV
+                    full_name = meta.get('Name', 'Candidato')
+                    task_title = f"CV {f.name}"
+                    if full_name not in ['Candidato', 'Error de Análisis', '—']:
+                        name_parts = full_name.split()
+                        if len(name_parts) >= 2:
+                            task_title = f"CV {name_parts[0]} {name_parts[1]}"
+                        elif len(name_parts) == 1:
+                            task_title = f"CV {name_parts[0]}"
+                    
+                    task_desc = (
+                        f"Revisión para '{puesto_name}'. | PDF: {f.name} | "
+                        f"Score IA: {meta.get('Score', 'N/A')}%"
+                    )
 
-                        create_manual_task(
-                            task_title,
-                            task_desc,
-                            date.today() + timedelta(days=2),
-                            current_user,
-                            "Media",
-                            task_context
-                        )
+                    task_context = {
+                        "source": "Evaluación LLM",
+                        "llm_analysis": meta,
+                        "pdf_sha256": pdf_sha,
+                        "jd_text": jd_llm_val
+                    }
 
+                    new_tasks.append(_manual_task(
+                        task_title,
+                        task_desc,
+                        date.today() + timedelta(days=2),
+                        current_user,
+                        "Media",
+                        task_context
+                    ))
+
+                create_tasks_batch(new_tasks)
                 ss.llm_eval_results = results_with_bytes
+                log_events(events)
                 st.success(
-                    f"¡Análisis completo! Se crearon {len(ss.llm_eval_results)} tareas en 'Todas las tareas' para su revisión."
+                    f"¡Análisis completo! Se crearon {len(new_tasks)} tareas en 'Todas las tareas' para su revisión."
+                    + (f" {n_filtered} CV(s) quedaron filtrados por el prefiltro sin llamar al LLM." if n_filtered else "")
                 )
 
         if ss.llm_eval_results:
-            df_llm = _results_to_df([r["meta"] for r in ss.llm_eval_results])
+            # Los filtrados por el prefiltro no pasaron por el LLM: tabla aparte, fuera del gráfico
+            df_llm = _results_to_df([r["meta"] for r in ss.llm_eval_results if not r.get("prefilter")])
+            df_pre = _results_to_df([r["meta"] for r in ss.llm_eval_results if r.get("prefilter")])
             if not df_llm.empty:
                 st.subheader("Resultados de la Ejecución")
                 st.dataframe(
@@ -1854,111 +4335,220 @@ def page_eval():
                     _create_llm_bar(df_llm),
                     use_container_width=True
                 )
-            else:
+            if not df_pre.empty:
+                st.subheader("Filtrados por prefiltro (sin LLM)")
+                st.dataframe(
+                    df_pre,
+                    use_container_width=True,
+                    hide_index=True
+                )
+            if df_llm.empty and df_pre.empty:
                 st.info("Sin resultados para mostrar.")
         else:
             st.info("Sube archivos y ejecuta la evaluación para ver resultados.")
 
+# ===== Índice del pipeline =====
+# Etapa -> candidatos ordenados por Score, recalculado solo cuando cambia la
+# versión de la colección compartida de candidatos (alta, movimiento o baja)
+PIPELINE_PAGE_SIZE = 8
+
+def _build_pipeline_index(cands: list) -> dict:
+    by_stage = {stage: [] for stage in PIPELINE_STAGES}
+    for c in cands:
+        by_stage.setdefault(c.get("stage", PIPELINE_STAGES[0]), []).append(c)
+    for lst in by_stage.values():
+        lst.sort(key=lambda c: c.get("Score", 0), reverse=True)
+    return {"by_stage": by_stage, "by_id": {c["id"]: c for c in cands}}
+
+def pipeline_index() -> dict:
+    """Candidatos por etapa / por id; uno por versión de la colección, compartido por las sesiones."""
+    index = _shared_derived(CANDIDATES_FILE, ss.candidates, "pipeline", _build_pipeline_index)
+    return index if index is not None else _build_pipeline_index(ss.candidates)
+
+def _card_name(c: dict) -> str:
+    return c["Name"].split('_')[-1].replace('.pdf', '').replace('.txt', '')
+
+def _pipeline_card_html(c: dict) -> str:
+    border = PRIMARY if c['Score'] >= 70 else ('#FFA500' if c['Score'] >= 40 else '#D60000')
+    return f"""
+    <div class="k-card" style="margin-bottom: 6px; border-left: 4px solid {border}">
+        <div style="font-weight:700; color:{TITLE_DARK};">{_card_name(c)}</div>
+        <div style="font-size:12px; opacity:.8;">{c.get("Role", "Puesto Desconocido")}</div>
+        <div style="font-size:14px; font-weight:700; margin-top:8px;">Fit: <span style="color:{PRIMARY};">{c["Score"]}%</span></div>
+        <div style="font-size:10px; opacity:.6; margin-top:4px;">Fuente: {c.get("source", "N/A")}</div>
+    </div>
+    """
+
+def move_candidates(cands: list, new_stage: str) -> dict:
+    """
+    Mueve uno o varios candidatos de etapa. Los candidatos y las tareas que
+    dispara la transición se persisten con una escritura por colección.
+    """
+    with _counts_lock():
+        # La etapa de origen sale de la copia compartida: otra sesión pudo moverlos antes
+        latest = {c.get("id"): c for c in _latest_candidates()}
+        moved = [dict(latest.get(c.get("id"), c)) for c in cands]
+        moved = [c for c in moved if c.get("stage") != new_stage]
+        deltas = Counter()
+        for c in moved:
+            deltas[(c.get("Role"), c.get("stage"))] -= 1
+            deltas[(c.get("Role"), new_stage)] += 1
+        if moved:
+            save_candidates_batch([{**c, "stage": new_stage} for c in moved])
+            apply_position_deltas(deltas)
+    tasks = []
+    events = []
+    for c in moved:
+        events.append(_stage_event(c, new_stage, c.get("stage")))
+        c["stage"] = new_stage
+        if new_stage == "Entrevista Telefónica":
+            card_name = _card_name(c)
+            tasks.append(_flow_task(
+                f"Programar entrevista - {card_name}",
+                date.today()+timedelta(days=2),
+                "Coordinar entrevista telefónica con el candidato.",
+                assigned="Headhunter",
+                status="Pendiente",
+                context={"candidate_name": card_name, "candidate_id": c["id"], "role": c.get("Role", "N/A")}
+            ))
+    if moved:
+        create_tasks_batch(tasks)
+        log_events(events)
+    return {"moved": len(moved), "tasks": len(tasks), "stage": new_stage}
+
+def _pipeline_select(cid: str):
+    ss.pipeline_selected = None if ss.get("pipeline_selected") == cid else cid
+
+def _pipeline_more(stage: str):
+    ss[f"pipeline_show_{stage}"] = ss.get(f"pipeline_show_{stage}", PIPELINE_PAGE_SIZE) + PIPELINE_PAGE_SIZE
+
+def _pipeline_move_form(c: dict, stage: str, filter_stage):
+    """Controles de movimiento: solo se construyen para la tarjeta seleccionada."""
+    card_name = _card_name(c)
+    with st.form(key=f"form_move_{c['id']}", clear_on_submit=False):
+        current_stage_index = PIPELINE_STAGES.index(stage)
+        available_stages = [s for s in PIPELINE_STAGES if s != stage]
+        try:
+            default_index = available_stages.index(
+                PIPELINE_STAGES[min(current_stage_index + 1, len(PIPELINE_STAGES) - 1)]
+            )
+        except ValueError:
+            default_index = 0
+
+        new_stage = st.selectbox(
+            "Mover a:",
+            available_stages,
+            key=f"select_move_{c['id']}",
+            index=default_index,
+            label_visibility="collapsed"
+        )
+
+        if st.form_submit_button("Mover Candidato"):
+            move_candidates([c], new_stage)
+            ss.pipeline_selected = None
+            if new_stage == "Descartado":
+                st.success(
+                    f"📧 **Comunicación:** Email de rechazo automático enviado a {card_name}."
+                )
+            elif new_stage == "Entrevista Telefónica":
+                st.info(
+                    f"📅 **Automatización:** Tarea de programación de entrevista generada para {card_name}."
+                )
+            elif new_stage == "Contratado":
+                st.balloons()
+                st.success(
+                    f"🎉 **¡Éxito!** Flujo de Onboarding disparado para {card_name}."
+                )
+            if filter_stage and new_stage != filter_stage:
+                ss.pipeline_filter = None
+                st.info(
+                    "El filtro ha sido removido al mover el candidato de fase."
+                )
+            st.rerun()
+
+def _pipeline_bulk_panel(index: dict):
+    """Movimiento en lote: selección manual o regla (etapa + Score mínimo + puesto)."""
+    with st.expander("Mover en lote"):
+        b1, b2, b3 = st.columns([1, 1, 1])
+        with b1:
+            from_stage = st.selectbox("Desde etapa", PIPELINE_STAGES, key="bulk_from")
+        with b2:
+            to_stage = st.selectbox("Hacia etapa", [s for s in PIPELINE_STAGES if s != from_stage], key="bulk_to")
+        with b3:
+            mode = st.radio("Modo", ["Por regla", "Selección manual"], horizontal=True, key="bulk_mode")
+
+        pool = index["by_stage"].get(from_stage, [])
+        if mode == "Por regla":
+            r1, r2 = st.columns([1, 1])
+            with r1:
+                min_score = st.slider("Score mínimo", 0, 100, 70, key="bulk_min_score")
+            with r2:
+                roles = ["Todos"] + sorted({c.get("Role") for c in pool if c.get("Role")})
+                role = st.selectbox("Puesto", roles, key="bulk_role")
+            chosen = [c for c in pool if c.get("Score", 0) >= min_score and (role == "Todos" or c.get("Role") == role)]
+        else:
+            by_id = index["by_id"]
+            sel = st.multiselect(
+                "Candidatos", [c["id"] for c in pool], key="bulk_ids",
+                format_func=lambda cid: f"{_card_name(by_id[cid])} · {by_id[cid].get('Score', 0)}% · {by_id[cid].get('Role', '—')}"
+            )
+            chosen = [by_id[cid] for cid in sel if cid in by_id and by_id[cid].get("stage") == from_stage]
+
+        if st.button(f"Mover {len(chosen)} candidato(s) a {to_stage}", key="bulk_apply", type="primary", disabled=not chosen):
+            ss.pipeline_flash = move_candidates(chosen, to_stage)
+            ss.pop("bulk_ids", None)
+            st.rerun()
+
 def page_pipeline():
     filter_stage = ss.get("pipeline_filter")
+    index = pipeline_index()
     if filter_stage:
         st.header(f"Pipeline: Candidatos en Fase '{filter_stage}'")
-        candidates_to_show = [c for c in ss.candidates if c.get("stage") == filter_stage]
+        candidates_by_stage = {stage: (index["by_stage"].get(stage, []) if stage == filter_stage else []) for stage in PIPELINE_STAGES}
     else:
         st.header("Pipeline de Candidatos (Vista Kanban)")
-        candidates_to_show = ss.candidates
+        candidates_by_stage = index["by_stage"]
 
-    st.caption("Arrastra los candidatos a través de las etapas para avanzar el proceso.")
+    st.caption("Selecciona un candidato para moverlo entre etapas. Cada columna muestra primero los de mayor Fit.")
 
-    if not candidates_to_show and filter_stage:
+    if not candidates_by_stage.get(filter_stage) and filter_stage:
         st.info(f"No hay candidatos en la fase **{filter_stage}**.")
         return
     elif not ss.candidates:
         st.info("No hay candidatos activos. Carga CVs en **Publicación & Sourcing**.")
         return
 
-    candidates_by_stage = {stage: [] for stage in PIPELINE_STAGES}
-    for c in candidates_to_show:
-        candidates_by_stage[c["stage"]].append(c)
+    flash = ss.pop("pipeline_flash", None)
+    if flash:
+        st.success(
+            f"{flash['moved']} candidato(s) movidos a **{flash['stage']}**."
+            + (f" Se generaron {flash['tasks']} tarea(s) de entrevista." if flash["tasks"] else "")
+        )
+    _pipeline_bulk_panel(index)
 
+    selected = ss.get("pipeline_selected")
     cols = st.columns(len(PIPELINE_STAGES))
     for i, stage in enumerate(PIPELINE_STAGES):
+        stage_cands = candidates_by_stage.get(stage, [])
+        shown = ss.get(f"pipeline_show_{stage}", PIPELINE_PAGE_SIZE)
         with cols[i]:
             st.markdown(
-                f"**{stage} ({len(candidates_by_stage[stage])})**",
+                f"**{stage} ({len(stage_cands)})**",
                 unsafe_allow_html=True
             )
             st.markdown("---")
-            for c in candidates_by_stage[stage]:
-                card_name = (
-                    c["Name"]
-                    .split('_')[-1]
-                    .replace('.pdf', '')
-                    .replace('.txt', '')
-                )
-                st.markdown(f"""
-                <div class="k-card" style="margin-bottom: 10px; border-left: 4px solid {PRIMARY if c['Score'] >= 70 else ('#FFA500' if c['Score'] >= 40 else '#D60000')}">
-                    <div style="font-weight:700; color:{TITLE_DARK};">{card_name}</div>
-                    <div style="font-size:12px; opacity:.8;">{c.get("Role", "Puesto Desconocido")}</div>
-                    <div style="font-size:14px; font-weight:700; margin-top:8px;">Fit: <span style="color:{PRIMARY};">{c["Score"]}%</span></div>
-                    <div style="font-size:10px; opacity:.6; margin-top:4px;">Fuente: {c.get("source", "N/A")}</div>
-                </div>
-                """, unsafe_allow_html=True)
-
-                with st.form(key=f"form_move_{c['id']}", clear_on_submit=False):
-                    current_stage_index = PIPELINE_STAGES.index(stage)
-                    available_stages = [s for s in PIPELINE_STAGES if s != stage]
-                    try:
-                        default_index = available_stages.index(
-                            PIPELINE_STAGES[min(current_stage_index + 1, len(PIPELINE_STAGES) - 1)]
-                        )
-                    except ValueError:
-                        default_index = 0
-
-                    new_stage = st.selectbox(
-                        "Mover a:",
-                        available_stages,
-                        key=f"select_move_{c['id']}",
-                        index=default_index,
-                        label_visibility="collapsed"
-                    )
-
-                    if st.form_submit_button("Mover Candidato"):
-                        c["stage"] = new_stage
-                        if new_stage == "Descartado":
-                            st.success(
-                                f"📧 **Comunicación:** Email de rechazo automático enviado a {card_name}."
-                            )
-                        elif new_stage == "Entrevista Telefónica":
-                            st.info(
-                                f"📅 **Automatización:** Tarea de programación de entrevista generada para {card_name}."
-                            )
-                            task_context = {
-                                "candidate_name": card_name,
-                                "candidate_id": c["id"],
-                                "role": c.get("Role", "N/A")
-                            }
-                            create_task_from_flow(
-                                f"Programar entrevista - {card_name}",
-                                date.today()+timedelta(days=2),
-                                "Coordinar entrevista telefónica con el candidato.",
-                                assigned="Headhunter",
-                                status="Pendiente",
-                                context=task_context
-                            )
-                        elif new_stage == "Contratado":
-                            st.balloons()
-                            st.success(
-                                f"🎉 **¡Éxito!** Flujo de Onboarding disparado para {card_name}."
-                            )
-                        if filter_stage and new_stage != filter_stage:
-                            ss.pipeline_filter = None
-                            st.info(
-                                "El filtro ha sido removido al mover el candidato de fase."
-                            )
-                        st.rerun()
-
+            # Solo las primeras `shown` tarjetas; el resto queda tras "Ver más"
+            for c in stage_cands[:shown]:
+                st.markdown(_pipeline_card_html(c), unsafe_allow_html=True)
+                is_sel = c["id"] == selected
+                st.button("Cerrar" if is_sel else "Mover", key=f"pipe_sel_{c['id']}",
+                          on_click=_pipeline_select, args=(c["id"],), use_container_width=True)
+                if is_sel:
+                    _pipeline_move_form(c, stage, filter_stage)
                 st.markdown("<br>", unsafe_allow_html=True)
+            if len(stage_cands) > shown:
+                st.button(f"Ver más ({len(stage_cands) - shown})", key=f"pipe_more_{stage}",
+                          on_click=_pipeline_more, args=(stage,), use_container_width=True)
 
 def page_interview():
     st.header("Entrevista (Gerencia)")
@@ -1992,20 +4582,19 @@ def page_hh_tasks():
         st.info("No tienes tareas asignadas.")
         return
 
-    df_tasks = pd.DataFrame(ss.tasks)
     my_name = ss.auth["name"] if ss.get("auth") else "Colab"
-    my_tasks = df_tasks[df_tasks["assigned_to"].isin(["Headhunter", "Colaborador", my_name])]
+    my_queues = ["Headhunter", "Colaborador", my_name]
 
-    all_statuses = ["Todos"] + sorted(my_tasks["status"].unique())
+    all_statuses = ["Todos"] + sorted(distinct_values(TASKS_FILE, ss.tasks, "status", isin={"assigned_to": my_queues}))
     prefer_order = ["Pendiente", "En Proceso", "En Espera"]
     preferred = next((s for s in prefer_order if s in all_statuses), "Todos")
     selected_status = st.selectbox("Filtrar por Estado", all_statuses, index=all_statuses.index(preferred))
 
-    my_tasks_filtered = (
-        my_tasks
-        if selected_status=="Todos"
-        else my_tasks[my_tasks["status"] == selected_status]
-    )
+    my_tasks_filtered = pd.DataFrame(query_records(
+        TASKS_FILE, ss.tasks,
+        isin={"assigned_to": my_queues},
+        eq=({} if selected_status == "Todos" else {"status": selected_status})
+    ))
 
     if not my_tasks_filtered.empty:
         st.dataframe(
@@ -2031,10 +4620,9 @@ def page_agent_tasks():
         st.write("No hay tareas pendientes en el equipo.")
         return
 
-    df_tasks = pd.DataFrame(ss.tasks)
-    team_tasks = df_tasks[df_tasks["assigned_to"].isin(["Coordinador RR.HH.", "Admin RR.HH.", "Agente de Análisis"])]
+    team_queues = ["Coordinador RR.HH.", "Admin RR.HH.", "Agente de Análisis"]
 
-    all_statuses = ["Todos"] + sorted(team_tasks["status"].unique())
+    all_statuses = ["Todos"] + sorted(distinct_values(TASKS_FILE, ss.tasks, "status", isin={"assigned_to": team_queues}))
     prefer_order = ["Pendiente", "En Proceso", "En Espera"]
     preferred = next((s for s in prefer_order if s in all_statuses), "Todos")
     selected_status = st.selectbox(
@@ -2044,11 +4632,11 @@ def page_agent_tasks():
         key="agent_task_filter"
     )
 
-    team_tasks_filtered = (
-        team_tasks
-        if selected_status=="Todos"
-        else team_tasks[team_tasks["status"] == selected_status]
-    )
+    team_tasks_filtered = pd.DataFrame(query_records(
+        TASKS_FILE, ss.tasks,
+        isin={"assigned_to": team_queues},
+        eq=({} if selected_status == "Todos" else {"status": selected_status})
+    ))
 
     if not team_tasks_filtered.empty:
         st.dataframe(
@@ -2125,7 +4713,7 @@ def page_agents():
                 if not rn:
                     st.error("El campo Rol* es obligatorio.")
                 else:
-                    ss.agents.append({
+                    ss.agents = ss.agents + [{
                         "rol": rn,
                         "objetivo": objetivo,
                         "backstory": backstory,
@@ -2135,7 +4723,7 @@ def page_agents():
                         "image": img_src,
                         "perms": perms,
                         "ts": datetime.utcnow().isoformat()
-                    })
+                    }]
                     save_agents(ss.agents)
                     roles_new = sorted(list({*ss.roles, rn}))
                     ss.roles = roles_new
@@ -2177,13 +4765,13 @@ def page_agents():
                     if st.button("🧬", key=f"ag_c_{idx}", help="Clonar"):
                         clone = dict(ag)
                         clone["rol"] = f"{ag.get('rol','Agente')} (copia)"
-                        ss.agents.append(clone)
+                        ss.agents = ss.agents + [clone]
                         save_agents(ss.agents)
                         st.success("Agente clonado.")
                         st.rerun()
                 with c4:
                     if st.button("🗑", key=f"ag_d_{idx}", help="Eliminar"):
-                        ss.agents.pop(idx)
+                        ss.agents = ss.agents[:idx] + ss.agents[idx+1:]
                         save_agents(ss.agents)
                         st.success("Agente eliminado.")
                         st.rerun()
@@ -2241,14 +4829,15 @@ def page_agents():
                 default=ag.get("perms",["Supervisor","Administrador"])
             )
             if st.form_submit_button("Guardar cambios"):
-                ag.update({
+                ag = {**ag,
                     "objetivo":objetivo,
                     "backstory":backstory,
                     "guardrails":guardrails,
                     "llm_model":ag.get('llm_model', LLM_IN_USE),
                     "image":img_src,
                     "perms":perms
-                })
+                }
+                ss.agents = [ag if k == ss.agent_edit_idx else a for k, a in enumerate(ss.agents)]
                 save_agents(ss.agents)
                 st.success("Agente actualizado.")
                 st.rerun()
@@ -2286,10 +4875,13 @@ def page_calls_upload():
                 return
 
             new_items = []
+            payload = []
             for f in files:
                 raw = f.read(); f.seek(0)
+                payload.append((raw, f.name))
+            texts = extract_texts_parallel(payload, _extract_progress_bar("Extrayendo texto"))
+            for f, (raw, _), text in zip(files, payload, texts):
                 suffix = Path(f.name).suffix.lower()
-                text = extract_text_from_file(f)  # ya existente en tu app
                 item = {
                     "id": str(uuid.uuid4()),
                     "title": (candidate or Path(f.name).stem),
@@ -2300,7 +4892,8 @@ def page_calls_upload():
                     "file_name": f.name,
                     "file_type": suffix.replace(".", ""),
                     "text": text or "",
-                    "bytes_b64": base64.b64encode(raw).decode("utf-8"),
+                    "blob_sha256": put_blob(raw),
+                    "file_size": len(raw),
                     "notes": notes or "",
                     "created_at": datetime.now().isoformat(),
                     "source": "Manual"
@@ -2308,7 +4901,7 @@ def page_calls_upload():
                 new_items.append(item)
 
             ss.call_results = (ss.call_results or []) + new_items
-            save_call_results(ss.call_results)
+            save_call_results_batch(new_items)
             st.success(f"Se guardaron {len(new_items)} transcripción(es).")
             st.rerun()
 
@@ -2346,10 +4939,13 @@ def page_calls_upload():
                 return
 
             new_items = []
+            payload = []
             for f in files:
                 raw = f.read(); f.seek(0)
+                payload.append((raw, f.name))
+            texts = extract_texts_parallel(payload, _extract_progress_bar("Extrayendo texto"))
+            for f, (raw, _), text in zip(files, payload, texts):
                 suffix = Path(f.name).suffix.lower()
-                text = extract_text_from_file(f)  # ya existente en tu app
                 item = {
                     "id": str(uuid.uuid4()),
                     "title": (candidate or Path(f.name).stem),
@@ -2360,7 +4956,8 @@ def page_calls_upload():
                     "file_name": f.name,
                     "file_type": suffix.replace(".", ""),
                     "text": text or "",
-                    "bytes_b64": base64.b64encode(raw).decode("utf-8"),
+                    "blob_sha256": put_blob(raw),
+                    "file_size": len(raw),
                     "notes": notes or "",
                     "created_at": datetime.now().isoformat(),
                     "source": "Manual"
@@ -2368,7 +4965,7 @@ def page_calls_upload():
                 new_items.append(item)
 
             ss.call_results = (ss.call_results or []) + new_items
-            save_call_results(ss.call_results)
+            save_call_results_batch(new_items)
             st.success(f"Se guardaron {len(new_items)} transcripción(es).")
             st.rerun()
 
@@ -2383,6 +4980,46 @@ def _on_tx_action_change(tid: str, act_key: str):
     st.session_state[act_key] = "Selecciona…"
     # st.rerun()  # <- quitar esta línea
 
+# Estado del listado (filtro/orden/página) reflejado en la URL: recargar o compartir el enlace conserva la vista
+TX_ORDERS = ["Más recientes", "Más antiguos", "Relevancia"]
+TX_PAGE_SIZES = [10, 25, 50, 100]
+TX_QUERY_PARAMS = {"tx_role": "Todos", "tx_q": "", "tx_order": TX_ORDERS[0], "tx_size": 25, "tx_page": 1}
+
+def _tx_state_from_url(roles: list):
+    """Inicializa los widgets del listado desde los query params (al entrar o volver a la página)."""
+    qp = st.query_params
+    for k, default in TX_QUERY_PARAMS.items():
+        if k in ss:
+            continue
+        raw = qp.get(k)
+        if raw is None:
+            ss[k] = default
+            continue
+        try:
+            ss[k] = int(raw) if isinstance(default, int) else raw
+        except ValueError:
+            ss[k] = default
+    if ss.tx_role not in roles:
+        ss.tx_role = "Todos"
+    if ss.tx_order not in TX_ORDERS:
+        ss.tx_order = TX_ORDERS[0]
+    if ss.tx_size not in TX_PAGE_SIZES:
+        ss.tx_size = TX_QUERY_PARAMS["tx_size"]
+
+def _tx_state_to_url():
+    """Escribe en la URL solo lo que difiere del valor por defecto."""
+    qp = st.query_params
+    for k, default in TX_QUERY_PARAMS.items():
+        v = ss.get(k, default)
+        if v == default or v == "":
+            if k in qp:
+                del qp[k]
+        elif qp.get(k) != str(v):
+            qp[k] = str(v)
+
+def _tx_page_step(delta: int, pages: int):
+    ss.tx_page = min(max(1, int(ss.get("tx_page", 1)) + delta), pages)
+
 # ===================== TRANSCRIPCIONES — VER =====================
 def page_calls_view():
     st.header("Resultados de llamadas")
@@ -2392,28 +5029,64 @@ def page_calls_view():
         return
 
     # Filtros
-    roles = ["Todos"] + sorted(list({r.get("role","—") for r in ss.call_results}))
-    col_f1, col_f2, col_f3 = st.columns([1, 1, 1.2])
+    roles = ["Todos"] + sorted(distinct_values(TRANSCRIPTS_FILE, ss.call_results, "role", default="—"))
+    _tx_state_from_url(roles)
+    col_f1, col_f2, col_f3, col_f4 = st.columns([1, 1, 1.2, 0.6])
     with col_f1:
-        sel_role = st.selectbox("Filtrar por Puesto", roles, index=0)
+        sel_role = st.selectbox("Filtrar por Puesto", roles, key="tx_role")
     with col_f2:
-        q = st.text_input("Buscar (candidato, título o texto)…")
+        q = st.text_input("Buscar (candidato, título o texto)…", key="tx_q")
     with col_f3:
-        order = st.selectbox("Orden", ["Más recientes", "Más antiguos"], index=0)
-
-    items = ss.call_results.copy()
-    if sel_role != "Todos":
-        items = [i for i in items if i.get("role") == sel_role]
-    if q:
-        ql = q.lower()
-        items = [
-            i for i in items
-            if ql in (i.get("title","").lower())
-            or ql in (i.get("candidate","").lower())
-            or ql in (i.get("text","").lower())
-        ]
-
-    items.sort(key=lambda x: x.get("created_at",""), reverse=(order=="Más recientes"))
+        order = st.selectbox("Orden", TX_ORDERS, key="tx_order")
+    with col_f4:
+        page_size = st.selectbox("Por página", TX_PAGE_SIZES, key="tx_size")
+
+    # Cambiar filtro, orden o tamaño vuelve a la primera página
+    sig = (sel_role, q, order, page_size)
+    if ss.get("_tx_filter_sig") not in (None, sig):
+        ss.tx_page = 1
+    ss._tx_filter_sig = sig
+
+    # Búsqueda por índice invertido (se pone al día si la colección cambió fuera de los helpers)
+    index = transcript_index()
+    if index.synced_version != ss.get("_call_results_version"):
+        with st.spinner("Actualizando índice de búsqueda…"):
+            index.sync(ss.call_results, ss.get("_call_results_version"))
+
+    # Solo se materializa la página visible: el orden y el corte se resuelven en
+    # la capa de datos (SQL o vista ordenada cacheada) y el resto viaja como ids
+    role_eq = {} if sel_role == "Todos" else {"role": sel_role}
+    desc = order != "Más antiguos"
+    ranked = index.search(q) if _norm_txt(q) else None
+    if ranked is None:
+        ids = None
+        total = count_records(TRANSCRIPTS_FILE, ss.call_results, eq=role_eq)
+    elif order == "Relevancia":
+        if role_eq:
+            in_role = set(query_ids(TRANSCRIPTS_FILE, ss.call_results, eq=role_eq))
+            ranked = [rid for rid in ranked if rid in in_role]
+        ids = ranked
+        total = len(ids)
+    else:
+        hits = set(ranked)
+        ids = [rid for rid in query_ids(TRANSCRIPTS_FILE, ss.call_results, eq=role_eq, order_by="created_at", desc=desc) if rid in hits]
+        total = len(ids)
+
+    pages = max(1, -(-total // page_size))
+    ss.tx_page = min(max(1, int(ss.get("tx_page", 1))), pages)
+    offset = (ss.tx_page - 1) * page_size
+    if ids is None:
+        items = query_records(
+            TRANSCRIPTS_FILE, ss.call_results,
+            eq=role_eq, order_by="created_at", desc=desc,
+            limit=page_size, offset=offset
+        )
+    else:
+        page_ids = ids[offset:offset + page_size]
+        by_id = {r["id"]: r for r in query_records(TRANSCRIPTS_FILE, ss.call_results, isin={"id": page_ids})}
+        items = [by_id[rid] for rid in page_ids if rid in by_id]
+    _tx_state_to_url()
+    st.caption(f"{total} transcripción(es)" + (f" · página {ss.tx_page} de {pages}" if pages > 1 else ""))
 
     # Cabecera
     col_w = [2.0, 1.2, 1.2, 1.0, 1.2]
@@ -2457,7 +5130,7 @@ def page_calls_view():
             with b1:
                 if st.button("Sí, eliminar", key=f"tx_del_yes_{tid}", type="primary", use_container_width=True):
                     ss.call_results = [x for x in ss.call_results if x["id"] != tid]
-                    save_call_results(ss.call_results)
+                    delete_call_result(tid)
                     ss.confirm_delete_transcript_id = None
                     st.warning("Transcripción eliminada.")
                     st.rerun()
@@ -2468,6 +5141,18 @@ def page_calls_view():
 
         st.markdown("<hr style='border:1px solid #E3EDF6; opacity:.3;'/>", unsafe_allow_html=True)
 
+    # Paginación
+    if pages > 1:
+        p_prev, p_num, p_next, _ = st.columns([1, 1, 1, 4])
+        with p_prev:
+            st.button("← Anterior", key="tx_prev", disabled=ss.tx_page <= 1,
+                      on_click=_tx_page_step, args=(-1, pages), use_container_width=True)
+        with p_num:
+            st.number_input("Página", min_value=1, max_value=pages, step=1, key="tx_page", label_visibility="collapsed")
+        with p_next:
+            st.button("Siguiente →", key="tx_next", disabled=ss.tx_page >= pages,
+                      on_click=_tx_page_step, args=(1, pages), use_container_width=True)
+
     # Panel de detalle (inline)
     sel_id = ss.get("selected_transcript_id")
     if sel_id:
@@ -2482,25 +5167,24 @@ def page_calls_view():
             st.caption(f"Archivo: `{it.get('file_name','—')}`")
             # Visor (respetando tu look & feel)
             ext = (it.get("file_type","") or "").lower()
-            try:
-                raw = base64.b64decode(it.get("bytes_b64",""))
-            except Exception:
-                raw = b""
+            blob_sha = it.get("blob_sha256", "")
 
-            if ext == "pdf" and raw:
-                with st.expander("Ver PDF", expanded=True):
-                    render_pdf_viewer(raw, height=600, max_css_width=880)
-            else:
+            if ext != "pdf" or not blob_sha:
                 with st.expander("Ver texto extraído", expanded=True):
                     st.text_area("Contenido", value=(it.get("text") or "—"), height=240, disabled=True)
 
-            if raw:
-                st.download_button(
-                    "Descargar archivo",
-                    data=raw,
-                    file_name=it.get("file_name","transcripcion"),
-                    type="secondary"
-                )
+            # El binario se lee del store de blobs solo si se abre el visor
+            if blob_sha and st.toggle("Ver PDF" if ext == "pdf" else "Ver archivo original", key=f"tx_open_{sel_id}"):
+                raw = read_blob(blob_sha)
+                if ext == "pdf" and raw:
+                    render_pdf_viewer(raw, height=600, max_css_width=880)
+                if raw:
+                    st.download_button(
+                        "Descargar archivo",
+                        data=bytes(raw),
+                        file_name=it.get("file_name","transcripcion"),
+                        type="secondary"
+                    )
 
             # === EVALUACIÓN SEGÚN JD (debajo del visor) ===
             st.markdown("#### Evaluación — Fit con JD")
@@ -2515,27 +5199,22 @@ def page_calls_view():
                 pos = next((p for p in ss.positions if p.get("Puesto") == role_name), None)
                 jd_text_eval = (pos or {}).get("JD", "")
 
-            # 2) Texto de la transcripción (si no vino en .text, lo extraemos del PDF)
+            # 2) Texto de la transcripción (si no vino en .text, se extrae del PDF una vez y se guarda)
             tx_text = it.get("text") or ""
-            if not tx_text and (it.get("file_type","").lower() == "pdf") and raw:
-                try:
-                    reader = PdfReader(io.BytesIO(raw))
-                    for p in reader.pages:
-                        tx_text += (p.extract_text() or "") + "\n"
-                except Exception:
-                    pass
+            if not tx_text and (it.get("file_type","").lower() == "pdf") and blob_sha:
+                tx_text = extract_text_from_bytes(read_blob(blob_sha), it.get("file_name") or "transcripcion.pdf")
+                if tx_text.strip():
+                    save_call_result({**it, "text": tx_text})
 
             if jd_text_eval.strip() and tx_text.strip():
+                jd_profile = get_jd_profile(jd_text_eval)
                 preset = ROLE_PRESETS.get(role_name, {})
                 must_list = [s for s in (preset.get("must", []) or []) if s.strip()]
                 nice_list = [s for s in (preset.get("nice", []) or []) if s.strip()]
 
-                score, detail = score_fit_by_skills(
-                    jd_text_eval,
-                    must_list,
-                    nice_list,
-                    tx_text
-                )
+                # Resultado persistido por (transcripción, JD, texto, versión): abrir el detalle es una lectura
+                ev = load_transcript_eval(sel_id, tx_text, jd_profile, must_list, nice_list)
+                score = ev["score"]
 
                 PASS_THRESHOLD = 70
                 st.metric("Fit vs JD", f"{score}%")
@@ -2544,37 +5223,15 @@ def page_calls_view():
                 # === CHECKLIST DETALLADO SEGÚN JD ===
                 st.markdown("**Checklist (según JD)**")
 
-                # 1) Lista de criterios (obligatorios/deseables)
-                items_must = [s for s in (must_list or []) if s.strip()]
-                items_nice = [s for s in (nice_list or []) if s.strip()]
-
-                # Fallback: si no hay presets, parsear bullets del JD como obligatorios
-                if not items_must and not items_nice:
-                    items_must = extract_jd_items(jd_text_eval)
-
-                rows = []
-                ok_must = ok_nice = 0
-
-                for tipo, lista in (("Obligatorio", items_must), ("Deseable", items_nice)):
-                    for it in lista:
-                        ok, hits = soft_match(it, tx_text)
-                        if tipo == "Obligatorio":
-                            ok_must += int(ok)
-                        else:
-                            ok_nice += int(ok)
-                        rows.append({
-                            "Tipo": tipo,
-                            "Criterio": it,
-                            "Cumple": "✅" if ok else "❌",
-                            "Evidencia (palabras clave)": ", ".join(hits) if hits else "—"
-                        })
+                rows = ev["rows"]
+                ok_must = ev["ok_must"]
 
                 if rows:
                     df_chk = pd.DataFrame(rows)
                     st.dataframe(df_chk, use_container_width=True, hide_index=True)
 
                 # 2) Resumen / Justificación (por qué pasa o no)
-                tot_must, tot_nice = len(items_must), len(items_nice)
+                tot_must = ev["tot_must"]
                 miss_must = [r["Criterio"] for r in rows if r["Tipo"]=="Obligatorio" and r["Cumple"]=="❌"][:3]
                 hit_must  = [r["Criterio"] for r in rows if r["Tipo"]=="Obligatorio" and r["Cumple"]=="✅"][:3]
                 hit_nice  = [r["Criterio"] for r in rows if r["Tipo"]=="Deseable" and r["Cumple"]=="✅"][:2]
@@ -2666,6 +5323,10 @@ def render_flow_form():
         pos_data = next((p for p in ss.positions if p.get("Puesto") == selected_role_from_key), None)
         default_jd_text = pos_data.get("JD", "JD no encontrado.") if pos_data else "JD no encontrado."
 
+    default_cascade = bool(editing_wf.get("cascade_enabled", False)) if editing_wf else False
+    default_top_k = int(editing_wf.get("cascade_top_k", PREFILTER_TOP_K)) if editing_wf else PREFILTER_TOP_K
+    default_min_score = int(editing_wf.get("cascade_min_score", PREFILTER_MIN_SCORE)) if editing_wf else PREFILTER_MIN_SCORE
+
     default_agent_idx = editing_wf.get("agent_idx", 0) if editing_wf else 0
     if not (0 <= default_agent_idx < len(ss.agents)):
         default_agent_idx = 0
@@ -2741,6 +5402,25 @@ def render_flow_form():
                     disabled=True
                 )
 
+        st.markdown("---")
+        st.markdown("<div class='badge'>Cascada · Prefiltro por reglas antes del LLM</div>", unsafe_allow_html=True)
+        cascade_enabled = st.checkbox(
+            "Prefiltrar CVs con el scoring por reglas y enviar al LLM solo los mejores",
+            value=default_cascade,
+            disabled=is_disabled
+        )
+        col_k, col_min = st.columns(2)
+        cascade_top_k = col_k.number_input(
+            "Top-K al LLM (0 = sin límite)",
+            min_value=0, max_value=1000, value=default_top_k, step=5,
+            disabled=is_disabled
+        )
+        cascade_min_score = col_min.number_input(
+            "Score mínimo por reglas",
+            min_value=0, max_value=100, value=default_min_score, step=5,
+            disabled=is_disabled
+        )
+
         st.markdown("---")
         st.markdown("<div class='badge'>Staff in charge · Agente asignado</div>", unsafe_allow_html=True)
         if ss.agents:
@@ -2808,16 +5488,19 @@ def render_flow_form():
                         "expected_output": expected,
                         "jd_text": jd_final[:200000],
                         "agent_idx": agent_idx,
+                        "cascade_enabled": bool(cascade_enabled),
+                        "cascade_top_k": int(cascade_top_k),
+                        "cascade_min_score": int(cascade_min_score),
                         "last_updated_by": ss.auth.get("name", "Admin")
                     }
 
                     if update_flow and is_edit_mode:
-                        editing_wf.update(wf_data)
+                        editing_wf = {**editing_wf, **wf_data}
                         editing_wf["status"] = "Borrador"
                         editing_wf["approved_by"] = ""
                         editing_wf["approved_at"] = ""
                         editing_wf["schedule_at"] = ""
-                        save_workflows(ss.workflows)
+                        save_workflow(editing_wf)
                         st.success("Flujo actualizado.")
                         ss.editing_flow_id = None
                         ss.show_flow_form = False
@@ -2849,8 +5532,7 @@ def render_flow_form():
                         if save_draft:
                             st.success("Borrador guardado.")
 
-                        ss.workflows.insert(0, wf)
-                        save_workflows(ss.workflows)
+                        save_workflow(wf)
                         ss.show_flow_form = False
                         st.rerun()
 
@@ -2931,7 +5613,7 @@ def page_flows():
                             w for w in ss.workflows
                             if w.get("id") != wf_id
                         ]
-                        save_workflows(ss.workflows)
+                        delete_workflow(wf_id)
                         ss.confirm_delete_flow_id = None
                         st.warning(f"Flujo '{wf.get('name')}' eliminado.")
                         st.rerun()
@@ -2947,15 +5629,29 @@ def page_flows():
             st.markdown("<hr style='border:1px solid #E3EDF6; opacity:.35;'/>", unsafe_allow_html=True)
 
 # ===================== ANALYTICS =====================
+def _style_fig(fig, **layout):
+    fig.update_layout(
+        plot_bgcolor="#FFFFFF",
+        paper_bgcolor="rgba(0,0,0,0)",
+        font=dict(color=TITLE_DARK),
+        **layout
+    )
+    return fig
+
 def page_analytics():
     st.header("Analytics y KPIs Estratégicos")
+    # Agregados incrementales sobre el log de eventos: costo constante sin importar la historia
+    summ = analytics().summary()
+    fmt_days = lambda v: "—" if v is None else f"{v} días"
 
     st.subheader("Visión General del Proceso")
     c1, c2, c3, c4 = st.columns(4)
-    c1.metric("Costo por Hire (Promedio)", "S/ 4,250", "-8% vs Q2")
-    c2.metric("Time to Hire (P50)", "28 días", "+2 días")
-    c3.metric("Conversión (Oferta > Contratado)", "81%", "+3%")
-    c4.metric("Exactitud de IA (Fit)", "92%", "Modelo v2.1")
+    in_process = sum(n for s, n in summ["current"].items() if s not in ("Contratado", "Descartado"))
+    c1.metric("Candidatos en proceso", f"{in_process}", f"{summ['current'].get('Contratado', 0)} contratados")
+    p50_hire, p90_hire = summ["milestones"]["hire"]
+    c2.metric("Time to Hire (P50)", fmt_days(p50_hire), f"P90: {fmt_days(p90_hire)}", delta_color="off")
+    c3.metric("Conversión (Oferta > Contratado)", "—" if summ["offer_to_hire"] is None else f"{summ['offer_to_hire']:.0%}")
+    c4.metric("Fit promedio (IA)", "—" if summ["avg_fit"] is None else f"{summ['avg_fit']}%")
 
     st.markdown("---")
 
@@ -2963,54 +5659,52 @@ def page_analytics():
 
     with col_funnel:
         st.subheader("Embudo de Conversión")
-        df_funnel = pd.DataFrame({
-            "Fase": ["Recibido", "Screening RRHH", "Entrevista Gerencia", "Oferta", "Contratado"],
-            "Candidatos": [1200, 350, 80, 25, 20]
-        })
+        df_funnel = pd.DataFrame(summ["funnel"], columns=["Fase", "Candidatos"])
         df_funnel = df_funnel[df_funnel["Candidatos"] > 0]
-        fig_funnel = px.funnel(
-            df_funnel,
-            x='Candidatos',
-            y='Fase',
-            title="Conversión Total por Fase"
-        )
-        fig_funnel.update_traces(marker=dict(color=PRIMARY))
-        fig_funnel.update_layout(
-            plot_bgcolor="#FFFFFF",
-            paper_bgcolor="rgba(0,0,0,0)",
-            font=dict(color=TITLE_DARK),
-            yaxis_title=None
-        )
-        st.plotly_chart(fig_funnel, use_container_width=True)
+        if df_funnel.empty:
+            st.info("Aún no hay movimientos de candidatos registrados.")
+        else:
+            fig_funnel = px.funnel(
+                df_funnel,
+                x='Candidatos',
+                y='Fase',
+                title="Candidatos que alcanzaron cada fase"
+            )
+            fig_funnel.update_traces(marker=dict(color=PRIMARY))
+            st.plotly_chart(_style_fig(fig_funnel, yaxis_title=None), use_container_width=True)
 
     with col_time:
         st.subheader("Tiempos del Proceso (P50 / P90)")
-        df_times = pd.DataFrame({
-            "Métrica": ["Time to Interview", "Time to Offer", "Time to Hire"],
-            "P50 (Días)": [12, 22, 28],
-            "P90 (Días)": [20, 31, 42]
-        })
-        df_times_melted = df_times.melt(
-            id_vars="Métrica",
-            var_name="Percentil",
-            value_name="Días"
-        )
-        fig_time = px.bar(
-            df_times_melted,
-            x="Métrica",
-            y="Días",
-            color="Percentil",
-            barmode="group",
-            title="Tiempos Clave del Ciclo (P50 vs P90)",
-            color_discrete_sequence=PLOTLY_GREEN_SEQUENCE
-        )
-        fig_time.update_layout(
-            plot_bgcolor="#FFFFFF",
-            paper_bgcolor="rgba(0,0,0,0)",
-            font=dict(color=TITLE_DARK),
-            yaxis_title="Días"
-        )
-        st.plotly_chart(fig_time, use_container_width=True)
+        labels = {"interview": "Time to Interview", "offer": "Time to Offer", "hire": "Time to Hire"}
+        df_times = pd.DataFrame([
+            {"Métrica": labels[k], "P50 (Días)": p50, "P90 (Días)": p90}
+            for k, (p50, p90) in summ["milestones"].items() if p50 is not None
+        ])
+        if df_times.empty:
+            st.info("Aún no hay candidatos que hayan llegado a entrevista, oferta o contratación.")
+        else:
+            df_times_melted = df_times.melt(
+                id_vars="Métrica",
+                var_name="Percentil",
+                value_name="Días"
+            )
+            fig_time = px.bar(
+                df_times_melted,
+                x="Métrica",
+                y="Días",
+                color="Percentil",
+                barmode="group",
+                title="Tiempos Clave del Ciclo (P50 vs P90)",
+                color_discrete_sequence=PLOTLY_GREEN_SEQUENCE
+            )
+            st.plotly_chart(_style_fig(fig_time, yaxis_title="Días"), use_container_width=True)
+
+    df_stage = pd.DataFrame([
+        {"Fase": s, "Candidatos hoy": summ["current"].get(s, 0), "P50 en fase (días)": p50, "P90 en fase (días)": p90}
+        for s, (p50, p90) in summ["in_stage"].items()
+    ])
+    with st.expander("Tiempo en cada fase"):
+        st.dataframe(df_stage, use_container_width=True, hide_index=True)
 
     st.markdown("---")
 
@@ -3018,47 +5712,42 @@ def page_analytics():
 
     with col_prod:
         st.subheader("Productividad del Reclutador")
-        df_prod = pd.DataFrame({
-            "Reclutador": ["Admin", "Sup", "Colab", "Headhunter"],
-            "Contratados (Últ. 90d)": [8, 5, 12, 9],
-            "CVs Gestionados": [450, 300, 700, 620]
-        })
-        fig_prod = px.bar(
-            df_prod,
-            x="Reclutador",
-            y="Contratados (Últ. 90d)",
-            title="Contrataciones por Reclutador",
-            color_discrete_sequence=PLOTLY_GREEN_SEQUENCE
-        )
-        fig_prod.update_layout(
-            plot_bgcolor="#FFFFFF",
-            paper_bgcolor="rgba(0,0,0,0)",
-            font=dict(color=TITLE_DARK)
-        )
-        st.plotly_chart(fig_prod, use_container_width=True)
+        df_prod = pd.DataFrame([
+            {"Reclutador": a, "Contratados": v.get("hires", 0), "Movimientos": v.get("moves", 0), "Tareas completadas": v.get("tasks_done", 0)}
+            for a, v in summ["actors"].items()
+        ])
+        if df_prod.empty:
+            st.info("Sin actividad registrada todavía.")
+        else:
+            fig_prod = px.bar(
+                df_prod,
+                x="Reclutador",
+                y=["Contratados", "Movimientos", "Tareas completadas"],
+                barmode="group",
+                title="Actividad por Reclutador",
+                color_discrete_sequence=PLOTLY_GREEN_SEQUENCE
+            )
+            st.plotly_chart(_style_fig(fig_prod, yaxis_title=None), use_container_width=True)
 
     with col_cost_ia:
-        st.subheader("Exactitud de IA")
-        df_ia = pd.DataFrame({
-            "Puesto": ["Business Analytics", "Diseñador/a UX", "Ingeniero/a", "Enfermera/o"],
-            "Candidatos": [120, 85, 200, 310],
-            "Fit Promedio IA": [82, 75, 88, 79]
-        })
-        fig_ia = px.scatter(
-            df_ia,
-            x="Candidatos",
-            y="Fit Promedio IA",
-            size="Candidatos",
-            color="Puesto",
-            title="Fit Promedio (IA) por Volumen de Puesto",
-            color_discrete_sequence=PLOTLY_GREEN_SEQUENCE
-        )
-        fig_ia.update_layout(
-            plot_bgcolor="#FFFFFF",
-            paper_bgcolor="rgba(0,0,0,0)",
-            font=dict(color=TITLE_DARK)
-        )
-        st.plotly_chart(fig_ia, use_container_width=True)
+        st.subheader("Fit Promedio (IA) por Puesto")
+        df_ia = pd.DataFrame([
+            {"Puesto": r, "Evaluaciones": n, "Fit Promedio IA": avg}
+            for r, (n, avg) in summ["fit_by_role"].items()
+        ])
+        if df_ia.empty:
+            st.info("Aún no hay evaluaciones registradas.")
+        else:
+            fig_ia = px.scatter(
+                df_ia,
+                x="Evaluaciones",
+                y="Fit Promedio IA",
+                size="Evaluaciones",
+                color="Puesto",
+                title="Fit Promedio (IA) por Volumen de Puesto",
+                color_discrete_sequence=PLOTLY_GREEN_SEQUENCE
+            )
+            st.plotly_chart(_style_fig(fig_ia), use_container_width=True)
 
 # ===================== TODAS LAS TAREAS =====================
 def page_create_task():
@@ -3115,7 +5804,7 @@ def page_create_task():
     tasks_list = ss.tasks
 
     # Filtros
-    all_statuses_set = set(t.get('status', 'Pendiente') for t in tasks_list)
+    all_statuses_set = set(distinct_values(TASKS_FILE, tasks_list, "status", default="Pendiente"))
     possible_statuses = ["Pendiente", "En Proceso", "Completada", "En Espera"]
     for status in possible_statuses:
         all_statuses_set.add(status)
@@ -3126,7 +5815,7 @@ def page_create_task():
     preferred_index = all_statuses.index(preferred) if preferred in all_statuses else 0
 
     all_assignees = ["Todas las colas"] + sorted(
-        list(set(t.get('assigned_to', 'N/A') for t in tasks_list))
+        distinct_values(TASKS_FILE, tasks_list, "assigned_to", default="N/A")
     )
 
     f1, f2, f3 = st.columns([1, 1, 1.5])
@@ -3149,22 +5838,16 @@ def page_create_task():
             placeholder="Buscar..."
         )
 
-    tasks_filtered = tasks_list
+    task_eq = {}
     if selected_status != "Todos los estados":
-        tasks_filtered = [
-            t for t in tasks_filtered
-            if t.get("status") == selected_status
-        ]
+        task_eq["status"] = selected_status
     if selected_queue != "Todas las colas":
-        tasks_filtered = [
-            t for t in tasks_filtered
-            if t.get("assigned_to") == selected_queue
-        ]
-    if search_query:
-        tasks_filtered = [
-            t for t in tasks_filtered
-            if search_query.lower() in t.get("titulo", "").lower()
-        ]
+        task_eq["assigned_to"] = selected_queue
+    tasks_filtered = query_records(
+        TASKS_FILE, tasks_list,
+        eq=task_eq,
+        like=({"titulo": search_query} if search_query else None)
+    )
 
     tasks_to_show = tasks_filtered
 
@@ -3200,9 +5883,11 @@ def page_create_task():
         elif action == "Tomar tarea":
             ss.expanded_task_id = None
             current_user = (ss.auth["name"] if ss.get("auth") else "Admin")
+            task_to_update = dict(task_to_update)
             task_to_update["assigned_to"] = current_user
             task_to_update["status"] = "En Proceso"
-            save_tasks(ss.tasks)
+            save_task(task_to_update)
+            log_task_status(task_to_update)
             st.toast("Tarea tomada.")
             st.rerun()
         elif action == "Eliminar":
@@ -3272,7 +5957,8 @@ def page_create_task():
                             t for t in ss.tasks
                             if t.get("id") != t_id
                         ]
-                        save_tasks(ss.tasks)
+                        delete_task(t_id)
+                        log_events([{"type": "task", "task": t_id, "to": None}])
                         ss.confirm_delete_id = None
                         st.warning("Tarea eliminada permanentemente.")
                         st.rerun()
@@ -3348,6 +6034,7 @@ def page_create_task():
                             None
                         )
                         if task_to_update:
+                            task_to_update = dict(task_to_update)
                             task_to_update["assigned_to"] = nuevo_assignee
                             task_to_update["priority"] = nueva_prio
                             if assign_type == "En Espera":
@@ -3355,7 +6042,8 @@ def page_create_task():
                             else:
                                 if task_to_update["status"] == "En Espera":
                                     task_to_update["status"] = "Pendiente"
-                            save_tasks(ss.tasks)
+                            save_task(task_to_update)
+                            log_task_status(task_to_update)
                             ss.show_assign_for = None
                             st.success("Tarea reasignada.")
                             st.rerun()
@@ -3416,16 +6104,15 @@ def page_create_task():
                     f"**Notas IA:** *{analysis_data.get('Additional_Notes', 'N/A')}*"
                 )
 
-                if "pdf_bytes_b64" in context:
+                if context.get("pdf_sha256"):
                     try:
-                        pdf_bytes = base64.b64decode(context["pdf_bytes_b64"])
-                        display_name = analysis_data.get("file_name", "cv.pdf")
-
-                        # --- INICIO DE LA CORRECCIÓN ---
-                        with st.expander("Visualizar CV (PDF)", expanded=False):
-                            render_pdf_viewer(pdf_bytes, height=600, max_css_width=880)
-
-                        # --- FIN DE LA CORRECCIÓN ---
+                        # El PDF se lee del store de blobs solo al abrir el visor
+                        if st.toggle("Visualizar CV (PDF)", key=f"task_pdf_{task_id_for_dialog}"):
+                            pdf_bytes = read_blob(context["pdf_sha256"])
+                            if pdf_bytes:
+                                render_pdf_viewer(pdf_bytes, height=600, max_css_width=880)
+                            else:
+                                st.warning("El archivo del CV ya no está disponible.")
 
                     except Exception as e:
                         st.error(f"No se pudo decodificar o mostrar el PDF: {e}")
@@ -3511,16 +6198,16 @@ def page_create_task():
                         None
                     )
                     if task_to_update:
+                        task_to_update = dict(task_to_update)
                         task_to_update["status"] = new_status
                         if new_comment:
-                            if "comments" not in task_to_update:
-                                task_to_update["comments"] = []
                             user_name = ss.auth.get('name', 'User') if ss.get('auth') else 'User'
                             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M')
-                            task_to_update["comments"].append(
+                            task_to_update["comments"] = task_to_update.get("comments", []) + [
                                 f"{user_name} ({timestamp}): {new_comment}"
-                            )
-                        save_tasks(ss.tasks)
+                            ]
+                        save_task(task_to_update)
+                        log_task_status(task_to_update)
                         st.toast(
                             f"Tarea '{task_to_update['titulo']}' actualizada a '{new_status}'."
                         )
@@ -0,0 +1,173 @@
+"""
+Extractores de texto (PDF / DOCX / TXT) de SelektIA.
+
+Viven fuera de app.py para que los procesos del pool de extracción los
+importen sin ejecutar la app de Streamlit: aquí solo hay funciones puras
+y el bucle del worker (serve). Cada worker se lanza como
+`python -m extraction <fd>`, con fd el extremo de un socketpair.
+"""
+import io, re, html, zipfile
+
+from PyPDF2 import PdfReader
+
+_W_NS = b"http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+_DOCX_CHUNK = 1 << 20   # bytes leídos del zip por vuelta
+
+def _docx_tokens(prefix: bytes):
+    """
+    Solo los elementos que importan: el texto de <w:t>, las tabulaciones de
+    párrafo (<w:tabs>, se descartan) y p/tbl/tr/tc/tab/br/cr. El resto del
+    marcado (formato de runs, propiedades, etc.) lo salta el regex en C.
+    """
+    w = re.escape(prefix)
+    return re.compile(
+        rb"<" + w + rb"t(?:\s[^>]*)?>([^<]*)</" + w + rb"t>"
+        rb"|<" + w + rb"tabs>.*?</" + w + rb"tabs>"
+        rb"|<(/?)" + w + rb"(p|tbl|tr|tc|tab|br|cr)\b[^>]*?(/?)>",
+        re.S,
+    )
+
+def _docx_part_lines(stream) -> list:
+    """
+    Recorre un part WordprocessingML en streaming: un párrafo por línea y cada
+    fila de tabla como 'celda | celda'. Se lee por bloques que terminan en un
+    cierre de párrafo, así en memoria solo queda el bloque y la fila en curso.
+    Las líneas quedan en bytes (UTF-8 con entidades XML sin resolver).
+    """
+    lines = []
+    paras = []    # párrafos abiertos (hay anidados en cuadros de texto)
+    tables = []   # tablas abiertas: {"row": [...], "cell": [...]}
+    tokens = p_end = None
+    buf = b""
+    while True:
+        chunk = stream.read(_DOCX_CHUNK)
+        buf += chunk
+        if tokens is None:
+            # El prefijo del namespace se resuelve en la raíz
+            m = re.search(rb'xmlns:(\w+)="' + re.escape(_W_NS) + rb'"', buf)
+            if m is None and chunk:
+                continue
+            prefix = m.group(1) + b":" if m else b"w:"
+            tokens, p_end = _docx_tokens(prefix), b"</" + prefix + b"p>"
+        # Se procesa hasta el último cierre de párrafo: ningún token queda cortado
+        cut = len(buf) if not chunk else buf.rfind(p_end)
+        if cut < 0:
+            continue
+        if chunk:
+            cut += len(p_end)
+        for text, close, tag, self_close in tokens.findall(buf, 0, cut):
+            if text:
+                if paras:
+                    paras[-1].append(text)
+            elif not tag:
+                continue
+            elif tag == b"p":
+                if not close:
+                    if not self_close:
+                        paras.append([])
+                elif paras:
+                    line = b"".join(paras.pop()).strip()
+                    if line:
+                        if tables and tables[-1]["cell"] is not None:
+                            tables[-1]["cell"].append(line)
+                        else:
+                            lines.append(line)
+            elif tag == b"tab":
+                if not close and paras:
+                    paras[-1].append(b"\t")
+            elif tag in (b"br", b"cr"):
+                if not close and paras:
+                    paras[-1].append(b"\n")
+            elif tag == b"tbl":
+                if not close:
+                    tables.append({"row": None, "cell": None})
+                elif tables:
+                    tables.pop()
+            elif tag == b"tr" and tables:
+                tbl = tables[-1]
+                if not close:
+                    tbl["row"] = []
+                else:
+                    cells = tbl["row"] or []
+                    if any(cells):
+                        lines.append(b" | ".join(cells))
+                    tbl["row"] = None
+            elif tag == b"tc" and tables:
+                tbl = tables[-1]
+                if not close:
+                    tbl["cell"] = []
+                else:
+                    if tbl["row"] is not None:
+                        tbl["row"].append(b" ".join(tbl["cell"] or []))
+                    tbl["cell"] = None
+        buf = buf[cut:]
+        if not chunk:
+            return lines
+
+def _part_number(name: str) -> int:
+    m = re.search(r"(\d+)\.xml$", name)
+    return int(m.group(1)) if m else 0
+
+def extract_docx_bytes(b) -> str:
+    """Texto de un DOCX: encabezados, cuerpo (párrafos y tablas) y pies de página."""
+    try:
+        with zipfile.ZipFile(io.BytesIO(b)) as z:
+            names = z.namelist()
+            # header2 antes que header10: orden por el número del part, no lexicográfico
+            headers = sorted((n for n in names if re.fullmatch(r"word/header\d*\.xml", n)), key=_part_number)
+            footers = sorted((n for n in names if re.fullmatch(r"word/footer\d*\.xml", n)), key=_part_number)
+            lines = []
+            for part in [*headers, "word/document.xml", *footers]:
+                if part not in names:
+                    continue
+                try:
+                    with z.open(part) as stream:
+                        lines.extend(_docx_part_lines(stream))
+                except Exception as e:
+                    print(f"Error parsing DOCX part {part}: {e}")
+            # Un solo decode y una sola pasada de entidades para todo el documento
+            text = b"\n".join(lines).decode("utf-8", "ignore")
+            return html.unescape(text) if "&" in text else text
+    except Exception:
+        return ""
+
+def extract_text(file_bytes, suffix: str) -> str:
+    """Un solo parseo en memoria (bytes, memoryview o mmap); sin archivos temporales."""
+    if suffix == ".pdf":
+        pdf_reader = PdfReader(io.BytesIO(file_bytes))
+        parts = []
+        for page in pdf_reader.pages:
+            try:
+                page_text = page.extract_text()
+                if page_text:
+                    parts.append(page_text + "\n")
+            except Exception as page_e:
+                print(f"Error extracting text from PDF page: {page_e}")
+        return "".join(parts)
+    elif suffix == ".docx":
+        return extract_docx_bytes(file_bytes)
+    else:
+        return str(file_bytes, "utf-8", errors="ignore")
+
+def run_job(file_bytes, suffix: str) -> tuple:
+    """(True, texto) o (False, error) si el archivo no se pudo leer."""
+    try:
+        return True, extract_text(file_bytes, suffix)
+    except Exception as e:
+        return False, str(e)
+
+def serve(conn):
+    """Bucle del worker: recibe (bytes, sufijo), responde run_job; None termina."""
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        conn.send(run_job(*job))
+
+if __name__ == "__main__":
+    import sys
+    from multiprocessing.connection import Connection
+    serve(Connection(int(sys.argv[1])))
@@ -0,0 +1,150 @@
+"""
+Rate limit, Retry-After y backoff del cliente LLM contra un endpoint Azure
+OpenAI falso (http.server local): _TokenBucket, _llm_retry_delay y llm_invoke.
+"""
+import json, sys, threading, time, uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    script = []     # (status, headers) a responder en orden; vacío = 200
+    requests = []   # time.monotonic() de cada POST recibido
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        _Stub.requests.append(time.monotonic())
+        status, headers = _Stub.script.pop(0) if _Stub.script else (200, {})
+        if status == 200:
+            body = {"id": "x", "object": "chat.completion", "created": 0, "model": "gpt",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": "ok"}}],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}}
+        else:
+            body = {"error": {"code": str(status), "message": "rate limited"}}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+@pytest.fixture(scope="module")
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(scope="module")
+def app(stub, tmp_path_factory):
+    # app.py crea data/ y lee .streamlit/secrets.toml relativos al cwd
+    work = tmp_path_factory.mktemp("app")
+    (work / ".streamlit").mkdir()
+    (work / ".streamlit" / "secrets.toml").write_text(
+        '[llm]\nazure_deployment = "gpt"\nazure_api_version = "2024-06-01"\n'
+        f'azure_openai_api_key = "k"\nazure_openai_endpoint = "{stub}"\n'
+    )
+    mp = pytest.MonkeyPatch()
+    mp.chdir(work)
+    mp.setenv("AZURE_OPENAI_ENDPOINT", stub)
+    mp.setenv("AZURE_OPENAI_API_KEY", "k")
+    mp.syspath_prepend(str(ROOT))
+    import app as module
+    yield module
+    sys.modules.pop("app", None)
+    mp.undo()
+
+@pytest.fixture(autouse=True)
+def fresh(app, monkeypatch):
+    _Stub.script.clear()
+    _Stub.requests.clear()
+    state = app._process_state()
+    state["llm_limiters"].clear()
+    state["llm_stats"].clear()
+    monkeypatch.setattr(app, "LLM_BACKOFF_BASE", 0.02)
+
+def _messages():
+    # Mensaje único por llamada: la cache en disco no debe responder por el endpoint
+    return [{"role": "user", "content": f"hola {uuid.uuid4()}"}]
+
+def _rate_limit_error(app, headers):
+    _Stub.script.append((429, headers))
+    with pytest.raises(app.openai.RateLimitError) as info:
+        app.llm_client().invoke(_messages())
+    return info.value
+
+def test_token_bucket_reserve_adjust_pause(app):
+    bucket = app._TokenBucket(60)  # 1 token/s
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(2) == pytest.approx(2.0, abs=0.05)
+    bucket.adjust(-10)  # el consumo real fue menor: devuelve tokens
+    assert bucket.reserve(1) == 0.0
+    bucket.pause(5)
+    assert bucket.reserve(1) == pytest.approx(6.0, abs=0.05)
+    # Una reserva mayor a la capacidad no espera más de un minuto
+    assert app._TokenBucket(60).reserve(1000) == 0.0
+
+def test_retry_delay_honours_retry_after_ms(app):
+    limiter = app._LLMLimiter(600, 100_000)
+    exc = _rate_limit_error(app, {"retry-after-ms": "250", "Retry-After": "9"})
+    delay = app._llm_retry_delay(exc, 0, limiter)
+    assert 0.25 <= delay <= 0.25 + app.LLM_BACKOFF_BASE / 2
+    # El 429 pausa el limitador del deployment para todas las llamadas
+    assert limiter.reserve(1) >= 0.2
+    stats = app._process_state()["llm_stats"]
+    assert stats["rate_limited"] == 1 and stats["retries"] == 1
+
+def test_retry_delay_honours_retry_after_seconds(app):
+    limiter = app._LLMLimiter(600, 100_000)
+    exc = _rate_limit_error(app, {"Retry-After": "3"})
+    assert 3 <= app._llm_retry_delay(exc, 0, limiter) <= 3 + app.LLM_BACKOFF_BASE / 2
+    exc = _rate_limit_error(app, {"Retry-After": "600"})
+    assert app._llm_retry_delay(exc, 0, limiter) <= app.LLM_BACKOFF_MAX + app.LLM_BACKOFF_BASE / 2
+
+def test_retry_delay_backoff_and_give_up(app):
+    limiter = app._LLMLimiter(600, 100_000)
+    exc = _rate_limit_error(app, {})
+    for attempt in range(app.LLM_MAX_RETRIES):
+        assert 0 <= app._llm_retry_delay(exc, attempt, limiter) <= app.LLM_BACKOFF_BASE * 2 ** attempt
+    assert app._llm_retry_delay(exc, app.LLM_MAX_RETRIES, limiter) is None
+    _Stub.script.append((400, {}))
+    with pytest.raises(app.openai.BadRequestError) as info:
+        app.llm_client().invoke(_messages())
+    assert app._llm_retry_delay(info.value, 0, limiter) is None
+
+def test_llm_invoke_retries_after_429(app):
+    _Stub.script.extend([(429, {"retry-after-ms": "200"}), (429, {"Retry-After": "1"})])
+    assert app.llm_invoke(_messages()) == "ok"
+    first, second, third = _Stub.requests
+    assert second - first >= 0.2
+    assert third - second >= 1.0
+    stats = app._process_state()["llm_stats"]
+    assert stats["calls"] == 3 and stats["rate_limited"] == 2 and stats["retries"] == 2
+
+def test_llm_invoke_gives_up_after_max_retries(app, monkeypatch):
+    monkeypatch.setattr(app, "LLM_MAX_RETRIES", 2)
+    _Stub.script.extend([(429, {"retry-after-ms": "50"})] * 3)
+    with pytest.raises(app.openai.RateLimitError):
+        app.llm_invoke(_messages())
+    assert len(_Stub.requests) == 3
+    assert app._process_state()["llm_stats"]["retries"] == 2
+
+def test_llm_invoke_throttles_to_rpm(app):
+    # 60 rpm: la capacidad del bucket se agota y la siguiente llamada espera su token
+    app._process_state()["llm_limiters"]["gpt"] = limiter = app._LLMLimiter(60, 100_000)
+    limiter.requests.reserve(60)
+    t0 = time.monotonic()
+    assert app.llm_invoke(_messages()) == "ok"
+    assert time.monotonic() - t0 >= 0.9
+    assert app._process_state()["llm_stats"]["throttled_ms"] >= 900